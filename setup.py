@@ -19,6 +19,7 @@ setup(
     packages=find_packages(),
     package_data={},
     include_package_data=True,
+    python_requires='>=3.7',
     install_requires=[
         'numpy',
         'spikeextractors>=0.9.7',
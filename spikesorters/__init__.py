@@ -1,5 +1,23 @@
-from .sorterlist import *
+from .sorterlist import (sorter_dict, get_sorter_class, run_sorter, available_sorters, installed_sorters,
+                         print_sorter_versions, get_default_params, get_params_description, get_sorter_description,
+                         run_hdsort, run_klusta, run_tridesclous, run_mountainsort4, run_ironclust, run_kilosort,
+                         run_kilosort2, run_kilosort2_5, run_kilosort3, run_spykingcircus, run_herdingspikes,
+                         run_waveclus, run_combinato, run_yass)
 from .version import version as __version__
 from .basesorter import BaseSorter
-from .launcher import run_sorters, collect_sorting_outputs, iter_output_folders, iter_sorting_output
+from .binary_cache import set_binary_cache, get_binary_cache
+from .shared_recording import set_shared_recording_folder, SharedRecordingExtractor
+from .sorter_info import get_sorter_info, set_sorter_info_cache_file, clear_sorter_info_cache
+from .matlab_sessions import set_matlab_session_pool, get_matlab_session_pool
+from .compiled_matlab import set_mcr_root, get_mcr_root
+from .cancellation import CancelToken
+from .compact_store import CompactSortingExtractor, compact_sorting_output
+from .resource_estimation import estimate_resources, calibrate_resources, set_resource_calibration_file
+from .launcher import (run_sorters, collect_sorting_outputs, iter_output_folders, iter_sorting_output,
+                       get_machine_resources, rebuild_output_index, SortingOutput, get_run_outcome)
 
+
+def __getattr__(name):
+    # sorter_full_list and the sorter classes (e.g. spikesorters.Kilosort2Sorter) are imported on first access
+    from . import sorterlist
+    return getattr(sorterlist, name)
@@ -17,6 +17,7 @@ a way to adapt params with datasets.
 
 """
 
+import os
 import time
 import copy
 from pathlib import Path
@@ -25,13 +26,24 @@ import json
 import traceback
 import shutil
 import warnings
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from joblib import Parallel, delayed
 
 import numpy as np
 
 import spikeextractors as se
 from spikeextractors.baseextractor import _check_json
-from .sorter_tools import SpikeSortingError
+from .sorter_tools import (SpikeSortingError, SpikeSortingCancelled, get_recording_fingerprint, get_folder_manifest,
+                           check_folder_manifest, get_num_workers)
+from .cancellation import CancelToken, cancel_scope
+from .binary_cache import write_binary_recording
+from .shared_recording import share_recording
+from .sorter_info import get_sorter_info
+from .resource_estimation import estimate_resources
+from .profiling import StageProfiler, parse_backend_stages
+from .compact_store import (CompactSortingExtractor, has_compact_sorting, remove_compact_sorting,
+                            write_compact_sorting)
 
 
 class BaseSorter:
@@ -43,9 +55,35 @@ class BaseSorter:
     _params_description = {}
     sorter_description = ""
     installation_mesg = ""  # error message when not installed
+    use_binary_cache = True  # set to False to opt out of the shared binary cache
+    resumable_setup = True  # False if _setup_recording keeps state in memory (the setup is then redone on resume)
+    stages_filename = 'spikeinterface_stages.json'
+    runs_external_process = False  # True if _run mostly waits on an external process (ShellScript)
+    # resources needed by a run, see get_resource_footprint(). 'cores' is a number or the name of the param
+    # giving the number of workers, RAM and scratch disk are in MB per channel-hour at 30 kHz (used by the
+    # default _estimate_resources)
+    resource_footprint = {'cores': 1, 'ram_mb_per_channel_hour': 500., 'scratch_mb_per_channel_hour': 0.,
+                          'licenses': {}}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # get_result_from_folder() loads the compact store of the output when it exists (see compact_store.py),
+        # the native loader of the sorter stays available as get_native_result_from_folder()
+        if 'get_result_from_folder' in cls.__dict__:
+            native_func = cls.__dict__['get_result_from_folder']
+            native_func = getattr(native_func, '__func__', native_func)
+
+            @functools.wraps(native_func)
+            def get_result_from_folder(output_folder, *args, **kwargs):
+                if has_compact_sorting(output_folder):
+                    return CompactSortingExtractor(output_folder)
+                return native_func(output_folder, *args, **kwargs)
+
+            cls.get_result_from_folder = staticmethod(get_result_from_folder)
+            cls.get_native_result_from_folder = staticmethod(native_func)
 
     def __init__(self, recording=None, output_folder=None, verbose=False,
-                 grouping_property=None, delete_output_folder=False):
+                 grouping_property=None, delete_output_folder=False, resume=False):
 
         assert self.is_installed(), """The sorter {} is not installed.
         Please install it with:  \n{} """.format(self.sorter_name, self.installation_mesg)
@@ -58,12 +96,20 @@ class BaseSorter:
         self.verbose = verbose
         self.grouping_property = grouping_property
         self.params = self.default_params()
+        self.resume = resume
+        # {output_folder: {stage: stats}} of the stages profiled in this process (see profiling.py)
+        self._stage_profiles = {}
+        # {output_folder: {backend stage: seconds}} recorded by the in-process sorters in _run
+        self._backend_stages = {}
+        # token of the current run (see cancellation.py)
+        self._cancel_token = None
 
         if output_folder is None:
             output_folder = self.sorter_name + '_output'
         output_folder = Path(output_folder).absolute()
 
-        if output_folder.is_dir():
+        # with resume=True, the folders are checked stage by stage in run()
+        if output_folder.is_dir() and not resume:
             shutil.rmtree(str(output_folder))
 
         if grouping_property is None:
@@ -104,6 +150,56 @@ class BaseSorter:
     @classmethod
     def params_description(cls):
         return copy.deepcopy(cls._params_description)
+
+    @classmethod
+    def get_resource_footprint(cls, recording, params=None):
+        """
+        Estimates the resources needed to sort a recording from the 'resource_footprint' of the sorter.
+
+        Parameters
+        ----------
+        recording: RecordingExtractor
+            The recording to sort
+        params: dict or None
+            The sorter params (the default ones are used for the missing keys)
+
+        Returns
+        -------
+        footprint: dict
+            Dictionary with 'cores' (int), 'ram_mb' (float), 'scratch_mb' (float) and 'licenses'
+            (dict with the number of tokens by license)
+        """
+        footprint = dict(BaseSorter.resource_footprint, **cls.resource_footprint)
+        p = cls.default_params()
+        if params is not None:
+            p.update(params)
+        num_cpus = os.cpu_count()
+        cores = footprint['cores']
+        if isinstance(cores, str):
+            cores = p.get(cores, 1)
+        if cores is None:
+            # the wrappers use half of the cpus when the number of workers is None
+            cores = num_cpus // 2
+        elif cores < 0:
+            # joblib convention: -1 is all the cpus
+            cores = num_cpus + 1 + cores
+        cores = int(min(max(cores, 1), num_cpus))
+        estimate = estimate_resources(cls, recording, **p)
+        licenses = dict(footprint['licenses'])
+        if cls.is_compiled():
+            # the compiled MATLAB sorters run on the MATLAB Runtime, which needs no license
+            licenses.pop('matlab', None)
+        return {'cores': cores, 'ram_mb': estimate['ram_mb'], 'scratch_mb': estimate['scratch_mb'],
+                'licenses': licenses}
+
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        # analytic estimate of the peak RAM and scratch disk in MB (see resource_estimation.estimate_resources),
+        # to be overridden by the wrappers that know their copies of the traces
+        footprint = dict(BaseSorter.resource_footprint, **cls.resource_footprint)
+        channel_hours = recording.get_num_channels() * recording.get_num_frames() / 30000. / 3600.
+        return {'ram_mb': footprint['ram_mb_per_channel_hour'] * channel_hours,
+                'scratch_mb': footprint['scratch_mb_per_channel_hour'] * channel_hours}
         
     def set_params(self, **params):
         bad_params = []
@@ -125,53 +221,105 @@ class BaseSorter:
                 params['recording'] = recording.make_serialized_dict()
                 json.dump(_check_json(params), f, indent=4)
 
-    def run(self, raise_error=True, parallel=False, n_jobs=-1, joblib_backend='loky'):
-        for i, recording in enumerate(self.recording_list):
-            self._setup_recording(recording, self.output_folders[i])
+    def run(self, raise_error=True, parallel=False, n_jobs=-1, joblib_backend='loky', pipeline_depth=None,
+            compact_output=False, timeout=None, cancel_token=None, recording_transport=None):
+        if parallel and pipeline_depth is not None:
+            raise ValueError("'pipeline_depth' can only be used with parallel=False")
+        # the timeout covers the setup and the run of all the groups
+        self._cancel_token = CancelToken(timeout=timeout, parent=cancel_token)
+        pipelined = pipeline_depth is not None and len(self.recording_list) > 1
+
+        # fingerprints of the inputs (params + recording) of each group, computed before the setup changes params
+        if self.resume:
+            fingerprints = [get_recording_fingerprint(recording, sorter_name=self.sorter_name,
+                                                      sorter_params=copy.deepcopy(self.params))
+                            for recording in self.recording_list]
+        else:
+            fingerprints = [None] * len(self.recording_list)
 
-        # dump again params because some sorter do a folder reset (tdc)
-        self._dump_params()
+        resumed_stages = [[] for _ in self.recording_list]
+        setup_cancel_error = None
+        if not pipelined:
+            try:
+                for i, recording in enumerate(self.recording_list):
+                    resumed_stages[i] = self._setup_group(recording, self.output_folders[i], fingerprints[i])
+            except SpikeSortingCancelled as err:
+                # logged below like a cancelled run
+                setup_cancel_error = err
+            run_indices = [i for i in range(len(self.recording_list)) if 'run' not in resumed_stages[i]]
+
+            # dump again params because some sorter do a folder reset (tdc)
+            self._dump_params()
 
         now = datetime.datetime.now()
 
         log = {
             'sorter_name': str(self.sorter_name),
-            'sorter_version': str(self.get_sorter_version()),
+            'sorter_version': str(get_sorter_info(self.__class__)['version']),
             'datetime': now,
             'runtime_trace': []
         }
 
         t0 = time.perf_counter()
+        cancel_error = None
 
         if parallel:
             assert self.compatible_with_parallel[joblib_backend], f"{self.sorter_name} is not compatible with " \
                                                                   f"joblib {joblib_backend} backend"
-
-        if parallel and len(self.recording_list) > 1:
-            if not np.all([recording.check_if_dumpable() for recording in self.recording_list]):
-                raise RuntimeError("RecordingExtractor objects are not dumpable and can't be processed in parallel. "
-                                   "Use parallel=False")
+            recording_transport = self._get_recording_transport(recording_transport, joblib_backend)
 
         try:
-            if not parallel:
-                for i, recording in enumerate(self.recording_list):
-                    self._run(recording, self.output_folders[i])
+            if setup_cancel_error is not None:
+                raise setup_cancel_error
+            if pipelined:
+                # the run time is the sum of the run times of the groups (the setups run in the background)
+                run_time = self._run_pipeline(fingerprints, resumed_stages, pipeline_depth)
             else:
-                Parallel(n_jobs=n_jobs, backend=joblib_backend)(
-                    delayed(self._run)(rec.dump_to_dict(), output_folder)
-                    for (rec, output_folder) in zip(self.recording_list, self.output_folders))
-
-            t1 = time.perf_counter()
-            run_time = float(t1 - t0)
+                if not parallel:
+                    for i in run_indices:
+                        self._run_and_mark(self.recording_list[i], self.output_folders[i])
+                else:
+                    worker_recordings = []
+                    worker_sorter = self
+                    if recording_transport != 'object':
+                        # the pickled sorter does not carry the recordings
+                        worker_sorter = copy.copy(self)
+                        worker_sorter.recording_list = []
+                    try:
+                        for i in run_indices:
+                            worker_recordings.append(self._get_worker_recording(self.recording_list[i],
+                                                                                recording_transport))
+                        run_stats = Parallel(n_jobs=n_jobs, backend=joblib_backend)(
+                            delayed(worker_sorter._run_and_mark)(worker_recording, self.output_folders[i])
+                            for i, worker_recording in zip(run_indices, worker_recordings))
+                    finally:
+                        if recording_transport == 'shared':
+                            for worker_recording in worker_recordings:
+                                worker_recording.remove()
+                    for i, stats in zip(run_indices, run_stats):
+                        self._stage_profiles.setdefault(str(self.output_folders[i]), {})['run'] = stats
+
+                t1 = time.perf_counter()
+                run_time = float(t1 - t0)
 
         except Exception as err:
-            if raise_error:
+            if isinstance(err, SpikeSortingCancelled):
+                # logged (even with raise_error) as a distinct outcome, e.g. to retry the timed out runs
+                cancel_error = err
+                run_time = None
+                log['error'] = True
+                log['outcome'] = err.outcome
+                log['error_trace'] = traceback.format_exc()
+            elif raise_error:
                 raise SpikeSortingError(f"Spike sorting failed: {err}. You can inspect the runtime trace in "
                                         f"the {self.sorter_name}.log of the output folder.'")
             else:
                 run_time = None
                 log['error'] = True
+                log['outcome'] = 'error'
                 log['error_trace'] = traceback.format_exc()
+        else:
+            log['outcome'] = 'finished'
 
         log['run_time'] = run_time
 
@@ -187,17 +335,44 @@ class BaseSorter:
                         runtime_trace.append(line.strip())
                         line = fp.readline()
             log['runtime_trace'] = runtime_trace
+            profile = copy.deepcopy(self._stage_profiles.get(str(output_folder), {}))
+            if 'run' in profile:
+                profile['run']['backend_stages'].update(parse_backend_stages(runtime_trace))
+            log['profile'] = profile
+            if self.resume:
+                log['resumed_stages'] = resumed_stages[i]
             with open(str(output_folder / 'spikeinterface_log.json'), 'w', encoding='utf8') as f:
                 json.dump(_check_json(log), f, indent=4)
 
+        if cancel_error is not None and raise_error:
+            raise cancel_error
+
         if self.verbose:
             if run_time is None:
                 print('Error running', self.sorter_name)
             else:
-                print('{} run time {:0.2f}s'.format(self.sorter_name, t1 - t0))
+                print('{} run time {:0.2f}s'.format(self.sorter_name, run_time))
+
+        if compact_output and run_time is not None:
+            for output_folder in self.output_folders:
+                try:
+                    self.write_compact_output(output_folder)
+                except ValueError as e:
+                    # e.g. non integer unit ids: the native output is loaded
+                    warnings.warn(f"No compact store for {output_folder}: {e}")
 
         return run_time
 
+    def write_compact_output(self, output_folder):
+        """
+        Converts the output of one group to the compact store (see compact_store.py), loaded instead of the
+        native output by get_result_from_folder().
+        """
+        with StageProfiler() as profiler:
+            sorting = self.get_native_result_from_folder(output_folder)
+            write_compact_sorting(sorting, output_folder)
+        self._add_profile_to_log(output_folder, 'compact_output', profiler.stats)
+
     @staticmethod
     def get_sorter_version():
         # need be implemented in subclass
@@ -208,6 +383,11 @@ class BaseSorter:
         # need be implemented in subclass
         raise NotImplementedError
 
+    @classmethod
+    def is_compiled(cls):
+        # True for the MATLAB sorters that run a compiled application (see compiled_matlab.py)
+        return False
+
     def _setup_recording(self, recording, output_folder):
         # need be implemented in subclass
         # this setup ONE recording (or SubExtractor)
@@ -215,6 +395,176 @@ class BaseSorter:
         # this must take care of geometry file (ORB, CSV, ...)
         raise NotImplementedError
 
+    def _write_binary_recording(self, recording, save_path, dtype, time_axis=0, chunk_mb=500, n_jobs=1):
+        # helper for subclasses: write the binary copy of ONE recording, going through
+        # the shared binary cache when it is enabled
+        return write_binary_recording(recording, save_path, dtype=dtype, time_axis=time_axis, chunk_mb=chunk_mb,
+                                      n_jobs=n_jobs, verbose=self.verbose, use_cache=self.use_binary_cache)
+
+    def _setup_group(self, recording, output_folder, fingerprint):
+        # setup ONE group (unless it can be resumed) and returns the list of stages already done
+        resumed_stages = []
+        if self._cancel_token is not None:
+            self._cancel_token.check()
+        if self._resume_setup(output_folder, fingerprint):
+            resumed_stages.append('setup')
+        else:
+            with StageProfiler() as profiler, cancel_scope(self._cancel_token):
+                self._setup_recording(recording, output_folder)
+            self._stage_profiles.setdefault(str(output_folder), {})['setup'] = profiler.stats
+            self._mark_setup_done(output_folder, fingerprint)
+        if self.resume and self._read_stages(output_folder).get('run', False):
+            resumed_stages.append('run')
+        return resumed_stages
+
+    def _get_recording_transport(self, recording_transport, joblib_backend):
+        # how the recordings of the groups reach the joblib workers:
+        # 'object' (threads), 'dump' (dump_to_dict) or 'shared' (see shared_recording.py)
+        if joblib_backend == 'threading':
+            return 'object'
+        dumpable = np.all([recording.check_if_dumpable() for recording in self.recording_list])
+        if recording_transport is None:
+            recording_transport = 'dump' if dumpable else 'shared'
+        assert recording_transport in ('dump', 'shared'), "'recording_transport' can be None, 'dump' or 'shared'"
+        if recording_transport == 'dump' and not dumpable:
+            raise RuntimeError("RecordingExtractor objects are not dumpable and can't be processed in parallel with "
+                               "recording_transport='dump'. Use recording_transport='shared' or parallel=False")
+        return recording_transport
+
+    def _get_worker_recording(self, recording, recording_transport):
+        if recording_transport == 'dump':
+            return recording.dump_to_dict()
+        elif recording_transport == 'shared':
+            # the traces are written once, the workers map them
+            return share_recording(recording)
+        return recording
+
+    def _get_group_sorter(self, i):
+        # shallow copy of the sorter restricted to one group, with its own params: the setup of one group can then
+        # run while another group is sorted (some sorters change params or attributes in the setup)
+        sorter = copy.copy(self)
+        sorter.params = copy.deepcopy(self.params)
+        sorter.recording_list = [self.recording_list[i]]
+        sorter.output_folders = [self.output_folders[i]]
+        return sorter
+
+    def _run_pipeline(self, fingerprints, resumed_stages, pipeline_depth):
+        # the setups are done in order by a background thread, at most pipeline_depth groups ahead of the
+        # group being sorted (this bounds the disk usage of the binary copies)
+        group_sorters = [self._get_group_sorter(i) for i in range(len(self.recording_list))]
+        futures = []
+        run_time = 0.
+        last_setup = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+
+            def submit_setup():
+                i = len(futures)
+                sorter = group_sorters[i]
+                futures.append(executor.submit(sorter._setup_group, sorter.recording_list[0],
+                                               sorter.output_folders[0], fingerprints[i]))
+
+            try:
+                for _ in range(min(pipeline_depth + 1, len(group_sorters))):
+                    submit_setup()
+                for i, sorter in enumerate(group_sorters):
+                    resumed_stages[i] = futures[i].result()
+                    last_setup = i
+                    sorter._dump_params()
+                    if 'run' not in resumed_stages[i]:
+                        t0 = time.perf_counter()
+                        sorter._run_and_mark(sorter.recording_list[0], sorter.output_folders[0])
+                        run_time += time.perf_counter() - t0
+                    if len(futures) < len(group_sorters):
+                        submit_setup()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                if last_setup is not None:
+                    self.params = group_sorters[last_setup].params
+        return float(run_time)
+
+    def _run_and_mark(self, recording, output_folder):
+        # returns the profile of the run (the sorter can be a copy in a joblib worker)
+        # the compact store of a previous run (resume) is outdated
+        remove_compact_sorting(output_folder)
+        if self._cancel_token is not None:
+            self._cancel_token.check()
+        with StageProfiler() as profiler, cancel_scope(self._cancel_token):
+            self._run(recording, output_folder)
+        stats = profiler.stats
+        stats['backend_stages'] = self._backend_stages.pop(str(output_folder), {})
+        self._stage_profiles.setdefault(str(output_folder), {})['run'] = stats
+        stages = self._read_stages(output_folder)
+        if 'setup' in stages:
+            stages['run'] = True
+            self._write_stages(output_folder, stages)
+        return stats
+
+    def _add_backend_stage(self, output_folder, name, seconds):
+        # for the in-process sorters: records the duration of a stage of the backend in the profile of the run
+        backend_stages = self._backend_stages.setdefault(str(output_folder), {})
+        backend_stages[name] = backend_stages.get(name, 0.) + float(seconds)
+
+    def _read_stages(self, output_folder):
+        stages_file = Path(output_folder) / self.stages_filename
+        if not stages_file.is_file():
+            return {}
+        with open(str(stages_file), 'r', encoding='utf8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+
+    def _write_stages(self, output_folder, stages):
+        with open(str(Path(output_folder) / self.stages_filename), 'w', encoding='utf8') as f:
+            json.dump(_check_json(stages), f, indent=4)
+
+    def _get_setup_manifest(self, output_folder):
+        exclude = (self.stages_filename, 'spikeinterface_params.json', 'spikeinterface_log.json',
+                   f'{self.sorter_name}.log')
+        return get_folder_manifest(output_folder, exclude=exclude)
+
+    def _resume_setup(self, output_folder, fingerprint):
+        # returns True if the setup of this folder is done with the same inputs and can be skipped
+        if not self.resume:
+            return False
+        stages = self._read_stages(output_folder)
+        resumable = fingerprint is not None and stages.get('fingerprint') == fingerprint and 'setup' in stages
+        # when the run is not done, the files of the setup (e.g. the binary copy) must be intact, the files written
+        # by the crashed run (scripts, temporary files, partial outputs) are ignored
+        if resumable and not stages.get('run', False):
+            resumable = check_folder_manifest(output_folder, stages['setup']['files'])
+        if not resumable:
+            if fingerprint is None:
+                print(f'WARNING! The recording is not dumpable: {output_folder} can not be resumed.')
+            # inputs changed or incomplete setup: restart this folder from scratch
+            if output_folder.is_dir():
+                shutil.rmtree(str(output_folder))
+            output_folder.mkdir(parents=True, exist_ok=True)
+            return False
+        # restore the params as they were after the setup (some sorters store paths in params)
+        self.params = stages['setup']['params']
+        if not self.resumable_setup:
+            return False
+        if self.verbose:
+            print(f'Resuming {output_folder}: setup already done')
+        return True
+
+    def _mark_setup_done(self, output_folder, fingerprint):
+        if not self.resume or fingerprint is None:
+            return
+        stages = self._read_stages(output_folder)
+        if stages.get('fingerprint') == fingerprint and 'setup' in stages:
+            # setup redone in memory only (resumable_setup=False): the files and the run stage are still valid
+            return
+        stages = {
+            'fingerprint': fingerprint,
+            'setup': {'params': copy.deepcopy(self.params), 'files': self._get_setup_manifest(output_folder)}
+        }
+        self._write_stages(output_folder, stages)
+
     def _run(self, recording, output_folder):
         # need be implemented in subclass
         # this run the sorter on ONE recording (or SubExtractor)
@@ -225,21 +575,77 @@ class BaseSorter:
     def get_result_from_folder(output_folder):
         raise NotImplementedError
 
-    def get_result_list(self, raise_error=True):
+    @staticmethod
+    def get_native_result_from_folder(output_folder):
+        raise NotImplementedError
+
+    def _load_group_result(self, i):
+        with StageProfiler() as profiler:
+            sorting = self.get_result_from_folder(self.output_folders[i])
+        self._stage_profiles.setdefault(str(self.output_folders[i]), {})['get_result'] = profiler.stats
+        self._add_profile_to_log(self.output_folders[i], 'get_result', profiler.stats)
+        return sorting
+
+    def get_result_list(self, raise_error=True, n_jobs=1):
+        """
+        Loads the sortings of the groups, in the order of the groups.
+
+        Parameters
+        ----------
+        raise_error: bool
+            If True, an error is raised if a sorting cannot be loaded (the first one in the order of the groups).
+            If False, the sortings that cannot be loaded are skipped with a warning
+        n_jobs: int
+            Number of threads loading the sortings in parallel (-1: number of cores, default 1)
+
+        Returns
+        -------
+        sorting_list: list
+            The loaded sortings
+        """
+        indices = list(range(len(self.recording_list)))
+        num_workers = get_num_workers(n_jobs, len(indices))
+        if num_workers == 1:
+            results = []
+            for i in indices:
+                try:
+                    results.append(self._load_group_result(i))
+                except Exception as err:
+                    if raise_error:
+                        raise SpikeSortingError(f"Failed to load sorting output {i}")
+                    results.append(err)
+        else:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(self._load_group_result, i) for i in indices]
+                results = [future.exception() or future.result() for future in futures]
+
         sorting_list = []
-        for i, _ in enumerate(self.recording_list):
-            try:
-                sorting = self.get_result_from_folder(self.output_folders[i])
-                sorting_list.append(sorting)
-            except Exception as err:
+        for i, result in zip(indices, results):
+            if isinstance(result, Exception):
                 if raise_error:
                     raise SpikeSortingError(f"Failed to load sorting output {i}")
                 else:
                     warnings.warn(f"Sorting output {i} could not be loaded")
+            else:
+                sorting_list.append(result)
         return sorting_list
 
-    def get_result(self, raise_error=True):
-        sorting_list = self.get_result_list(raise_error=raise_error)
+    def _add_profile_to_log(self, output_folder, stage, stats):
+        # best effort: the output can be read only (e.g. archived results), the profile then stays in memory
+        log_file = Path(output_folder) / 'spikeinterface_log.json'
+        if not log_file.is_file():
+            return
+        try:
+            with open(str(log_file), 'r', encoding='utf8') as f:
+                log = json.load(f)
+            log.setdefault('profile', {})[stage] = stats
+            with open(str(log_file), 'w', encoding='utf8') as f:
+                json.dump(_check_json(log), f, indent=4)
+        except (OSError, ValueError):
+            pass
+
+    def get_result(self, raise_error=True, n_jobs=1):
+        sorting_list = self.get_result_list(raise_error=raise_error, n_jobs=n_jobs)
         
         if len(sorting_list) == 1:
             sorting = sorting_list[0]
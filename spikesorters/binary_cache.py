@@ -0,0 +1,351 @@
+"""
+Content-addressed cache for the binary copies of recordings written by the sorter wrappers.
+
+Several sorters (kilosort*, yass, klusta) need the very same int16 binary copy of a recording.
+When comparing them on one recording, the cache makes only the first sorter export the traces:
+the following ones get a link (hardlink, reflink or symlink) to the cached file.
+
+The cache is keyed by a fingerprint of the recording (serialized dict, channel order) plus the
+dtype and time_axis of the copy, and it is bounded in size with a least-recently-used eviction.
+
+The cache is disabled by default. It can be enabled with:
+
+    >>> import spikesorters as ss
+    >>> ss.set_binary_cache('/scratch/spikesorters_cache', max_size_gb=200)
+
+or with the SPIKESORTERS_BINARY_CACHE and SPIKESORTERS_BINARY_CACHE_MAX_GB environment variables.
+Each sorter class can opt out by setting its class attribute 'use_binary_cache' to False.
+
+Symlinks (used when the output folder is on a different filesystem than the cache) become invalid when
+their cache entry is evicted, possibly before the sorter reading them has started: a bounded cache
+makes a copy instead.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+
+from .sorter_tools import get_recording_fingerprint
+
+_binary_cache = None
+
+
+class BinaryCache:
+    """
+    A size bounded cache of binary recording files.
+
+    Parameters
+    ----------
+    cache_folder: str or Path
+        The folder where the cached files are stored
+    max_size_gb: float or None
+        Maximum size of the cache in GB. If None the cache is not bounded
+    link_modes: list
+        The link modes tried in order to expose a cached file in an output folder
+        ('hardlink', 'reflink', 'symlink', 'copy')
+    """
+    index_name = 'cache_index.json'
+
+    def __init__(self, cache_folder, max_size_gb=None, link_modes=('hardlink', 'reflink', 'symlink')):
+        self.cache_folder = Path(cache_folder).absolute()
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        self.max_size_gb = max_size_gb
+        self.link_modes = list(link_modes)
+
+    def get_key(self, recording, dtype, time_axis=0, return_scaled=True):
+        """
+        Returns the cache key of a binary copy of the recording or None if the recording can not be cached.
+        """
+        return get_recording_fingerprint(recording, dtype=str(dtype), time_axis=int(time_axis),
+                                         return_scaled=bool(return_scaled))
+
+    def get_file(self, key):
+        """
+        Returns the path of the cached file for a key or None if it is not in the cache.
+        """
+        with _CacheLock(self.cache_folder):
+            index = self._read_index()
+            if key not in index:
+                return None
+            cached_file = self.cache_folder / index[key]['file']
+            if not cached_file.is_file() or cached_file.stat().st_size != index[key]['size']:
+                # stale entry
+                index.pop(key)
+                self._write_index(index)
+                return None
+            index[key]['last_access'] = time.time()
+            self._write_index(index)
+        return cached_file
+
+    def get_tmp_file(self, key, suffix='.dat'):
+        """
+        Returns a temporary path in the cache folder, where a file can be written before add_file().
+        """
+        return self.cache_folder / (key + f'.{os.getpid()}.{threading.get_ident()}.tmp{suffix}')
+
+    def add_file(self, key, file_path, suffix=None):
+        """
+        Moves a freshly written file into the cache and returns its new path. A file written in the cache folder
+        (see get_tmp_file()) is renamed, not copied.
+        """
+        file_path = Path(file_path)
+        suffix = file_path.suffix if suffix is None else suffix
+        cached_file = self.cache_folder / (key + suffix)
+        if file_path.parent.absolute() != self.cache_folder:
+            tmp_file = self.get_tmp_file(key, suffix)
+            shutil.move(str(file_path), str(tmp_file))
+            file_path = tmp_file
+        os.replace(str(file_path), str(cached_file))
+        with _CacheLock(self.cache_folder):
+            index = self._read_index()
+            index[key] = {'file': cached_file.name, 'size': cached_file.stat().st_size, 'last_access': time.time()}
+            self._evict(index, keep=[key])
+            self._write_index(index)
+        return cached_file
+
+    def link(self, cached_file, save_path):
+        """
+        Exposes a cached file at save_path using the first link mode that works, falling back to a copy.
+        Returns the link mode used.
+        """
+        save_path = Path(save_path)
+        if save_path.exists() or save_path.is_symlink():
+            save_path.unlink()
+        link_modes = list(self.link_modes)
+        if self.max_size_gb is not None:
+            # the entry can be evicted while a queued sorter has not read it yet
+            link_modes = [mode for mode in link_modes if mode != 'symlink']
+        if 'copy' not in link_modes:
+            link_modes.append('copy')
+        for link_mode in link_modes:
+            try:
+                if link_mode == 'hardlink':
+                    os.link(str(cached_file), str(save_path))
+                elif link_mode == 'reflink':
+                    if not sys.platform.startswith('linux'):
+                        continue
+                    subprocess.run(['cp', '--reflink=always', str(cached_file), str(save_path)],
+                                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                elif link_mode == 'symlink':
+                    os.symlink(str(cached_file), str(save_path))
+                elif link_mode == 'copy':
+                    shutil.copyfile(str(cached_file), str(save_path))
+                else:
+                    raise ValueError(f"Unknown link mode {link_mode}")
+                return link_mode
+            except (OSError, subprocess.CalledProcessError):
+                if save_path.exists() or save_path.is_symlink():
+                    save_path.unlink()
+        raise RuntimeError(f"Could not link {cached_file} to {save_path} with modes {link_modes}")
+
+    def get_size(self):
+        """
+        Returns the total size in bytes of the cached files.
+        """
+        with _CacheLock(self.cache_folder):
+            index = self._read_index()
+        return sum(entry['size'] for entry in index.values())
+
+    def clear(self):
+        """
+        Removes all cached files.
+        """
+        with _CacheLock(self.cache_folder):
+            index = self._read_index()
+            for key in list(index.keys()):
+                self._remove_entry(index, key)
+            self._write_index(index)
+
+    def _evict(self, index, keep=()):
+        if self.max_size_gb is None:
+            return
+        max_size = self.max_size_gb * 1e9
+        total_size = sum(entry['size'] for entry in index.values())
+        keys = sorted(index.keys(), key=lambda k: index[k]['last_access'])
+        for key in keys:
+            if total_size <= max_size:
+                break
+            if key in keep:
+                continue
+            total_size -= index[key]['size']
+            self._remove_entry(index, key)
+
+    def _remove_entry(self, index, key):
+        entry = index.pop(key)
+        cached_file = self.cache_folder / entry['file']
+        if cached_file.is_file():
+            cached_file.unlink()
+
+    def _read_index(self):
+        index_file = self.cache_folder / self.index_name
+        if not index_file.is_file():
+            return {}
+        with open(str(index_file), 'r', encoding='utf8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+
+    def _write_index(self, index):
+        index_file = self.cache_folder / self.index_name
+        tmp_file = self.cache_folder / (self.index_name + f'.{os.getpid()}.tmp')
+        with open(str(tmp_file), 'w', encoding='utf8') as f:
+            json.dump(index, f, indent=4)
+        os.replace(str(tmp_file), str(index_file))
+
+
+class _CacheLock:
+    """
+    Inter-process lock on a file (fcntl.flock on posix, msvcrt.locking on windows). The lock is released by the
+    system when its holder dies, so there are no stale locks. The lock file is never removed.
+    """
+    def __init__(self, folder, timeout=60., poll_interval=0.05, lock_name='cache.lock'):
+        self.lock_file = Path(folder) / lock_name
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def _try_lock(self):
+        try:
+            if sys.platform.startswith('win'):
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def __enter__(self):
+        self._file = open(str(self.lock_file), 'a+')
+        t0 = time.time()
+        while not self._try_lock():
+            if time.time() - t0 > self.timeout:
+                self._file.close()
+                self._file = None
+                raise TimeoutError(f"Could not acquire {self.lock_file} in {self.timeout} s")
+            time.sleep(self.poll_interval)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if sys.platform.startswith('win'):
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def set_binary_cache(cache_folder, max_size_gb=None, link_modes=('hardlink', 'reflink', 'symlink')):
+    """
+    Enables (or disables with cache_folder=None) the binary cache shared by the sorters.
+
+    Parameters
+    ----------
+    cache_folder: str or Path or None
+        The folder where the cached files are stored. If None, the cache is disabled
+    max_size_gb: float or None
+        Maximum size of the cache in GB. If None the cache is not bounded
+    link_modes: list
+        The link modes tried in order ('hardlink', 'reflink', 'symlink', 'copy')
+    """
+    global _binary_cache
+    if cache_folder is None:
+        _binary_cache = None
+    else:
+        _binary_cache = BinaryCache(cache_folder, max_size_gb=max_size_gb, link_modes=link_modes)
+
+
+def get_binary_cache():
+    """
+    Returns the current BinaryCache or None if the cache is disabled.
+
+    If set_binary_cache() has not been called, the cache is configured with the SPIKESORTERS_BINARY_CACHE
+    and SPIKESORTERS_BINARY_CACHE_MAX_GB environment variables.
+    """
+    global _binary_cache
+    if _binary_cache is None:
+        cache_folder = os.getenv('SPIKESORTERS_BINARY_CACHE', None)
+        if cache_folder:
+            max_size_gb = os.getenv('SPIKESORTERS_BINARY_CACHE_MAX_GB', None)
+            if max_size_gb is not None:
+                max_size_gb = float(max_size_gb)
+            _binary_cache = BinaryCache(cache_folder, max_size_gb=max_size_gb)
+    return _binary_cache
+
+
+def write_binary_recording(recording, save_path, dtype, time_axis=0, chunk_mb=500, n_jobs=1, verbose=False,
+                           use_cache=True):
+    """
+    Writes a recording in binary format, going through the binary cache when it is enabled.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to write
+    save_path: str or Path
+        The path of the binary file (the '.dat' suffix is added if there is no suffix)
+    dtype: str
+        The dtype of the binary file
+    time_axis: 0 or 1
+        The time axis of the binary file
+    chunk_mb: int
+        Chunk size in Mb
+    n_jobs: int
+        Number of jobs for writing
+    verbose: bool
+        If True, output is verbose
+    use_cache: bool
+        If False, the cache is not used even if enabled
+
+    Returns
+    -------
+    save_path: Path
+        The path of the written (or linked) binary file
+    """
+    save_path = Path(save_path)
+    if save_path.suffix == '':
+        save_path = save_path.parent / (save_path.name + '.dat')
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+
+    cache = get_binary_cache() if use_cache else None
+    key = None
+    if cache is not None:
+        key = cache.get_key(recording, dtype=dtype, time_axis=time_axis)
+
+    if key is not None:
+        cached_file = cache.get_file(key)
+        if cached_file is not None:
+            link_mode = cache.link(cached_file, save_path)
+            if verbose:
+                print(f'Binary file found in cache ({link_mode}): {cached_file}')
+            return save_path
+
+    if key is None:
+        recording.write_to_binary_dat_format(save_path, time_axis=time_axis, dtype=dtype, chunk_mb=chunk_mb,
+                                             n_jobs=n_jobs, verbose=verbose)
+        return save_path
+
+    # written in the cache folder and renamed: no second copy when the cache is on another filesystem
+    tmp_file = cache.get_tmp_file(key, suffix=save_path.suffix)
+    try:
+        recording.write_to_binary_dat_format(tmp_file, time_axis=time_axis, dtype=dtype, chunk_mb=chunk_mb,
+                                             n_jobs=n_jobs, verbose=verbose)
+        cached_file = cache.add_file(key, tmp_file, suffix=save_path.suffix)
+    finally:
+        if tmp_file.is_file():
+            tmp_file.unlink()
+    cache.link(cached_file, save_path)
+
+    return save_path
@@ -0,0 +1,126 @@
+"""
+Cooperative cancellation and wall-clock timeouts of the sorter runs.
+
+BaseSorter.run() makes a CancelToken current in the threads running the sorter (cancel_scope()). The blocking
+waits of the runs poll it: ShellScript.wait() stops the script, and the MATLAB session pool kills the session of
+the job, when the token is cancelled or its deadline has passed. The in-process python sorters check it between
+the setup and the run of each group.
+
+A token is pickled with its deadline and its cancel file, so that the joblib and multiprocessing workers see the
+timeouts, and see cancel() if the token has a cancel file.
+"""
+import time
+import threading
+import contextlib
+from pathlib import Path
+
+from .sorter_tools import SpikeSortingCancelled, SpikeSortingTimeout
+
+_current = threading.local()
+
+
+class CancelToken:
+    """
+    Cancellation of one or several sorter runs, with an optional wall-clock timeout.
+
+    Parameters
+    ----------
+    timeout: float or None
+        Timeout in s from the creation of the token
+    cancel_file: str or Path or None
+        A file whose creation cancels the token (cancel() creates it). Without it, cancel() is only seen by the
+        threads of this process.
+    parent: CancelToken or None
+        The token is also cancelled with its parent (e.g. a per-run timeout within a cancellable batch)
+    """
+    def __init__(self, timeout=None, cancel_file=None, parent=None):
+        self.deadline = None if timeout is None else time.time() + timeout
+        self.cancel_file = None if cancel_file is None else Path(cancel_file)
+        self.parent = parent
+        self._event = threading.Event()
+        self._reason = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_event')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._event = threading.Event()
+        if self._reason is not None:
+            self._event.set()
+
+    def cancel(self, reason='cancelled'):
+        """
+        Cancels the token.
+
+        Parameters
+        ----------
+        reason: 'cancelled' or 'timeout'
+            The outcome recorded in the spikeinterface_log.json of the cancelled runs
+        """
+        assert reason in ('cancelled', 'timeout'), "reason must be 'cancelled' or 'timeout'"
+        if self._reason is None:
+            self._reason = reason
+        self._event.set()
+        if self.cancel_file is not None and not self.cancel_file.is_file():
+            self.cancel_file.parent.mkdir(parents=True, exist_ok=True)
+            self.cancel_file.write_text(reason)
+
+    def get_reason(self):
+        """
+        Returns 'cancelled', 'timeout' or None if the token is not cancelled.
+        """
+        if self._event.is_set():
+            return self._reason
+        if self.deadline is not None and time.time() > self.deadline:
+            return 'timeout'
+        if self.cancel_file is not None and self.cancel_file.is_file():
+            reason = self.cancel_file.read_text().strip()
+            return reason if reason in ('cancelled', 'timeout') else 'cancelled'
+        if self.parent is not None:
+            return self.parent.get_reason()
+        return None
+
+    def is_cancelled(self):
+        return self.get_reason() is not None
+
+    def check(self):
+        """
+        Raises SpikeSortingTimeout or SpikeSortingCancelled if the token is cancelled.
+        """
+        reason = self.get_reason()
+        if reason == 'timeout':
+            raise SpikeSortingTimeout('The spike sorting run exceeded its timeout')
+        elif reason is not None:
+            raise SpikeSortingCancelled('The spike sorting run was cancelled')
+
+
+@contextlib.contextmanager
+def cancel_scope(cancel_token):
+    """
+    Context manager making a token the current token of the thread (see get_cancel_token()).
+    """
+    previous = getattr(_current, 'token', None)
+    _current.token = cancel_token
+    try:
+        yield cancel_token
+    finally:
+        _current.token = previous
+
+
+def get_cancel_token():
+    """
+    Returns the current token of the thread (None outside of a sorter run).
+    """
+    return getattr(_current, 'token', None)
+
+
+def check_cancelled():
+    """
+    Raises SpikeSortingTimeout or SpikeSortingCancelled if the current token of the thread is cancelled.
+    """
+    token = get_cancel_token()
+    if token is not None:
+        token.check()
@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 from typing import Union
 import sys
+import numpy as np
 
 import spikeextractors as se
 from ..basesorter import BaseSorter
@@ -33,6 +34,52 @@ def check_if_installed(combinato_path: Union[str, None]):
         return False
 
 
+def write_h5_recording(recording, file_path, channel_id=None, chunk_mb=500, compression=None, verbose=False):
+    """
+    Writes the 'data' and 'sr' datasets of one channel in the h5 format read by css-extract.
+
+    The 'data' dataset is chunked and resizable and it is filled from bounded get_traces windows, so that
+    the memory usage does not depend on the duration of the recording.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to write
+    file_path: str or Path
+        The path of the h5 file
+    channel_id: int or None
+        The channel to write. If None, the first channel is used
+    chunk_mb: int
+        Chunk size in Mb
+    compression: str or None
+        The h5 compression filter of the 'data' dataset ('gzip', 'lzf' or None)
+    verbose: bool
+        If True, output is verbose
+    """
+    if not HAVE_H5PY:
+        raise Exception("To use Combinato, install h5py: pip install h5py")
+    if channel_id is None:
+        channel_id = recording.get_channel_ids()[0]
+    num_frames = recording.get_num_frames()
+    dtype = np.dtype(recording.get_dtype())
+    chunk_size = max(int(chunk_mb * 1e6 // dtype.itemsize), 1)
+
+    with h5py.File(str(file_path), mode='w') as f:
+        f.create_dataset("sr", data=[recording.get_sampling_frequency()], dtype='float32')
+        data = f.create_dataset("data", shape=(0,), maxshape=(None,), dtype=dtype,
+                                chunks=(min(chunk_size, 2 ** 20),), compression=compression)
+
+        n_chunk = num_frames // chunk_size + int(num_frames % chunk_size > 0)
+        for i in range(n_chunk):
+            start_frame = i * chunk_size
+            end_frame = min((i + 1) * chunk_size, num_frames)
+            traces = recording.get_traces(channel_ids=[channel_id], start_frame=start_frame, end_frame=end_frame)
+            data.resize((end_frame,))
+            data[start_frame:end_frame] = traces[0]
+            if verbose:
+                print(f'Written chunk {i + 1}/{n_chunk}')
+
+
 class CombinatoSorter(BaseSorter):
     """
     """
@@ -40,6 +87,8 @@ class CombinatoSorter(BaseSorter):
     sorter_name: str = 'combinato'
     combinato_path: Union[str, None] = os.getenv('COMBINATO_PATH', None)
     requires_locations = False
+    resource_footprint = {'cores': 1, 'ram_mb_per_channel_hour': 500., 'scratch_mb_per_channel_hour': 250., 'licenses': {}}
+    runs_external_process = True
     _default_params = {
         'detect_sign': -1,  # -1 - 1 - 0
         'MaxClustersPerTemp': 5,
@@ -56,7 +105,9 @@ class CombinatoSorter(BaseSorter):
         'index_maximum': 19,
         'upsampling_factor': 3,
         'denoise': True,
-        'do_filter': True
+        'do_filter': True,
+        'chunk_mb': 500,
+        'compression': None
     }
 
     _params_description = {
@@ -76,7 +127,9 @@ class CombinatoSorter(BaseSorter):
         'index_maximum': "Number of samples from the beginning of the spike waveform up to (not including) the peak",
         'upsampling_factor': 'upsampling factor',
         'denoise': 'Use denoise filter',
-        'do_filter': 'Use bandpass filter'
+        'do_filter': 'Use bandpass filter',
+        'chunk_mb': "Chunk size in Mb for saving the h5 file (default 500Mb)",
+        'compression': "Compression of the h5 file: 'gzip', 'lzf' or None (default)"
     }
 
     sorter_description = """Combinato is a complete data-analysis framework for spike sorting in noisy recordings 
@@ -123,18 +176,15 @@ class CombinatoSorter(BaseSorter):
 
         os.makedirs(str(output_folder), exist_ok=True)
         # Generate h5 files in the dataset directory
-        chid = recording.get_channel_ids()[0]
         vcFile_h5 = str(output_folder / ('recording.h5'))
-        f = h5py.File(vcFile_h5, mode='w')
-        f.create_dataset("sr", data=[recording.get_sampling_frequency()], dtype='float32')
-
-        f.create_dataset("data", data=recording.get_traces(channel_ids=[chid]).flatten())
-        f.close()
+        write_h5_recording(recording, vcFile_h5, chunk_mb=self.params['chunk_mb'],
+                           compression=self.params['compression'], verbose=self.verbose)
 
     def _run(self, recording, output_folder):
         recording = recover_recording(recording)
 
         p = self.params.copy()
+        del p['chunk_mb'], p['compression']
         p['threshold_factor'] = p.pop('detect_threshold')
         sign_thr = p.pop('detect_sign')
         if sign_thr == 0:
@@ -0,0 +1,180 @@
+"""
+Compact store of the spike trains of a sorter output, in the 'spikesorters_sorting' folder of the output folder:
+
+    spike_frames.npy   int64, sorted spike frames of all the units
+    unit_indices.npy   int32, index in unit_ids of the unit of each spike
+    unit_ids.npy       int64 (the unit ids must be integers)
+    sorting.json       sampling frequency and unit properties (the JSON serializable ones)
+
+The arrays are memory-mapped on load, so that reloading many outputs does not parse the native formats of the
+sorters (phy, firings.mda, hdf5, .kwik, .mat, ...) again. When the store exists, the get_result_from_folder()
+of the sorters loads it instead of the native output. The spike features are not stored.
+"""
+import os
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+import spikeextractors as se
+from spikeextractors.baseextractor import _check_json
+from spikeextractors.extraction_tools import check_get_unit_spike_train
+
+compact_store_name = 'spikesorters_sorting'
+
+
+def has_compact_sorting(output_folder):
+    """
+    Returns True if the output folder has a complete compact store.
+    """
+    return (Path(output_folder) / compact_store_name / 'sorting.json').is_file()
+
+
+def remove_compact_sorting(output_folder):
+    """
+    Removes the compact store of an output folder (e.g. before the sorter runs again in it).
+    """
+    store_folder = Path(output_folder) / compact_store_name
+    if store_folder.is_dir():
+        shutil.rmtree(str(store_folder))
+
+
+def _get_unit_properties(sorting):
+    properties = {}
+    for unit_id in sorting.get_unit_ids():
+        unit_properties = {}
+        for name in sorting.get_unit_property_names(unit_id):
+            try:
+                value = _check_json({name: sorting.get_unit_property(unit_id, name)})[name]
+                json.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            unit_properties[name] = value
+        properties[str(unit_id)] = unit_properties
+    return properties
+
+
+def _get_unit_id_array(unit_ids):
+    # the SortingExtractors of spikeextractors only read the spike trains of integer unit ids
+    non_integer_ids = [unit_id for unit_id in unit_ids
+                       if not isinstance(unit_id, (int, np.integer)) or isinstance(unit_id, (bool, np.bool_))]
+    if len(non_integer_ids) > 0:
+        raise ValueError('The compact store needs integer unit ids, got: {}'.format(non_integer_ids))
+    return np.array(unit_ids, dtype='int64')
+
+
+def write_compact_sorting(sorting, output_folder):
+    """
+    Writes the compact store of a sorting in an output folder. The store is written in a temporary folder
+    renamed at the end, so that an interrupted write does not leave an incomplete store. A ValueError is raised
+    before writing if the unit ids are not integers.
+
+    Parameters
+    ----------
+    sorting: SortingExtractor
+        The sorting to store
+    output_folder: str or Path
+        The output folder of the sorter
+    """
+    unit_ids = _get_unit_id_array(sorting.get_unit_ids())
+    output_folder = Path(output_folder)
+    tmp_folder = output_folder / (compact_store_name + f'.{os.getpid()}.tmp')
+    if tmp_folder.is_dir():
+        shutil.rmtree(str(tmp_folder))
+    tmp_folder.mkdir(parents=True)
+
+    spike_trains = [np.asarray(sorting.get_unit_spike_train(unit_id), dtype='int64')
+                    for unit_id in sorting.get_unit_ids()]
+    if len(spike_trains) > 0:
+        spike_frames = np.concatenate(spike_trains)
+        unit_indices = np.concatenate([np.full(st.size, i, dtype='int32') for i, st in enumerate(spike_trains)])
+    else:
+        spike_frames = np.zeros(0, dtype='int64')
+        unit_indices = np.zeros(0, dtype='int32')
+    # sorted by frame, then by unit
+    order = np.lexsort((unit_indices, spike_frames))
+    np.save(str(tmp_folder / 'spike_frames.npy'), spike_frames[order])
+    np.save(str(tmp_folder / 'unit_indices.npy'), unit_indices[order])
+    np.save(str(tmp_folder / 'unit_ids.npy'), unit_ids)
+
+    sampling_frequency = sorting.get_sampling_frequency()
+    info = {'sampling_frequency': None if sampling_frequency is None else float(sampling_frequency),
+            'num_spikes': int(spike_frames.size), 'unit_properties': _get_unit_properties(sorting)}
+    with open(str(tmp_folder / 'sorting.json'), 'w', encoding='utf8') as f:
+        json.dump(info, f, indent=4)
+
+    remove_compact_sorting(output_folder)
+    os.replace(str(tmp_folder), str(output_folder / compact_store_name))
+
+
+class CompactSortingExtractor(se.SortingExtractor):
+    """
+    SortingExtractor of the compact store of an output folder (see write_compact_sorting()).
+
+    Parameters
+    ----------
+    output_folder: str or Path
+        The output folder of the sorter
+    """
+    extractor_name = 'CompactSortingExtractor'
+    installed = True
+    is_writable = True
+    mode = 'folder'
+
+    def __init__(self, output_folder):
+        se.SortingExtractor.__init__(self)
+        store_folder = Path(output_folder) / compact_store_name
+        with open(str(store_folder / 'sorting.json'), 'r', encoding='utf8') as f:
+            info = json.load(f)
+        self._spike_frames = np.load(str(store_folder / 'spike_frames.npy'), mmap_mode='r')
+        self._unit_indices = np.load(str(store_folder / 'unit_indices.npy'), mmap_mode='r')
+        self._unit_ids = [int(unit_id) for unit_id in np.load(str(store_folder / 'unit_ids.npy'))]
+        self._unit_index = {unit_id: i for i, unit_id in enumerate(self._unit_ids)}
+        self._sampling_frequency = info['sampling_frequency']
+        # spikes ordered by unit (then by frame), computed on the first spike train request
+        self._unit_order = None
+        self._unit_bounds = None
+        for unit_id in self._unit_ids:
+            for name, value in info['unit_properties'].get(str(unit_id), {}).items():
+                self.set_unit_property(unit_id, name, value)
+        self._kwargs = {'output_folder': str(Path(output_folder).absolute())}
+
+    def get_unit_ids(self):
+        return list(self._unit_ids)
+
+    def _get_unit_order(self):
+        if self._unit_order is None:
+            self._unit_order = np.argsort(self._unit_indices, kind='stable')
+            self._unit_bounds = np.searchsorted(self._unit_indices[self._unit_order],
+                                                np.arange(len(self._unit_ids) + 1))
+        return self._unit_order, self._unit_bounds
+
+    @check_get_unit_spike_train
+    def get_unit_spike_train(self, unit_id, start_frame=None, end_frame=None):
+        order, bounds = self._get_unit_order()
+        i = self._unit_index[unit_id]
+        spike_frames = self._spike_frames[order[bounds[i]:bounds[i + 1]]]
+        first, last = np.searchsorted(spike_frames, [start_frame, end_frame])
+        return np.array(spike_frames[first:last], dtype='int64')
+
+    @staticmethod
+    def write_sorting(sorting, save_path):
+        write_compact_sorting(sorting, save_path)
+
+
+def compact_sorting_output(sorter_name_or_class, output_folder):
+    """
+    Converts the native output of a sorter to the compact store (e.g. for outputs of previous runs).
+
+    Parameters
+    ----------
+    sorter_name_or_class: str or SorterClass
+        The sorter of the output
+    output_folder: str or Path
+        The output folder of the sorter (of one group)
+    """
+    from .sorterlist import _get_sorter_class
+    SorterClass = _get_sorter_class(sorter_name_or_class)
+    sorting = SorterClass.get_native_result_from_folder(output_folder)
+    write_compact_sorting(sorting, output_folder)
@@ -0,0 +1,191 @@
+"""
+Execution of the MATLAB sorters compiled with the MATLAB Compiler (mcc) as standalone applications, which run on the
+free MATLAB Runtime (MCR) instead of a licensed MATLAB: no license, no MATLAB startup and no .m source rendering.
+
+The compiled entry points take their inputs as files written by the wrappers, e.g. for Kilosort2:
+
+    mcc -m spikesorters/kilosort2/kilosort2_compiled.m -a /path/to/Kilosort2 -a spikesorters/utils -d /path/to/ks2_mcr
+
+and the wrapper runs 'run_kilosort2_compiled.sh <MCR root> kilosort2_ops.json' in the output folder, where
+kilosort2_ops.json holds the options (ops) of kilosort2_config.m and chanMap.mat the channel map. The wrappers use
+the compiled application when its path is set (e.g. KILOSORT2_COMPILED_PATH or Kilosort2Sorter.set_compiled_path()).
+The MATLAB Runtime folder is given by the MCR_ROOT environment variable or set_mcr_root().
+"""
+import os
+import re
+import sys
+import shlex
+from pathlib import Path
+
+import numpy as np
+
+mcr_root = os.getenv('MCR_ROOT', None)
+
+
+def set_mcr_root(path):
+    """
+    Sets the folder of the MATLAB Runtime used by the run_<name>.sh launchers of the compiled sorters.
+
+    Parameters
+    ----------
+    path: str or Path
+        The MATLAB Runtime folder (e.g. /usr/local/MATLAB/MATLAB_Runtime/v98)
+    """
+    global mcr_root
+    mcr_root = str(Path(path).absolute())
+    os.environ['MCR_ROOT'] = mcr_root
+
+
+def get_mcr_root():
+    """
+    Returns the folder of the MATLAB Runtime (None if not set).
+    """
+    return mcr_root
+
+
+def find_compiled_executable(compiled_path, entry_name):
+    """
+    Finds the compiled application of an entry point.
+
+    Parameters
+    ----------
+    compiled_path: str, Path or None
+        The mcc output folder, or the application (or its run_<entry_name>.sh launcher) itself
+    entry_name: str
+        The name of the compiled entry point (e.g. 'kilosort2_compiled')
+
+    Returns
+    -------
+    executable: Path or None
+        The run_<entry_name>.sh launcher (preferred on linux and macOS) or the application, None if not found
+    """
+    if compiled_path is None:
+        return None
+    compiled_path = Path(str(compiled_path).strip('"'))
+    if compiled_path.is_file():
+        return compiled_path
+    if not compiled_path.is_dir():
+        return None
+    if sys.platform.startswith('win'):
+        candidates = [entry_name + '.exe']
+    else:
+        candidates = ['run_' + entry_name + '.sh', entry_name]
+    for candidate in candidates:
+        if (compiled_path / candidate).is_file():
+            return compiled_path / candidate
+    return None
+
+
+def get_compiled_command(executable, args):
+    """
+    Returns the shell command running a compiled application with string arguments.
+
+    Parameters
+    ----------
+    executable: str or Path
+        The application or its run_<entry_name>.sh launcher (see find_compiled_executable())
+    args: list
+        The arguments of the entry point
+
+    Returns
+    -------
+    command: str
+        The command line
+    """
+    executable = Path(executable)
+    if sys.platform.startswith('win'):
+        return ' '.join(f'"{arg}"' for arg in [executable] + list(args))
+    cmd_args = [str(executable)]
+    if executable.name.startswith('run_') and executable.suffix == '.sh':
+        # the mcc launchers take the MATLAB Runtime folder as first argument
+        if mcr_root is None:
+            raise RuntimeError(f"{executable.name} needs the MATLAB Runtime folder: set the MCR_ROOT environment "
+                               f"variable or use spikesorters.set_mcr_root()")
+        cmd_args.append(mcr_root)
+    return ' '.join(shlex.quote(str(arg)) for arg in cmd_args + list(args))
+
+
+_assignment_re = re.compile(r"^\s*ops\.(\w+)\s*=\s*(.*?)\s*;")
+_fullfile_re = re.compile(r"^fullfile\((.*)\)$")
+
+
+def _parse_matlab_value(expr, variables):
+    expr = expr.strip()
+    if len(expr) >= 2 and expr[0] == "'" and expr[-1] == "'" and "'" not in expr[1:-1]:
+        return expr[1:-1]
+    if expr in variables:
+        return variables[expr]
+    m = _fullfile_re.match(expr)
+    if m is not None:
+        parts = [_parse_matlab_value(part, variables) for part in m.group(1).split(',')]
+        if not all(isinstance(part, str) for part in parts):
+            raise ValueError(f'Unsupported MATLAB expression: {expr}')
+        return os.path.join(*parts)
+    if expr.startswith('[') and expr.endswith(']'):
+        return [_parse_matlab_value(e, variables) for e in expr[1:-1].replace(',', ' ').split()]
+    if expr in ('true', 'false'):
+        return expr == 'true'
+    try:
+        value = float(expr)
+    except ValueError:
+        raise ValueError(f'Unsupported MATLAB expression: {expr}')
+    return int(value) if value.is_integer() and re.match(r'^-?\d+$', expr) else value
+
+
+def ops_from_matlab_config(config_txt, variables=None):
+    """
+    Converts a rendered Kilosort configuration file (e.g. kilosort2_config.m) to the dictionary of the ops.
+
+    Only the assignments of literals are supported ('ops.X = value;' with numbers, strings, vectors of numbers,
+    the given variables and fullfile() of those), so that the compiled sorters get the same ops as the scripted ones.
+
+    Parameters
+    ----------
+    config_txt: str
+        The configuration file
+    variables: dict or None
+        The values of the variables used in the file (e.g. {'fpath': '/path/to/output_folder'})
+
+    Returns
+    -------
+    ops: dict
+        The ops, JSON serializable
+    """
+    variables = {} if variables is None else variables
+    ops = {}
+    for line in config_txt.splitlines():
+        m = _assignment_re.match(line)
+        if m is None:
+            if line.strip().startswith('ops.'):
+                raise ValueError(f'Unsupported line in the configuration file: {line}')
+            continue
+        ops[m.group(1)] = _parse_matlab_value(m.group(2), variables)
+    return ops
+
+
+def write_kilosort_channel_map(file_path, xcoords, ycoords, kcoords, sample_rate):
+    """
+    Writes the chanMap.mat of Kilosort (what the rendered *_channelmap.m scripts save).
+
+    Parameters
+    ----------
+    file_path: str or Path
+        The .mat file
+    xcoords, ycoords: list
+        The coordinates of the channels
+    kcoords: list
+        The group of the channels
+    sample_rate: float
+        The sampling frequency
+    """
+    from scipy.io import savemat
+
+    num_channels = len(xcoords)
+    chan_map = np.arange(1, num_channels + 1, dtype='float64').reshape(1, -1)
+    savemat(str(file_path), {'chanMap': chan_map,
+                             'connected': np.ones((num_channels, 1), dtype='bool'),
+                             'xcoords': np.array(xcoords, dtype='float64').reshape(1, -1),
+                             'ycoords': np.array(ycoords, dtype='float64').reshape(1, -1),
+                             'kcoords': np.array(kcoords, dtype='float64').reshape(1, -1),
+                             'chanMap0ind': chan_map - 1,
+                             'fs': float(sample_rate)})
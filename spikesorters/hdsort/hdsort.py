@@ -3,10 +3,12 @@ import os
 from typing import Union
 import numpy as np
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import spikeextractors as se
 from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
+from ..matlab_sessions import get_matlab_session_pool
 from ..sorter_tools import recover_recording
 
 PathType = Union[str, Path]
@@ -26,6 +28,66 @@ def check_if_installed(hdsort_path: Union[str, None]):
         return False
 
 
+def write_mea1k_traces(recording, signal, frame_numbers=None, chunk_size=None, chunk_mb=500, n_jobs=1,
+                       verbose=False):
+    """
+    Fills the (num_channels, num_frames) 'signal' h5 dataset, and optionally the 'frame_numbers' dataset,
+    chunk by chunk.
+
+    With n_jobs > 1, the traces of the next chunks are read by a pool of threads while the current chunk
+    is written, and the chunk size is divided by n_jobs so that the memory usage stays around chunk_mb.
+    The chunks are always written in order by the calling thread (h5py does not support concurrent writes).
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to write
+    signal: h5py.Dataset
+        The dataset of shape (num_channels, num_frames)
+    frame_numbers: h5py.Dataset or None
+        The dataset of shape (num_frames,) filled with the frame indices
+    chunk_size: None or int
+        Size of each chunk in number of frames. If None, it is computed from chunk_mb
+    chunk_mb: int
+        Chunk size in Mb
+    n_jobs: int
+        Number of threads reading the traces
+    verbose: bool
+        If True, output is verbose
+    """
+    num_channels = recording.get_num_channels()
+    num_frames = recording.get_num_frames()
+    n_jobs = max(int(n_jobs), 1)
+    if chunk_size is None:
+        n_bytes = np.dtype(recording.get_dtype()).itemsize
+        chunk_size = int(chunk_mb * 1e6) // (num_channels * n_bytes * n_jobs)
+    chunk_size = max(int(chunk_size), 1)
+    n_chunk = num_frames // chunk_size + int(num_frames % chunk_size > 0)
+    chunk_limits = [(i * chunk_size, min((i + 1) * chunk_size, num_frames)) for i in range(n_chunk)]
+
+    def _write_chunk(i, traces):
+        start_frame, end_frame = chunk_limits[i]
+        signal[:, start_frame:end_frame] = traces
+        if frame_numbers is not None:
+            frame_numbers[start_frame:end_frame] = np.arange(start_frame, end_frame, dtype=frame_numbers.dtype)
+        if verbose:
+            print(f'Written chunk {i + 1}/{n_chunk}')
+
+    if n_jobs == 1:
+        for i, (start_frame, end_frame) in enumerate(chunk_limits):
+            _write_chunk(i, recording.get_traces(start_frame=start_frame, end_frame=end_frame))
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            # at most n_jobs chunks are read ahead
+            futures = []
+            for i, (start_frame, end_frame) in enumerate(chunk_limits):
+                futures.append(executor.submit(recording.get_traces, start_frame=start_frame, end_frame=end_frame))
+                if len(futures) == n_jobs:
+                    _write_chunk(i - n_jobs + 1, futures.pop(0).result())
+            for j, future in enumerate(futures):
+                _write_chunk(n_chunk - len(futures) + j, future.result())
+
+
 class HDSortSorter(BaseSorter):
     """
     """
@@ -33,6 +95,9 @@ class HDSortSorter(BaseSorter):
     sorter_name: str = 'hdsort'
     hdsort_path: Union[str, None] = os.getenv('HDSORT_PATH', None)
     requires_locations = False
+    resource_footprint = {'cores': 1, 'ram_mb_per_channel_hour': 800., 'scratch_mb_per_channel_hour': 300.,
+                          'licenses': {'matlab': 1}}
+    runs_external_process = True
     _default_params = {
         'detect_threshold': 4.2,
         'detect_sign': -1,  # -1 - 1
@@ -47,7 +112,8 @@ class HDSortSorter(BaseSorter):
         'n_pc_dims': 6,
         'chunk_size': 500000,
         'loop_mode': 'local_parfor',
-        'chunk_mb': 500
+        'chunk_mb': 500,
+        'n_jobs_bin': 1
     }
 
     _params_description = {
@@ -66,6 +132,7 @@ class HDSortSorter(BaseSorter):
         'chunk_size': "Chunk size in number of frames for template-matching",
         'loop_mode': "Loop mode: 'loop', 'local_parfor', 'grid' (requires a grid architecture)",
         'chunk_mb': "Chunk size in Mb for saving to binary format (default 500Mb)",
+        'n_jobs_bin': "Number of jobs for saving to binary format (Default 1)"
     }
 
     sorter_description = """HDSort is a template-matching spike sorter designed for high density micro-electrode arrays. 
@@ -120,7 +187,8 @@ class HDSortSorter(BaseSorter):
         else:
             file_name = output_folder / 'recording.h5'
             # Generate three files dataset in Mea1k format
-            self.write_hdsort_input_format(recording, save_path=str(file_name), chunk_mb=self.params["chunk_mb"])
+            self.write_hdsort_input_format(recording, save_path=str(file_name), chunk_mb=self.params["chunk_mb"],
+                                           n_jobs=self.params["n_jobs_bin"])
             self.params['file_format'] = 'mea1k'
 
         p = self.params
@@ -183,24 +251,29 @@ class HDSortSorter(BaseSorter):
             print("Warning! The recording is already filtered, but HDsort filter is enabled. You can disable "
                   "filters by setting 'filter' parameter to False")
 
-        if "win" in sys.platform and sys.platform != 'darwin':
-            shell_cmd = '''
-                        {disk_move}
-                        cd {tmpdir}
-                        matlab -nosplash -wait -r hdsort_master
-                    '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder)
+        matlab_pool = get_matlab_session_pool()
+        if matlab_pool is not None:
+            retcode = matlab_pool.run_script(output_folder / 'hdsort_master.m',
+                                             log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
         else:
-            shell_cmd = '''
-                        #!/bin/bash
-                        cd "{tmpdir}"
-                        matlab -nosplash -nodisplay -r hdsort_master
-                    '''.format(tmpdir=output_folder)
-
-        shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
-                                   log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
-        shell_script.start()
-
-        retcode = shell_script.wait()
+            if "win" in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                            {disk_move}
+                            cd {tmpdir}
+                            matlab -nosplash -wait -r hdsort_master
+                        '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder)
+            else:
+                shell_cmd = '''
+                            #!/bin/bash
+                            cd "{tmpdir}"
+                            matlab -nosplash -nodisplay -r hdsort_master
+                        '''.format(tmpdir=output_folder)
+
+            shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                       log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_script.start()
+
+            retcode = shell_script.wait()
 
         if retcode != 0:
             raise Exception('HDsort returned a non-zero exit code')
@@ -218,7 +291,7 @@ class HDSortSorter(BaseSorter):
 
         return sorting
 
-    def write_hdsort_input_format(self, recording, save_path, chunk_size=None, chunk_mb=500):
+    def write_hdsort_input_format(self, recording, save_path, chunk_size=None, chunk_mb=500, n_jobs=1):
         try:
             import h5py
         except:
@@ -251,7 +324,11 @@ class HDSortSorter(BaseSorter):
                 f.create_dataset('version', data=str(20161003))
                 ephys = f['ephys']
                 ephys.create_dataset('frame_rate', data=recording.get_sampling_frequency())
-                ephys.create_dataset('frame_numbers', data=np.arange(recording.get_num_frames()))
+                # frame numbers are filled chunk by chunk with the traces (and compress very well)
+                num_frames = recording.get_num_frames()
+                frame_numbers = ephys.create_dataset('frame_numbers', shape=(num_frames,), dtype='int64',
+                                                     chunks=(min(max(num_frames, 1), 2 ** 18),),
+                                                     shuffle=True, compression='gzip')
                 # save mapping
                 mapping = np.empty(recording.get_num_channels(), dtype=mapping_dtype)
                 x = recording.get_channel_locations()[:, 0]
@@ -260,7 +337,9 @@ class HDSortSorter(BaseSorter):
                     mapping[i] = (ch, x[i], y[i], ch)
                 ephys.create_dataset('mapping', data=mapping)
                 # save traces
-                recording.write_to_h5_dataset_format('/ephys/signal', file_handle=f, time_axis=1,
-                                                     chunk_size=chunk_size, chunk_mb=chunk_mb)
+                signal = ephys.create_dataset('signal', shape=(recording.get_num_channels(), num_frames),
+                                              dtype=recording.get_dtype())
+                write_mea1k_traces(recording, signal, frame_numbers=frame_numbers, chunk_size=chunk_size,
+                                   chunk_mb=chunk_mb, n_jobs=n_jobs, verbose=self.verbose)
             self.params['file_name'] = str(save_path.absolute())
 
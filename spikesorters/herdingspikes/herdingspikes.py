@@ -1,18 +1,13 @@
 from pathlib import Path
 import copy
+import time
 
+import numpy as np
 import spikeextractors as se
-import spiketoolkit as st
 
 from ..basesorter import BaseSorter
 from ..sorter_tools import recover_recording
 
-try:
-    import herdingspikes as hs
-    HAVE_HS = True
-except ImportError:
-    HAVE_HS = False
-
 
 class HerdingspikesSorter(BaseSorter):
 
@@ -20,6 +15,9 @@ class HerdingspikesSorter(BaseSorter):
     
     requires_locations = True
     compatible_with_parallel = {'loky': True, 'multiprocessing': True, 'threading': False}
+    resumable_setup = False  # the probe is built in memory by _setup_recording
+    resource_footprint = {'cores': 'clustering_n_jobs', 'ram_mb_per_channel_hour': 500.,
+                          'scratch_mb_per_channel_hour': 100., 'licenses': {}}
     _default_params = {
         # core params
         'clustering_bandwidth': 5.5,  # 5.0,
@@ -129,14 +127,22 @@ class HerdingspikesSorter(BaseSorter):
     
     @classmethod
     def is_installed(cls):
+        try:
+            import herdingspikes as hs
+            HAVE_HS = True
+        except ImportError:
+            HAVE_HS = False
         return HAVE_HS
     
     @staticmethod
     def get_sorter_version():
+        import herdingspikes as hs
         return hs.__version__
 
     def _setup_recording(self, recording, output_folder):
-        
+        import herdingspikes as hs
+        import spiketoolkit as st
+
         p = self.params
 
         # Bandpass filter
@@ -160,6 +166,7 @@ class HerdingspikesSorter(BaseSorter):
             peak_jitter=p['probe_peak_jitter'])
 
     def _run(self, recording, output_folder):
+        import herdingspikes as hs
         recording = recover_recording(recording)
         p = self.params
 
@@ -183,9 +190,12 @@ class HerdingspikesSorter(BaseSorter):
             spk_evaluation_time=p['spk_evaluation_time']
         )
 
+        t0 = time.perf_counter()
         self.H.DetectFromRaw(load=True, tInc=int(p['t_inc']))
+        self._add_backend_stage(output_folder, 'detection', time.perf_counter() - t0)
 
         sorted_file = str(output_folder / 'HS2_sorted.hdf5')
+        t0 = time.perf_counter()
         if(not self.H.spikes.empty):
             self.C = hs.HSClustering(self.H)
             self.C.ShapePCA(pca_ncomponents=p['pca_ncomponents'],
@@ -200,16 +210,49 @@ class HerdingspikesSorter(BaseSorter):
             )
         else:
             self.C = hs.HSClustering(self.H)
+        self._add_backend_stage(output_folder, 'clustering', time.perf_counter() - t0)
 
         if p['filter_duplicates']:
-            uids = self.C.spikes.cl.unique()
-            for u in uids:
-                s = self.C.spikes[self.C.spikes.cl==u].t.diff()<p['spk_evaluation_time']/1000*self.Probe.fps
-                self.C.spikes = self.C.spikes.drop(s.index[s])
-            
+            duplicates = get_duplicate_spike_mask(self.C.spikes.cl.values, self.C.spikes.t.values,
+                                                  p['spk_evaluation_time'] / 1000 * self.Probe.fps)
+            self.C.spikes = self.C.spikes[~duplicates]
+
         print('Saving to', sorted_file)
         self.C.SaveHDF5(sorted_file, sampling=self.Probe.fps)
 
     @staticmethod
     def get_result_from_folder(output_folder):
         return se.HS2SortingExtractor(file_path=Path(output_folder) / 'HS2_sorted.hdf5', load_unit_info=True)
+
+
+def get_duplicate_spike_mask(cluster_labels, spike_times, min_interval):
+    """
+    Returns the boolean mask of the duplicate spikes: the spikes closer than 'min_interval' to the previous
+    spike (in the order of the table) of the same cluster. The previous spike is taken before any removal,
+    so that a burst of duplicates is reduced to its first spike.
+
+    Parameters
+    ----------
+    cluster_labels: np.array
+        The cluster of each spike
+    spike_times: np.array
+        The time (in frames) of each spike
+    min_interval: float
+        The minimum interval (in frames) between two spikes of a cluster
+
+    Returns
+    -------
+    duplicates: np.array
+        Boolean mask, True for the spikes to remove
+    """
+    cluster_labels = np.asarray(cluster_labels)
+    spike_times = np.asarray(spike_times)
+    duplicates = np.zeros(spike_times.size, dtype=bool)
+    if spike_times.size < 2:
+        return duplicates
+    # stable sort by cluster: the spikes of a cluster stay in the order of the table
+    order = np.argsort(cluster_labels, kind='stable')
+    same_cluster = cluster_labels[order][1:] == cluster_labels[order][:-1]
+    close = np.diff(spike_times[order]) < min_interval
+    duplicates[order[1:]] = same_cluster & close
+    return duplicates
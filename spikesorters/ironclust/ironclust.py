@@ -7,6 +7,8 @@ import sys
 import spikeextractors as se
 
 from ..utils.shellscript import ShellScript
+from ..matlab_sessions import get_matlab_session_pool
+from ..compiled_matlab import find_compiled_executable, get_compiled_command
 from ..basesorter import BaseSorter
 from ..sorter_tools import recover_recording
 
@@ -34,8 +36,12 @@ class IronClustSorter(BaseSorter):
 
     sorter_name: str = 'ironclust'
     ironclust_path: Union[str, None] = os.getenv('IRONCLUST_PATH', None)
+    compiled_path: Union[str, None] = os.getenv('IRONCLUST_COMPILED_PATH', None)
     
     requires_locations = True
+    resource_footprint = {'cores': 1, 'ram_mb_per_channel_hour': 800., 'scratch_mb_per_channel_hour': 450.,
+                          'licenses': {'matlab': 1}}
+    runs_external_process = True
 
     _default_params = {
         'detect_sign': -1,  # Use -1, 0, or 1, depending on the sign of the spikes in the recording
@@ -120,6 +126,10 @@ class IronClustSorter(BaseSorter):
         >>> git clone https://github.com/flatironinstitute/ironclust
     and provide the installation path by setting the IRONCLUST_PATH
     environment variables or using IronClustSorter.set_ironclust_path().\n\n
+    Alternatively, p_ironclust.m compiled with the MATLAB Compiler (mcc -m p_ironclust.m -a ironclust/matlab)
+    runs on the free MATLAB Runtime: provide the compiled application by setting the IRONCLUST_COMPILED_PATH
+    environment variable or using IronClustSorter.set_compiled_path(), and the MATLAB Runtime folder with the
+    MCR_ROOT environment variable.
     """
 
     def __init__(self, **kargs):
@@ -127,10 +137,16 @@ class IronClustSorter(BaseSorter):
     
     @classmethod
     def is_installed(cls):
-        return check_if_installed(cls.ironclust_path)
+        return check_if_installed(cls.ironclust_path) or cls.is_compiled()
+
+    @classmethod
+    def is_compiled(cls):
+        return find_compiled_executable(cls.compiled_path, 'p_ironclust') is not None
 
     @staticmethod
     def get_sorter_version():
+        if 'IRONCLUST_PATH' not in os.environ and IronClustSorter.is_compiled():
+            return 'compiled'
         version_filename = Path(os.environ["IRONCLUST_PATH"]) / 'matlab' / 'version.txt'
         if version_filename.is_file():
             with open(str(version_filename), mode='r', encoding='utf8') as f:
@@ -151,6 +167,16 @@ class IronClustSorter(BaseSorter):
         except Exception as e:
             print("Could not set IRONCLUST_PATH environment variable:", e)
 
+    @staticmethod
+    def set_compiled_path(compiled_path: PathType):
+        compiled_path = str(Path(compiled_path).absolute())
+        IronClustSorter.compiled_path = compiled_path
+        try:
+            print("Setting IRONCLUST_COMPILED_PATH environment variable for subprocess calls to:", compiled_path)
+            os.environ["IRONCLUST_COMPILED_PATH"] = compiled_path
+        except Exception as e:
+            print("Could not set IRONCLUST_COMPILED_PATH environment variable:", e)
+
     def _setup_recording(self, recording: se.RecordingExtractor, output_folder: Path):
         p = self.params
         if not self.is_installed():
@@ -210,24 +236,50 @@ class IronClustSorter(BaseSorter):
         matlab_cmd = ShellScript(cmd, script_path=str(tmpdir / 'run_ironclust.m'))
         matlab_cmd.write()
 
-        if 'win' in sys.platform and sys.platform != 'darwin':
-            shell_cmd = '''
-                {disk_move}
-                cd {tmpdir}
-                matlab -nosplash -wait -log -r run_ironclust
-            '''.format(disk_move=str(tmpdir)[:2], tmpdir=tmpdir)
+        matlab_pool = get_matlab_session_pool()
+        if self.is_compiled():
+            # the compiled p_ironclust runs on the MATLAB Runtime, out of the matlab sessions
+            command = get_compiled_command(find_compiled_executable(self.compiled_path, 'p_ironclust'),
+                                           [str(tmpdir), str(dataset_dir / 'raw.mda'), str(dataset_dir / 'geom.csv'),
+                                            '', '', str(tmpdir / 'firings.mda'), str(dataset_dir / 'argfile.txt')])
+            if 'win' in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                    {disk_move}
+                    cd {tmpdir}
+                    {command}
+                '''.format(disk_move=str(tmpdir)[:2], tmpdir=tmpdir, command=command)
+            else:
+                shell_cmd = '''
+                    #!/bin/bash
+                    cd "{tmpdir}"
+                    {command}
+                '''.format(tmpdir=tmpdir, command=command)
+            shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                       log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_script.start()
+            retcode = shell_script.wait()
+        elif matlab_pool is not None:
+            retcode = matlab_pool.run_script(tmpdir / 'run_ironclust.m',
+                                             log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
         else:
-            shell_cmd = '''
-                #!/bin/bash
-                cd "{tmpdir}"
-                matlab -nosplash -nodisplay -log -r run_ironclust
-            '''.format(tmpdir=tmpdir)
-
-        shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
-                                   log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
-        shell_script.start()
-
-        retcode = shell_script.wait()
+            if 'win' in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                    {disk_move}
+                    cd {tmpdir}
+                    matlab -nosplash -wait -log -r run_ironclust
+                '''.format(disk_move=str(tmpdir)[:2], tmpdir=tmpdir)
+            else:
+                shell_cmd = '''
+                    #!/bin/bash
+                    cd "{tmpdir}"
+                    matlab -nosplash -nodisplay -log -r run_ironclust
+                '''.format(tmpdir=tmpdir)
+
+            shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                       log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_script.start()
+
+            retcode = shell_script.wait()
 
         if retcode != 0:
             raise Exception('ironclust returned a non-zero exit code')
@@ -9,7 +9,9 @@ import numpy as np
 import spikeextractors as se
 from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
-from ..sorter_tools import get_git_commit, recover_recording
+from ..matlab_sessions import get_matlab_session_pool
+from ..sorter_tools import get_git_commit, recover_recording, get_bindat_passthrough_path
+from ..resource_estimation import estimate_kilosort_resources
 
 PathType = Union[str, Path]
 
@@ -37,6 +39,8 @@ class KilosortSorter(BaseSorter):
     kilosort_path: Union[str, None] = os.getenv('KILOSORT_PATH', None)
     
     requires_locations = False
+    resource_footprint = {'cores': 1, 'licenses': {'matlab': 1}}
+    runs_external_process = True
     
     _default_params = {
         'detect_threshold': 6,
@@ -101,6 +105,10 @@ class KilosortSorter(BaseSorter):
         except Exception as e:
             print("Could not set KILOSORT_PATH environment variable:", e)
 
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        return estimate_kilosort_resources(recording, params['NT'], params['ntbuff'])
+
     def _setup_recording(self, recording, output_folder):
         source_dir = Path(__file__).parent
         p = self.params
@@ -114,10 +122,13 @@ class KilosortSorter(BaseSorter):
         if positions.shape[1] != 2:
             raise RuntimeError("3D 'location' are not supported. Set 2D locations instead")
 
-        # save binary file
-        input_file_path = output_folder / 'recording'
-        recording.write_to_binary_dat_format(input_file_path, dtype='int16', chunk_mb=p["chunk_mb"],
-                                             n_jobs=p["n_jobs_bin"], verbose=self.verbose)
+        # save binary file (no copy when the recording is already an int16 binary file)
+        input_file_path = get_bindat_passthrough_path(recording, dtype='int16')
+        if input_file_path is None:
+            input_file_path = self._write_binary_recording(recording, output_folder / 'recording', dtype='int16',
+                                                           chunk_mb=p["chunk_mb"], n_jobs=p["n_jobs_bin"])
+        elif self.verbose:
+            print('Using the raw file directly:', input_file_path)
 
         # set up kilosort config files and run kilosort on data
         with (source_dir / 'kilosort_master.m').open('r') as f:
@@ -164,7 +175,7 @@ class KilosortSorter(BaseSorter):
             nchanTOT=recording.get_num_channels(),
             nchan=recording.get_num_channels(),
             sample_rate=recording.get_sampling_frequency(),
-            dat_file=str((output_folder / 'recording.dat').absolute()),
+            dat_file=str(input_file_path.absolute()),
             Nfilt=int(p['Nfilt']),
             ntbuff=int(p['ntbuff']),
             NT=int(p['NT']),
@@ -194,23 +205,28 @@ class KilosortSorter(BaseSorter):
 
     def _run(self, recording, output_folder):
         recording = recover_recording(recording)
-        if 'win' in sys.platform and sys.platform != 'darwin':
-            shell_cmd = '''
-                        {disk_move}
-                        cd {tmpdir}
-                        matlab -nosplash -wait -log -r kilosort_master
-                    '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder)
+        matlab_pool = get_matlab_session_pool()
+        if matlab_pool is not None:
+            retcode = matlab_pool.run_script(output_folder / 'kilosort_master.m',
+                                             log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
         else:
-            shell_cmd = '''
-                        #!/bin/bash
-                        cd "{tmpdir}"
-                        matlab -nosplash -nodisplay -log -r kilosort_master
-                    '''.format(tmpdir=output_folder)
-        shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
-                                   log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
-        shell_script.start()
-
-        retcode = shell_script.wait()
+            if 'win' in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                            {disk_move}
+                            cd {tmpdir}
+                            matlab -nosplash -wait -log -r kilosort_master
+                        '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder)
+            else:
+                shell_cmd = '''
+                            #!/bin/bash
+                            cd "{tmpdir}"
+                            matlab -nosplash -nodisplay -log -r kilosort_master
+                        '''.format(tmpdir=output_folder)
+            shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                       log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_script.start()
+
+            retcode = shell_script.wait()
 
         if retcode != 0:
             raise Exception('kilosort returned a non-zero exit code')
@@ -14,15 +14,22 @@ try
     run(fullfile('{config_path}'))
 
     % This part runs the normal Kilosort processing on the simulated data
+    % the duration of each step is printed for the profile of spikeinterface_log.json
+    t_stage = tic;
     [rez, DATA, uproj] = preprocessData(ops); % preprocess data and extract spikes for initialization
+    fprintf('spikesorters_stage preprocessData %.3f\n', toc(t_stage)); t_stage = tic;
     rez                = fitTemplates(rez, DATA, uproj);  % fit templates iteratively
+    fprintf('spikesorters_stage fitTemplates %.3f\n', toc(t_stage)); t_stage = tic;
     rez                = fullMPMU(rez, DATA);% extract final spike times (overlapping extraction)
+    fprintf('spikesorters_stage fullMPMU %.3f\n', toc(t_stage)); t_stage = tic;
 
     rez = merge_posthoc2(rez);
+    fprintf('spikesorters_stage merge_posthoc2 %.3f\n', toc(t_stage)); t_stage = tic;
     fprintf('merge_posthoc2 error. Reporting pre-merge result\n');
 
     % save python results file for Phy
     rezToPhy(rez, fullfile(fpath));
+    fprintf('spikesorters_stage rezToPhy %.3f\n', toc(t_stage)); t_stage = tic;
 catch
     fprintf('----------------------------------------');
     fprintf(lasterr());
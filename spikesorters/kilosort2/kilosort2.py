@@ -9,7 +9,11 @@ import json
 import spikeextractors as se
 from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
-from ..sorter_tools import get_git_commit, recover_recording
+from ..matlab_sessions import get_matlab_session_pool
+from ..compiled_matlab import (find_compiled_executable, get_compiled_command, ops_from_matlab_config,
+                               write_kilosort_channel_map)
+from ..sorter_tools import get_git_commit, recover_recording, get_bindat_passthrough_path
+from ..resource_estimation import estimate_kilosort_resources
 
 PathType = Union[str, Path]
 
@@ -35,7 +39,10 @@ class Kilosort2Sorter(BaseSorter):
 
     sorter_name: str = 'kilosort2'
     kilosort2_path: Union[str, None] = os.getenv('KILOSORT2_PATH', None)
+    compiled_path: Union[str, None] = os.getenv('KILOSORT2_COMPILED_PATH', None)
     requires_locations = False
+    resource_footprint = {'cores': 1, 'licenses': {'matlab': 1}}
+    runs_external_process = True
 
     _default_params = {
         'detect_threshold': 6,
@@ -81,6 +88,9 @@ class Kilosort2Sorter(BaseSorter):
         >>> git clone https://github.com/MouseLand/Kilosort2
     and provide the installation path by setting the KILOSORT2_PATH
     environment variables or using Kilosort2Sorter.set_kilosort2_path().\n\n
+    Alternatively, Kilosort2 compiled with the MATLAB Compiler (see kilosort2_compiled.m) runs on the free
+    MATLAB Runtime: provide the compiled application by setting the KILOSORT2_COMPILED_PATH environment variable
+    or using Kilosort2Sorter.set_compiled_path(), and the MATLAB Runtime folder with the MCR_ROOT environment variable.
 
     More information on Kilosort2 at:
         https://github.com/MouseLand/Kilosort2
@@ -91,13 +101,17 @@ class Kilosort2Sorter(BaseSorter):
 
     @classmethod
     def is_installed(cls):
-        return check_if_installed(cls.kilosort2_path)
+        return check_if_installed(cls.kilosort2_path) or cls.is_compiled()
+
+    @classmethod
+    def is_compiled(cls):
+        return find_compiled_executable(cls.compiled_path, 'kilosort2_compiled') is not None
 
     @staticmethod
     def get_sorter_version():
         commit = get_git_commit(os.getenv('KILOSORT2_PATH', None))
         if commit is None:
-            return 'unknown'
+            return 'compiled' if Kilosort2Sorter.is_compiled() else 'unknown'
         else:
             return 'git-' + commit
 
@@ -111,6 +125,20 @@ class Kilosort2Sorter(BaseSorter):
         except Exception as e:
             print("Could not set KILOSORT2_PATH environment variable:", e)
 
+    @staticmethod
+    def set_compiled_path(compiled_path: PathType):
+        compiled_path = str(Path(compiled_path).absolute())
+        Kilosort2Sorter.compiled_path = compiled_path
+        try:
+            print("Setting KILOSORT2_COMPILED_PATH environment variable for subprocess calls to:", compiled_path)
+            os.environ["KILOSORT2_COMPILED_PATH"] = compiled_path
+        except Exception as e:
+            print("Could not set KILOSORT2_COMPILED_PATH environment variable:", e)
+
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        return estimate_kilosort_resources(recording, params['NT'], params['ntbuff'])
+
     def _setup_recording(self, recording, output_folder):
         source_dir = Path(Path(__file__).parent)
         p = self.params
@@ -124,10 +152,13 @@ class Kilosort2Sorter(BaseSorter):
         if positions.shape[1] != 2:
             raise RuntimeError("3D 'location' are not supported. Set 2D locations instead")
 
-        # save binary file
-        input_file_path = output_folder / 'recording.dat'
-        recording.write_to_binary_dat_format(input_file_path, dtype='int16', chunk_mb=p["chunk_mb"],
-                                             n_jobs=p["n_jobs_bin"], verbose=self.verbose)
+        # save binary file (no copy when the recording is already an int16 binary file)
+        input_file_path = get_bindat_passthrough_path(recording, dtype='int16')
+        if input_file_path is None:
+            input_file_path = self._write_binary_recording(recording, output_folder / 'recording.dat', dtype='int16',
+                                                           chunk_mb=p["chunk_mb"], n_jobs=p["n_jobs_bin"])
+        elif self.verbose:
+            print('Using the raw file directly:', input_file_path)
 
         if p['car']:
             use_car = 1
@@ -143,15 +174,6 @@ class Kilosort2Sorter(BaseSorter):
             kilosort2_channelmap_txt = f.read()
 
         # make substitutions in txt files
-        kilosort2_master_txt = kilosort2_master_txt.format(
-            kilosort2_path=str(
-                Path(Kilosort2Sorter.kilosort2_path).absolute()),
-            output_folder=str(output_folder),
-            channel_path=str(
-                (output_folder / 'kilosort2_channelmap.m').absolute()),
-            config_path=str((output_folder / 'kilosort2_config.m').absolute()),
-        )
-
         if p['NT'] is None:
             p['NT'] = 64 * 1024 + p['ntbuff']
         else:
@@ -160,7 +182,7 @@ class Kilosort2Sorter(BaseSorter):
         kilosort2_config_txt = kilosort2_config_txt.format(
             nchan=recording.get_num_channels(),
             sample_rate=recording.get_sampling_frequency(),
-            dat_file=str((output_folder / 'recording.dat').absolute()),
+            dat_file=str(input_file_path.absolute()),
             projection_threshold=p['projection_threshold'],
             preclust_threshold=p['preclust_threshold'],
             minfr_goodchannels=p['minfr_goodchannels'],
@@ -183,6 +205,25 @@ class Kilosort2Sorter(BaseSorter):
             kcoords=groups
         )
 
+        if self.is_compiled():
+            # the compiled Kilosort2 takes the ops and the channel map as files instead of the .m scripts
+            ops = ops_from_matlab_config(kilosort2_config_txt, {'fpath': str(output_folder.absolute())})
+            with (output_folder / 'kilosort2_ops.json').open('w') as f:
+                json.dump(ops, f, indent=4)
+            write_kilosort_channel_map(output_folder / 'chanMap.mat', xcoords=[p[0] for p in positions],
+                                       ycoords=[p[1] for p in positions], kcoords=groups,
+                                       sample_rate=recording.get_sampling_frequency())
+            return
+
+        kilosort2_master_txt = kilosort2_master_txt.format(
+            kilosort2_path=str(
+                Path(Kilosort2Sorter.kilosort2_path).absolute()),
+            output_folder=str(output_folder),
+            channel_path=str(
+                (output_folder / 'kilosort2_channelmap.m').absolute()),
+            config_path=str((output_folder / 'kilosort2_config.m').absolute()),
+        )
+
         for fname, txt in zip(['kilosort2_master.m', 'kilosort2_config.m',
                                'kilosort2_channelmap.m'],
                               [kilosort2_master_txt, kilosort2_config_txt,
@@ -195,22 +236,47 @@ class Kilosort2Sorter(BaseSorter):
 
     def _run(self, recording, output_folder):
         recording = recover_recording(recording)
-        if 'win' in sys.platform and sys.platform != 'darwin':
-            shell_cmd = '''
-                        {disk_move}
-                        cd {tmpdir}
-                        matlab -nosplash -wait -log -r kilosort2_master
-                    '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder)
+        matlab_pool = get_matlab_session_pool()
+        if self.is_compiled():
+            # the compiled application runs on the MATLAB Runtime, out of the matlab sessions
+            command = get_compiled_command(find_compiled_executable(self.compiled_path, 'kilosort2_compiled'),
+                                           ['kilosort2_ops.json'])
+            if 'win' in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                            {disk_move}
+                            cd {tmpdir}
+                            {command}
+                        '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder, command=command)
+            else:
+                shell_cmd = '''
+                            #!/bin/bash
+                            cd "{tmpdir}"
+                            {command}
+                        '''.format(tmpdir=output_folder, command=command)
+            shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                       log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_script.start()
+            retcode = shell_script.wait()
+        elif matlab_pool is not None:
+            retcode = matlab_pool.run_script(output_folder / 'kilosort2_master.m',
+                                             log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
         else:
-            shell_cmd = '''
-                        #!/bin/bash
-                        cd "{tmpdir}"
-                        matlab -nosplash -nodisplay -log -r kilosort2_master
-                    '''.format(tmpdir=output_folder)
-        shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
-                                   log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
-        shell_script.start()
-        retcode = shell_script.wait()
+            if 'win' in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                            {disk_move}
+                            cd {tmpdir}
+                            matlab -nosplash -wait -log -r kilosort2_master
+                        '''.format(disk_move=str(output_folder)[:2], tmpdir=output_folder)
+            else:
+                shell_cmd = '''
+                            #!/bin/bash
+                            cd "{tmpdir}"
+                            matlab -nosplash -nodisplay -log -r kilosort2_master
+                        '''.format(tmpdir=output_folder)
+            shell_script = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                       log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_script.start()
+            retcode = shell_script.wait()
 
         if retcode != 0:
             raise Exception('kilosort2 returned a non-zero exit code')
@@ -0,0 +1,48 @@
+function kilosort2_compiled(ops_file)
+% Entry point of Kilosort2 compiled with the MATLAB Compiler, run by kilosort2.py when the compiled path is set
+% (see spikesorters/compiled_matlab.py):
+%   mcc -m kilosort2_compiled.m -a /path/to/Kilosort2 -a spikesorters/utils -d /path/to/output
+%
+% ops_file is the json file of the ops (kilosort2_config.m) written by kilosort2.py, run in the output folder
+% with the channel map in chanMap.mat. An error exits with a non-zero exit code.
+ops = jsondecode(fileread(ops_file));
+fpath = ops.root;
+
+ops.trange = [0 Inf]; % time range to sort
+
+% preprocess data to create temp_wh.dat
+% the duration of each step is printed for the profile of spikeinterface_log.json
+t_stage = tic;
+rez = preprocessDataSub(ops);
+fprintf('spikesorters_stage preprocessDataSub %.3f\n', toc(t_stage)); t_stage = tic;
+
+% time-reordering as a function of drift
+rez = clusterSingleBatches(rez);
+fprintf('spikesorters_stage clusterSingleBatches %.3f\n', toc(t_stage)); t_stage = tic;
+
+% main tracking and template matching algorithm
+rez = learnAndSolve8b(rez);
+fprintf('spikesorters_stage learnAndSolve8b %.3f\n', toc(t_stage)); t_stage = tic;
+
+% final merges
+rez = find_merges(rez, 1);
+fprintf('spikesorters_stage find_merges %.3f\n', toc(t_stage)); t_stage = tic;
+
+% final splits by SVD
+rez = splitAllClusters(rez, 1);
+fprintf('spikesorters_stage splitAllClusters %.3f\n', toc(t_stage)); t_stage = tic;
+
+% final splits by amplitudes
+rez = splitAllClusters(rez, 0);
+fprintf('spikesorters_stage splitAllClusters %.3f\n', toc(t_stage)); t_stage = tic;
+
+% decide on cutoff
+rez = set_cutoff(rez);
+fprintf('spikesorters_stage set_cutoff %.3f\n', toc(t_stage)); t_stage = tic;
+
+fprintf('found %d good units \n', sum(rez.good>0))
+
+fprintf('Saving results to Phy  \n')
+rezToPhy(rez, fullfile(fpath));
+fprintf('spikesorters_stage rezToPhy %.3f\n', toc(t_stage)); t_stage = tic;
+end
@@ -0,0 +1,55 @@
+function kilosort2_5_compiled(ops_file)
+% Entry point of Kilosort2.5 compiled with the MATLAB Compiler, run by kilosort2_5.py when the compiled path is set
+% (see spikesorters/compiled_matlab.py):
+%   mcc -m kilosort2_5_compiled.m -a /path/to/Kilosort2.5 -a spikesorters/utils -d /path/to/output
+%
+% ops_file is the json file of the ops (kilosort2_5_config.m) written by kilosort2_5.py, run in the output folder
+% with the channel map in chanMap.mat. An error exits with a non-zero exit code.
+ops = jsondecode(fileread(ops_file));
+fpath = ops.root;
+
+ops.trange = [0 Inf]; % time range to sort
+
+% preprocess data to create temp_wh.dat
+% the duration of each step is printed for the profile of spikeinterface_log.json
+t_stage = tic;
+rez = preprocessDataSub(ops);
+fprintf('spikesorters_stage preprocessDataSub %.3f\n', toc(t_stage)); t_stage = tic;
+
+% NEW STEP TO DO DATA REGISTRATION
+rez = datashift2(rez, 1); % last input is for shifting data
+fprintf('spikesorters_stage datashift2 %.3f\n', toc(t_stage)); t_stage = tic;
+
+% ORDER OF BATCHES IS NOW RANDOM, controlled by random number generator
+iseed = 1;
+
+% main tracking and template matching algorithm
+rez = learnAndSolve8b(rez, iseed);
+fprintf('spikesorters_stage learnAndSolve8b %.3f\n', toc(t_stage)); t_stage = tic;
+
+% OPTIONAL: remove double-counted spikes - solves issue in which individual spikes are assigned to multiple templates.
+% See issue 29: https://github.com/MouseLand/Kilosort/issues/29
+%rez = remove_ks2_duplicate_spikes(rez);
+
+% final merges
+rez = find_merges(rez, 1);
+fprintf('spikesorters_stage find_merges %.3f\n', toc(t_stage)); t_stage = tic;
+
+% final splits by SVD
+rez = splitAllClusters(rez, 1);
+fprintf('spikesorters_stage splitAllClusters %.3f\n', toc(t_stage)); t_stage = tic;
+
+% decide on cutoff
+rez = set_cutoff(rez);
+fprintf('spikesorters_stage set_cutoff %.3f\n', toc(t_stage)); t_stage = tic;
+% eliminate widely spread waveforms (likely noise)
+rez.good = get_good_units(rez);
+fprintf('spikesorters_stage get_good_units %.3f\n', toc(t_stage)); t_stage = tic;
+
+fprintf('found %d good units \n', sum(rez.good>0))
+
+% write to Phy
+fprintf('Saving results to Phy  \n')
+rezToPhy(rez, fullfile(fpath));
+fprintf('spikesorters_stage rezToPhy %.3f\n', toc(t_stage)); t_stage = tic;
+end
@@ -17,16 +17,21 @@ try
     ops.trange = [0 Inf]; % time range to sort
 
     % preprocess data to create temp_wh.dat
+    % the duration of each step is printed for the profile of spikeinterface_log.json
+    t_stage = tic;
     rez = preprocessDataSub(ops);
+    fprintf('spikesorters_stage preprocessDataSub %.3f\n', toc(t_stage)); t_stage = tic;
 
     % NEW STEP TO DO DATA REGISTRATION
     rez = datashift2(rez, 1); % last input is for shifting data
+    fprintf('spikesorters_stage datashift2 %.3f\n', toc(t_stage)); t_stage = tic;
 
     % ORDER OF BATCHES IS NOW RANDOM, controlled by random number generator
     iseed = 1;
 
     % main tracking and template matching algorithm
     rez = learnAndSolve8b(rez, iseed);
+    fprintf('spikesorters_stage learnAndSolve8b %.3f\n', toc(t_stage)); t_stage = tic;
 
     % OPTIONAL: remove double-counted spikes - solves issue in which individual spikes are assigned to multiple templates.
     % See issue 29: https://github.com/MouseLand/Kilosort/issues/29
@@ -34,20 +39,25 @@ try
 
     % final merges
     rez = find_merges(rez, 1);
+    fprintf('spikesorters_stage find_merges %.3f\n', toc(t_stage)); t_stage = tic;
 
     % final splits by SVD
     rez = splitAllClusters(rez, 1);
+    fprintf('spikesorters_stage splitAllClusters %.3f\n', toc(t_stage)); t_stage = tic;
 
     % decide on cutoff
     rez = set_cutoff(rez);
+    fprintf('spikesorters_stage set_cutoff %.3f\n', toc(t_stage)); t_stage = tic;
     % eliminate widely spread waveforms (likely noise)
     rez.good = get_good_units(rez);
+    fprintf('spikesorters_stage get_good_units %.3f\n', toc(t_stage)); t_stage = tic;
 
     fprintf('found %d good units \n', sum(rez.good>0))
 
     % write to Phy
     fprintf('Saving results to Phy  \n')
     rezToPhy(rez, fullfile(fpath));
+    fprintf('spikesorters_stage rezToPhy %.3f\n', toc(t_stage)); t_stage = tic;
 catch
     fprintf('----------------------------------------');
     fprintf(lasterr());
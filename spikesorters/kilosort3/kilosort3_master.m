@@ -17,25 +17,35 @@ try
     ops.trange = [0 Inf]; % time range to sort
 
     % preprocess data to create temp_wh.dat
+    % the duration of each step is printed for the profile of spikeinterface_log.json
+    t_stage = tic;
     rez = preprocessDataSub(ops);
+    fprintf('spikesorters_stage preprocessDataSub %.3f\n', toc(t_stage)); t_stage = tic;
 
     % run data registration
     rez = datashift2(rez, 1); % last input is for shifting data
+    fprintf('spikesorters_stage datashift2 %.3f\n', toc(t_stage)); t_stage = tic;
 
     [rez, st3, tF] = extract_spikes(rez);
+    fprintf('spikesorters_stage extract_spikes %.3f\n', toc(t_stage)); t_stage = tic;
 
     rez = template_learning(rez, tF, st3);
+    fprintf('spikesorters_stage template_learning %.3f\n', toc(t_stage)); t_stage = tic;
 
     [rez, st3, tF] = trackAndSort(rez);
+    fprintf('spikesorters_stage trackAndSort %.3f\n', toc(t_stage)); t_stage = tic;
 
     rez = final_clustering(rez, tF, st3);
+    fprintf('spikesorters_stage final_clustering %.3f\n', toc(t_stage)); t_stage = tic;
 
     % final merges
     rez = find_merges(rez, 1);
+    fprintf('spikesorters_stage find_merges %.3f\n', toc(t_stage)); t_stage = tic;
 
     % output to phy
     fprintf('Saving results to Phy\n')
     rezToPhy2(rez, fpath);
+    fprintf('spikesorters_stage rezToPhy2 %.3f\n', toc(t_stage)); t_stage = tic;
 
 catch
     fprintf('----------------------------------------');
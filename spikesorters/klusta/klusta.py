@@ -8,14 +8,6 @@ from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
 from ..sorter_tools import recover_recording
 
-try:
-    import klusta
-    import klustakwik2
-
-    HAVE_KLUSTA = True
-except ImportError:
-    HAVE_KLUSTA = False
-
 
 class KlustaSorter(BaseSorter):
     """
@@ -24,6 +16,8 @@ class KlustaSorter(BaseSorter):
     sorter_name = 'klusta'
     
     requires_locations = False
+    resource_footprint = {'cores': 1, 'ram_mb_per_channel_hour': 500., 'scratch_mb_per_channel_hour': 500., 'licenses': {}}
+    runs_external_process = True
 
     _default_params = {
         'adjacency_radius': None,
@@ -71,10 +65,17 @@ class KlustaSorter(BaseSorter):
     
     @classmethod
     def is_installed(cls):
+        try:
+            import klusta
+            import klustakwik2
+            HAVE_KLUSTA = True
+        except ImportError:
+            HAVE_KLUSTA = False
         return HAVE_KLUSTA
     
     @staticmethod
     def get_sorter_version():
+        import klusta
         return klusta.__version__
 
     def _setup_recording(self, recording, output_folder):
@@ -101,8 +102,8 @@ class KlustaSorter(BaseSorter):
             # save binary file (chunk by hcunk) into a new file
             raw_filename = output_folder / 'recording.dat'
             dtype = 'int16'
-            recording.write_to_binary_dat_format(raw_filename, time_axis=0, dtype=dtype,chunk_mb=p["chunk_mb"],
-                                                n_jobs=p["n_jobs_bin"], verbose=self.verbose)
+            self._write_binary_recording(recording, raw_filename, dtype=dtype, time_axis=0, chunk_mb=p["chunk_mb"],
+                                         n_jobs=p["n_jobs_bin"])
 
         if p['detect_sign'] < 0:
             detect_sign = 'negative'
@@ -2,21 +2,36 @@
 Utils functions to launch several sorter on several recording in parralell or not.
 """
 import os
+import sys
 from pathlib import Path
 import multiprocessing
 import shutil
+import copy
 import json
 import traceback
 import json
+import time
+import signal
+import asyncio
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 import spikeextractors as se
 
 from .sorterlist import sorter_dict, run_sorter
+from .sorter_tools import SpikeSortingError, get_num_workers
+from .binary_cache import _CacheLock
+from .cancellation import CancelToken
+from .utils.shellscript import get_running_shellscripts, is_process_group_alive, stop_process_group
+
+# index of the finished (rec_name, sorter_name) outputs at the root of the working folder of run_sorters()
+output_index_name = 'spikesorters_index.json'
 
 
 def _run_one(arg_list):
     # the multiprocessing python module force to have one unique tuple argument
-    rec, sorter_name, output_folder, grouping_property, verbose, params, run_sorter_kwargs = arg_list
+    rec, sorter_name, output_folder, grouping_property, verbose, params, run_sorter_kwargs, resume = arg_list
     if isinstance(rec, dict):
         recording = se.load_extractor_from_dict(rec)
     else:
@@ -24,13 +39,309 @@ def _run_one(arg_list):
 
     SorterClass = sorter_dict[sorter_name]
     sorter = SorterClass(recording=recording, output_folder=output_folder,
-                         grouping_property=grouping_property, verbose=verbose, delete_output_folder=False)
+                         grouping_property=grouping_property, verbose=verbose, delete_output_folder=False,
+                         resume=resume)
     sorter.set_params(**params)
-    sorter.run(**run_sorter_kwargs)
+    run_time = None
+    try:
+        run_time = sorter.run(**run_sorter_kwargs)
+    finally:
+        # output_folder is working_folder / rec_name / sorter_name
+        output_folder = Path(output_folder)
+        _update_output_index(output_folder.parent.parent, output_folder.parent.name, sorter_name, run_time)
+
+
+def get_machine_resources(folder=None):
+    """
+    Returns the resources of the machine, in the format of BaseSorter.get_resource_footprint().
+
+    Parameters
+    ----------
+    folder: str or Path or None
+        The folder whose disk gives the free scratch space (the current folder if None)
+
+    Returns
+    -------
+    resources: dict
+        Dictionary with 'cores', 'ram_mb' (total RAM, None if unknown), 'scratch_mb' (free disk space)
+        and 'licenses' (empty: the licenses are not limited unless their number of tokens is specified)
+    """
+    try:
+        ram_mb = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1e6
+    except (AttributeError, ValueError, OSError):
+        ram_mb = None
+    folder = Path(folder if folder is not None else '.').absolute()
+    while not folder.exists():
+        folder = folder.parent
+    scratch_mb = shutil.disk_usage(str(folder)).free / 1e6
+    return {'cores': os.cpu_count(), 'ram_mb': ram_mb, 'scratch_mb': scratch_mb, 'licenses': {}}
+
+
+def _fit_footprint(footprint, resources):
+    # a task larger than the whole machine is clamped so that it runs alone, the licenses without a configured
+    # number of tokens are not limited
+    fitted = {}
+    for key in ('cores', 'ram_mb', 'scratch_mb'):
+        fitted[key] = footprint[key] if resources[key] is None else min(footprint[key], resources[key])
+    fitted['licenses'] = {name: min(n, resources['licenses'][name])
+                          for name, n in footprint['licenses'].items() if name in resources['licenses']}
+    return fitted
+
+
+def _run_bin_packed(pool, func, task_list, footprints, resources, max_running=None, poll_interval=0.1,
+                    scratch_folder=None):
+    """
+    Runs the tasks on a pool (pool.apply_async) so that the sum of the footprints of the running tasks
+    stays within the resources. The largest tasks are started first and the smaller ones fill the gaps.
+
+    The scratch disk of a finished task is not released (its binary copies and outputs stay on disk). If
+    'scratch_folder' is given, the free disk space is measured again before starting tasks instead. As the
+    footprints are estimates, a task which does not fit on the idle machine is run alone with a warning.
+
+    All the tasks are run, the error of the first failed task is then raised.
+    """
+    available = copy.deepcopy(resources)
+    footprints = [_fit_footprint(fp, resources) for fp in footprints]
+
+    def fits(fp):
+        for key in ('cores', 'ram_mb', 'scratch_mb'):
+            if available[key] is not None and fp[key] > available[key]:
+                return False
+        return all(n <= available['licenses'][name] for name, n in fp['licenses'].items())
+
+    def reserve(fp, sign):
+        keys = ('cores', 'ram_mb', 'scratch_mb') if sign > 0 else ('cores', 'ram_mb')
+        for key in keys:
+            if available[key] is not None:
+                available[key] -= sign * fp[key]
+        for name, n in fp['licenses'].items():
+            available['licenses'][name] -= sign * n
+
+    def start(i):
+        reserve(footprints[i], 1)
+        running[i] = pool.apply_async(func, (task_list[i],))
+        pending.remove(i)
+
+    pending = sorted(range(len(task_list)), key=lambda i: (footprints[i]['cores'], footprints[i]['ram_mb']),
+                     reverse=True)
+    running = {}
+    errors = {}
+    while len(pending) > 0 or len(running) > 0:
+        if scratch_folder is not None and available['scratch_mb'] is not None:
+            # the running tasks may not have written their copies yet
+            available['scratch_mb'] = get_machine_resources(scratch_folder)['scratch_mb'] - \
+                sum(footprints[i]['scratch_mb'] for i in running)
+        for i in list(pending):
+            if max_running is not None and len(running) >= max_running:
+                break
+            if fits(footprints[i]):
+                start(i)
+        if len(running) == 0:
+            # nothing fits on the idle machine: the scratch disk is used by the finished tasks
+            warnings.warn('The task {} does not fit in the resources {} (needs {}): it is run alone'.format(
+                pending[0], available, footprints[pending[0]]))
+            start(pending[0])
+        done = []
+        while len(done) == 0:
+            done = [i for i, result in running.items() if result.ready()]
+            if len(done) == 0:
+                time.sleep(poll_interval)
+        for i in done:
+            reserve(footprints[i], -1)
+            try:
+                running.pop(i).get()
+            except Exception as e:
+                # the other tasks are run first, like pool.map()
+                errors[i] = e
+    if len(errors) > 0:
+        raise errors[min(errors)]
+
+
+def _stop_child(signum, frame):
+    # SIGTERM of a child process: the shell scripts run in their own process group and are stopped first
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    for script in get_running_shellscripts():
+        script.stop(grace_periods=(None, 1., 1.))
+    os._exit(-signum)
+
+
+def _run_one_in_child(arg_list):
+    # the child process exits without joining its own children: the idle workers of a reusable pool
+    # (e.g. joblib/loky used by some sorters) would otherwise block the exit
+    if os.name != 'nt':
+        # the children of the child process are stopped with its process group
+        os.setpgrp()
+        signal.signal(signal.SIGTERM, _stop_child)
+    exitcode = 0
+    try:
+        _run_one(arg_list)
+    except BaseException:
+        traceback.print_exc()
+        exitcode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exitcode)
+
+
+class _AsyncioTask:
+    """
+    One task of the 'asyncio' engine. The sorters waiting on an external process run in a thread (the wait
+    releases the GIL), the in-process python sorters in a child process. cancel() cancels the run cooperatively
+    (the sorter stops its external processes and logs the outcome), stop() stops the shell scripts started by the
+    task or the process group of its child process.
+    """
+    def __init__(self, arg_list, mp_context='spawn'):
+        self.sorter_name = arg_list[1]
+        self.output_folder = Path(arg_list[2])
+        self.name = '{}/{}'.format(self.output_folder.parent.name, self.sorter_name)
+        self.in_thread = sorter_dict[self.sorter_name].runs_external_process
+        self.mp_context = mp_context
+        self.start_time = None
+        self._thread_id = None
+        self._process = None
+        # the cancel file reaches the child processes
+        run_sorter_kwargs = arg_list[6]
+        self.cancel_token = CancelToken(cancel_file=self.output_folder.parent / (self.sorter_name + '.cancel'),
+                                        parent=run_sorter_kwargs.get('cancel_token', None))
+        self.arg_list = arg_list[:6] + (dict(run_sorter_kwargs, cancel_token=self.cancel_token),) + arg_list[7:]
+
+    def run(self):
+        self._thread_id = threading.get_ident()
+        # cancel file of a previous batch in this working folder
+        if self.cancel_token.cancel_file.is_file():
+            self.cancel_token.cancel_file.unlink()
+        try:
+            self._run()
+        finally:
+            if self.cancel_token.cancel_file.is_file():
+                self.cancel_token.cancel_file.unlink()
+
+    def _run(self):
+        if self.in_thread:
+            _run_one(self.arg_list)
+        else:
+            ctx = multiprocessing.get_context(self.mp_context)
+            self._process = ctx.Process(target=_run_one_in_child, args=(self.arg_list,))
+            self._process.start()
+            self._process.join()
+            if self._process.exitcode != 0:
+                raise SpikeSortingError('{} failed in a child process (exit code {})'.format(
+                    self.name, self._process.exitcode))
+
+    def cancel(self, reason='cancelled'):
+        self.cancel_token.cancel(reason)
+
+    def stop(self):
+        if self._process is not None:
+            if os.name == 'nt' or not is_process_group_alive(self._process.pid):
+                # the child may not have created its process group yet
+                if self._process.is_alive():
+                    self._process.terminate()
+            else:
+                stop_process_group(self._process.pid, grace_periods=(None, 3., 5.),
+                                   poll_leader=self._process.is_alive)
+        if self._thread_id is not None:
+            for script in get_running_shellscripts(self._thread_id):
+                script.stop()
+
+    def write_stopped_log(self, outcome):
+        # a task stopped before the sorter logged its outcome (e.g. a terminated child process)
+        log_file = self.output_folder / 'spikeinterface_log.json'
+        log = {}
+        if log_file.is_file():
+            with open(str(log_file), 'r', encoding='utf8') as f:
+                log = json.load(f)
+        if log.get('outcome') == outcome:
+            return
+        log.update({'sorter_name': self.sorter_name, 'run_time': None, 'error': True, 'outcome': outcome})
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        with open(str(log_file), 'w', encoding='utf8') as f:
+            json.dump(log, f, indent=4)
+
+
+async def _run_tasks_asyncio(task_list, max_concurrent=None, timeout=None, progress=True, progress_interval=60.,
+                             mp_context='spawn', stop_grace=10.):
+    loop = asyncio.get_event_loop()
+    if max_concurrent is None:
+        max_concurrent = os.cpu_count()
+    semaphore = asyncio.Semaphore(max_concurrent)
+    tasks = [_AsyncioTask(arg_list, mp_context=mp_context) for arg_list in task_list]
+    running = []
+    errors = {}
+    num_done = 0
+
+    def report(task, status):
+        if progress:
+            print('[{}/{} done, {} running] {} {} ({:.1f} s)'.format(num_done, len(tasks), len(running), task.name,
+                                                                    status, time.perf_counter() - task.start_time))
+
+    async def run_task(task):
+        nonlocal num_done
+        async with semaphore:
+            task.start_time = time.perf_counter()
+            running.append(task)
+            if progress:
+                print('[{}/{} done, {} running] {} started'.format(num_done, len(tasks), len(running), task.name))
+            future = loop.run_in_executor(executor, task.run)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+                status = 'finished'
+            except asyncio.TimeoutError:
+                # the sorter is first cancelled cooperatively, then stopped after 'stop_grace' s,
+                # the slot is released only when the task is really stopped
+                task.cancel('timeout')
+                await asyncio.wait([future], timeout=stop_grace)
+                if not future.done():
+                    while not future.done():
+                        # the stop waits for the process trees to exit
+                        await loop.run_in_executor(None, task.stop)
+                        await asyncio.wait([future], timeout=1.)
+                    task.write_stopped_log('timeout')
+                future.exception()  # the failure of the stopped task is expected
+                errors[task.name] = 'timeout after {} s'.format(timeout)
+                status = 'timed out'
+            except Exception as e:
+                errors[task.name] = '{}: {}'.format(type(e).__name__, e)
+                status = 'failed'
+            running.remove(task)
+            num_done += 1
+            report(task, status)
+
+    async def report_running():
+        while True:
+            await asyncio.sleep(progress_interval)
+            for task in list(running):
+                report(task, 'running')
+
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        reporter = None
+        if progress and progress_interval is not None:
+            reporter = asyncio.ensure_future(report_running())
+        try:
+            await asyncio.gather(*[run_task(task) for task in tasks])
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            for task in running:
+                task.cancel()
+                task.stop()
+    return errors
+
+
+def _run_coroutine(coro):
+    # asyncio.run() cannot be nested (e.g. in a notebook): the coroutine then runs in its own thread and loop
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
 
 
 def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_params={}, grouping_property=None,
-                mode='raise', engine=None, engine_kwargs={}, verbose=False, with_output=True, run_sorter_kwargs={}):
+                mode='raise', engine=None, engine_kwargs={}, verbose=False, with_output=True, run_sorter_kwargs={},
+                cancel_token=None):
     """
     Run several sorters on several recordings.
 
@@ -44,25 +355,42 @@ def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_para
     working_folder: str
         The working directory.
         This must not exist before calling this function.
+        An index of the finished outputs (spikesorters_index.json) is updated at its root when each task ends.
     sorter_params: dict of dict with sorter_name as key
         This allow to overwrite default params for sorter.
     grouping_property: str or None
         The property of grouping given to sorters.
-    mode: 'raise' or 'overwrite' or 'keep'
+    mode: 'raise' or 'overwrite' or 'keep' or 'resume'
         The mode when the subfolder of recording/sorter already exists.
             * 'raise' : raise error if subfolder exists
             * 'overwrite' : force recompute
-            * 'keep' : do not compute again if f=subfolder exists and log is OK
-    engine: 'loop' or 'multiprocessing' or 'dask'
+            * 'keep' : do not compute again if f=subfolder exists and log is OK (the failed, timed out and
+              cancelled runs are computed again, see get_run_outcome())
+            * 'resume' : run the sorters with resume=True: the stages (setup, run) already done with the same
+              params and recording are skipped
+    engine: 'loop' or 'multiprocessing' or 'dask' or 'asyncio'
         Which approach to use to run the multiple sorters.
             * 'loop' : run sorters in a loop (serially)
-            * 'multiprocessing' : use the Python multiprocessing library to run in parallel
+            * 'multiprocessing' : use the Python multiprocessing library to run in parallel. The tasks are
+              bin-packed with the resource footprints of the sorters (see BaseSorter.get_resource_footprint())
+              so that the cores, RAM, scratch disk and licenses of the machine are not oversubscribed
             * 'dask' : use the Dask module to run in parallel
+            * 'asyncio' : run the sorters concurrently from an asyncio event loop. The sorters running an
+              external process (Kilosort, IronClust, Spyking Circus, ...) run in threads of the main process,
+              the in-process python sorters (tridesclous, mountainsort4, herdingspikes) in child processes.
     engine_kwargs: dict
         This contains kwargs specific to the launcher engine:
             * 'loop' : no kargs
-            * 'multiprocessing' : {'processes' : } number of processes
+            * 'multiprocessing' : {'processes' : } number of processes, {'resources': } dict overriding the
+              machine resources of get_machine_resources() (e.g. {'licenses': {'matlab': 2}}, by default
+              the licenses are not limited)
             * 'dask' : {'client':} the dask client for submiting task
+            * 'asyncio' : {'max_concurrent': } maximum number of sorters running at the same time (default
+              number of cores), {'timeout': } timeout in s of each sorter (default None), {'progress': } print
+              the progress (default True), {'progress_interval': } interval in s between the reports of the
+              running sorters (default 60), {'mp_context': } multiprocessing start method of the child processes
+              (default 'spawn', forking the threaded main process is not safe), {'stop_grace': } time in s left
+              to a timed out sorter to stop its external processes before the task is stopped (default 10)
     verbose: bool
         Controls sorter verbosity.
     with_output: bool
@@ -73,11 +401,19 @@ def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_para
             * 'parallel' : bool
             * 'n_jobs' : int
             * 'joblib_backend' : 'loky' / 'multiprocessing' / 'threading'
+            * 'compact_output' : bool, convert the outputs to the compact store (fast reloading of large batches)
+            * 'timeout' : float, wall-clock timeout in s of each sorter: its external processes are stopped and
+              the 'timeout' outcome is recorded in its spikeinterface_log.json (the in-process python sorters only
+              stop between the setup and the run, the 'asyncio' engine also stops them)
+    cancel_token: CancelToken or None
+        Token cancelling the remaining runs, e.g. from another thread (see cancellation.py). With the
+        'multiprocessing' and 'dask' engines, cancel() reaches the workers only if the token has a cancel file.
 
     Returns
     -------
     results : dict
-        The output is nested dict[(rec_name, sorter_name)] of SortingExtractor.
+        The output is nested dict[(rec_name, sorter_name)] of SortingExtractor (use with_output=False and
+        collect_sorting_outputs(working_folder, lazy=True) to load them on first access).
 
     Notes
     -----
@@ -113,15 +449,22 @@ def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_para
             recording_dict[rec_name] = recording_list[0]
         grouping_property = None
 
-    need_serialize = engine != 'loop'
+    if working_folder.is_dir() and not (working_folder / output_index_name).is_file():
+        # outputs of a previous version (mode 'keep' or 'resume')
+        rebuild_output_index(working_folder)
+
+    need_serialize = engine not in ('loop', 'asyncio')
+    if cancel_token is not None:
+        run_sorter_kwargs = dict(run_sorter_kwargs, cancel_token=cancel_token)
 
     task_list = []
+    footprints = []
     for rec_name, recording in recording_dict.items():
         for sorter_name in sorter_list:
 
             output_folder = working_folder / rec_name / sorter_name
 
-            if is_log_ok(output_folder):
+            if is_log_ok(output_folder) and mode != 'resume':
                 # check is output_folders exists
                 if mode == 'raise':
                     raise (Exception('output folder already exists for {} {}'.format(rec_name, sorter_name)))
@@ -130,14 +473,17 @@ def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_para
                 elif mode == 'keep':
                     continue
                 else:
-                    raise (ValueError('mode not in raise, overwrite, keep'))
+                    raise (ValueError('mode not in raise, overwrite, keep, resume'))
             params = sorter_params.get(sorter_name, {})
-            if need_serialize:
+            if engine == 'multiprocessing':
+                footprints.append(sorter_dict[sorter_name].get_resource_footprint(recording, params))
+            if need_serialize or (engine == 'asyncio' and not sorter_dict[sorter_name].runs_external_process):
                 assert recording.check_if_dumpable(), 'run_sorters(engine=... ) if engine is not "loop" then recording have to be dumpable'
                 rec = recording.dump_to_dict()
             else:
                 rec = recording
-            task_list.append((rec, sorter_name, output_folder, grouping_property, verbose, params, run_sorter_kwargs))
+            task_list.append((rec, sorter_name, output_folder, grouping_property, verbose, params, run_sorter_kwargs,
+                              mode == 'resume'))
 
     if engine == 'loop':
         # simple loop in main process
@@ -146,10 +492,24 @@ def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_para
 
     elif engine == 'multiprocessing':
         # use mp.Pool
+        resources = get_machine_resources(working_folder)
+        resources.update(engine_kwargs.get('resources', {}))
         processes = engine_kwargs.get('processes', None)
+        if processes is None:
+            processes = resources['cores']
         pool = multiprocessing.Pool(processes)
-        pool.map(_run_one, task_list)
-        pool.close()
+        try:
+            # the free disk is measured again unless the scratch budget is given
+            scratch_folder = None if 'scratch_mb' in engine_kwargs.get('resources', {}) else working_folder
+            _run_bin_packed(pool, _run_one, task_list, footprints, resources, max_running=processes,
+                            scratch_folder=scratch_folder)
+            pool.close()
+        except BaseException:
+            # e.g. KeyboardInterrupt: the running sortings are stopped
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
     elif engine == 'dask':
         client = engine_kwargs.get('client', None)
@@ -163,6 +523,15 @@ def run_sorters(sorter_list, recording_dict_or_list, working_folder, sorter_para
         for task in tasks:
             task.result()
 
+    elif engine == 'asyncio':
+        errors = _run_coroutine(_run_tasks_asyncio(task_list, **engine_kwargs))
+        if len(errors) > 0 and run_sorter_kwargs.get('raise_error', True):
+            raise SpikeSortingError('run_sorters() failed for:\n' +
+                                    '\n'.join('{}: {}'.format(name, error) for name, error in errors.items()))
+
+    else:
+        raise ValueError("engine must be 'loop', 'multiprocessing', 'dask' or 'asyncio'")
+
     if with_output:
         if engine == 'dask':
             print('Warning!! With engine="dask" you cannot have directly output results\n' \
@@ -185,8 +554,143 @@ def is_log_ok(output_folder):
     return False
 
 
-def iter_output_folders(output_folders):
+def get_run_outcome(output_folder):
+    """
+    Returns the outcome of the run of an output folder, from its spikeinterface_log.json.
+
+    Parameters
+    ----------
+    output_folder: str or Path
+        The output folder of the sorter
+
+    Returns
+    -------
+    outcome: str or None
+        'finished', 'error', 'timeout' or 'cancelled' (None if the folder has no log)
+    """
+    log_file = Path(output_folder) / 'spikeinterface_log.json'
+    if not log_file.is_file():
+        return None
+    with open(str(log_file), mode='r', encoding='utf8') as f:
+        log = json.load(f)
+    if 'outcome' in log:
+        return log['outcome']
+    # logs of previous versions
+    return 'finished' if log.get('run_time', None) is not None else 'error'
+
+
+def _read_output_index(working_folder):
+    index_file = Path(working_folder) / output_index_name
+    if not index_file.is_file():
+        return None
+    with open(str(index_file), 'r', encoding='utf8') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return None
+
+
+def _write_output_index(working_folder, index):
+    index_file = Path(working_folder) / output_index_name
+    tmp_file = Path(working_folder) / (output_index_name + f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(str(tmp_file), 'w', encoding='utf8') as f:
+        json.dump(index, f, indent=4)
+    os.replace(str(tmp_file), str(index_file))
+
+
+def _update_output_index(working_folder, rec_name, sorter_name, run_time):
+    # adds a finished output (or removes a failed one) under an inter-process lock, the index is replaced atomically
+    working_folder = Path(working_folder)
+    key = '{}/{}'.format(rec_name, sorter_name)
+    working_folder.mkdir(parents=True, exist_ok=True)
+    with _CacheLock(working_folder, lock_name=output_index_name + '.lock'):
+        index = _read_output_index(working_folder) or {}
+        if run_time is None:
+            if key not in index:
+                return
+            index.pop(key)
+        else:
+            index[key] = {'rec_name': rec_name, 'sorter_name': sorter_name, 'run_time': run_time}
+        _write_output_index(working_folder, index)
+
+
+def rebuild_output_index(working_folder):
+    """
+    Rebuilds the index of the outputs of a working folder of run_sorters() by scanning the output folders and
+    their logs (e.g. for a working folder written by a previous version, or modified by hand).
+
+    Parameters
+    ----------
+    working_folder: str or Path
+        The working folder of run_sorters()
+
+    Returns
+    -------
+    index: dict
+        The index: dict['rec_name/sorter_name'] of dict with 'rec_name', 'sorter_name' and 'run_time'
+    """
+    working_folder = Path(working_folder)
+    index = {}
+    for rec_name, sorter_name, output_folder in iter_output_folders(working_folder, use_index=False):
+        with open(output_folder / 'spikeinterface_log.json', mode='r', encoding='utf8') as logfile:
+            run_time = json.load(logfile).get('run_time', None)
+        index['{}/{}'.format(rec_name, sorter_name)] = {'rec_name': rec_name, 'sorter_name': sorter_name,
+                                                       'run_time': run_time}
+    with _CacheLock(working_folder, lock_name=output_index_name + '.lock'):
+        _write_output_index(working_folder, index)
+    return index
+
+
+class SortingOutput:
+    """
+    Proxy of the sorting of an output folder: the SortingExtractor is loaded
+    (SorterClass.get_result_from_folder()) on the first access to one of its attributes, or with load().
+    """
+    def __init__(self, sorter_name, output_folder):
+        self.sorter_name = sorter_name
+        self.output_folder = Path(output_folder)
+        self._sorting = None
+
+    @property
+    def is_loaded(self):
+        return self._sorting is not None
+
+    def load(self):
+        """
+        Returns the SortingExtractor (loaded on the first call).
+        """
+        if self._sorting is None:
+            SorterClass = sorter_dict[self.sorter_name]
+            self._sorting = SorterClass.get_result_from_folder(self.output_folder)
+        return self._sorting
+
+    def __getattr__(self, name):
+        # called only for the attributes not found on the proxy
+        if name.startswith('__') or name in ('sorter_name', 'output_folder', '_sorting'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        if self._sorting is None:
+            return 'SortingOutput({}, {}, not loaded)'.format(self.sorter_name, self.output_folder)
+        return 'SortingOutput({}, {}, {})'.format(self.sorter_name, self.output_folder, self._sorting)
+
+
+def iter_output_folders(output_folders, use_index=True):
+    """
+    Iterator over the output folders of a working folder of run_sorters(), yielding the triplets
+    (rec_name, sorter_name, output_folder) of the finished runs.
+
+    With use_index=True the index of the working folder is read when it exists, otherwise every output folder
+    and its log are scanned.
+    """
     output_folders = Path(output_folders)
+    index = _read_output_index(output_folders) if use_index else None
+    if index is not None:
+        for entry in index.values():
+            yield entry['rec_name'], entry['sorter_name'], output_folders / entry['rec_name'] / entry['sorter_name']
+        return
+
     for rec_name in os.listdir(output_folders):
         if not (output_folders / rec_name).is_dir():
             continue
@@ -199,24 +703,47 @@ def iter_output_folders(output_folders):
             yield rec_name, sorter_name, output_folder
 
 
-def iter_sorting_output(output_folders):
+def iter_sorting_output(output_folders, lazy=False, use_index=True):
     """
     Iterator over output_folder to retrieve all triplets
     (rec_name, sorter_name, sorting)
+
+    With lazy=True the sortings are SortingOutput proxies, loaded on first access.
     """
-    for rec_name, sorter_name, output_folder in iter_output_folders(output_folders):
-        SorterClass = sorter_dict[sorter_name]
-        sorting = SorterClass.get_result_from_folder(output_folder)
+    for rec_name, sorter_name, output_folder in iter_output_folders(output_folders, use_index=use_index):
+        if lazy:
+            sorting = SortingOutput(sorter_name, output_folder)
+        else:
+            SorterClass = sorter_dict[sorter_name]
+            sorting = SorterClass.get_result_from_folder(output_folder)
         yield rec_name, sorter_name, sorting
 
 
-def collect_sorting_outputs(output_folders):
+def collect_sorting_outputs(output_folders, lazy=False, use_index=True, n_jobs=1):
     """
     Collect results in a output_folders.
 
     The output is a  dict with double key access results[(rec_name, sorter_name)] of SortingExtractor.
+    The SortingExtractors are loaded by 'n_jobs' threads (-1: number of cores, default 1).
+    With lazy=True only the index of the working folder is read and the values are SortingOutput proxies (not
+    SortingExtractor instances): each sorting is loaded on the first access to its attributes (or with
+    SortingOutput.load()).
     """
+    if lazy:
+        return {(rec_name, sorter_name): sorting for rec_name, sorter_name, sorting
+                in iter_sorting_output(output_folders, lazy=True, use_index=use_index)}
+
+    outputs = list(iter_output_folders(output_folders, use_index=use_index))
+    num_workers = get_num_workers(n_jobs, len(outputs))
+    if num_workers == 1:
+        sortings = [sorter_dict[sorter_name].get_result_from_folder(output_folder)
+                    for _, sorter_name, output_folder in outputs]
+    else:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # map() keeps the order and raises the first error in this order
+            sortings = list(executor.map(lambda output: sorter_dict[output[1]].get_result_from_folder(output[2]),
+                                         outputs))
     results = {}
-    for rec_name, sorter_name, sorting in iter_sorting_output(output_folders):
+    for (rec_name, sorter_name, _), sorting in zip(outputs, sortings):
         results[(rec_name, sorter_name)] = sorting
     return results
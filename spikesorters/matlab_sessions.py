@@ -0,0 +1,390 @@
+"""
+Pool of warm MATLAB sessions for the MATLAB-based sorters (Kilosort, Kilosort2, Kilosort2.5, Kilosort3,
+IronClust, HDSort, WaveClus).
+
+Without a pool, each run starts 'matlab -nosplash -nodisplay -r <script>', which pays the startup of MATLAB
+(tens of seconds) for every recording or group. With a pool, the sessions are started once and run the
+scripts of the sorters one after the other:
+
+    >>> import spikesorters as ss
+    >>> ss.set_matlab_session_pool(num_sessions=2)
+    >>> sorting = ss.run_kilosort2(recording)  # sent to a warm session
+    >>> ss.set_matlab_session_pool(None)  # the sessions are closed
+
+Each session runs utils/spikesorters_session_server.m, which waits for the jobs written by python in the
+session folder (job.json, replaced atomically) and writes their exit code (<id>.done). The quit(n) of the
+scripts are replaced by spikesorters_exit(n) so that the session keeps running, the MATLAB path and the
+current folder are restored after each job.
+
+The sessions are checked before a job (the process is alive and, after 'health_check_interval' s without
+job, answers a ping) and recycled after 'max_jobs_per_session' jobs, a failed job or a timeout. The pool is
+only used in the process that created it (the children of the multiprocessing engine start MATLAB as usual).
+"""
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+from .cancellation import check_cancelled
+from .utils.shellscript import ON_WINDOWS, _new_process_group_kwargs, stop_process_group
+
+_matlab_session_pool = None
+
+_quit_pattern = re.compile(r'^(\s*)(?:quit|exit)\b\s*(?:\(\s*(\d*)\s*\))?\s*;?\s*$', flags=re.MULTILINE)
+
+
+def make_session_script(script_path):
+    """
+    Writes the version of a MATLAB script that can run in a warm session (quit(n) replaced by
+    spikesorters_exit(n)) next to the script and returns its path.
+    """
+    script_path = Path(script_path)
+    with open(str(script_path), 'r') as f:
+        txt = f.read()
+    txt = _quit_pattern.sub(lambda m: '{}spikesorters_exit({});'.format(m.group(1), m.group(2) or 0), txt)
+    session_script_path = script_path.parent / (script_path.stem + '_session.m')
+    with open(str(session_script_path), 'w') as f:
+        f.write(txt)
+    return session_script_path
+
+
+class _MatlabSession:
+    """
+    One MATLAB process running spikesorters_session_server.m in its session folder.
+    """
+    def __init__(self, matlab_command, folder, startup_timeout=300., poll_interval=0.05):
+        self.matlab_command = list(matlab_command)
+        self.folder = Path(folder)
+        self.startup_timeout = startup_timeout
+        self.poll_interval = poll_interval
+        self.num_jobs = 0
+        self.last_used = None
+        self._process = None
+        self._job_id = 0
+
+    def start(self):
+        if self.folder.is_dir():
+            shutil.rmtree(str(self.folder))
+        self.folder.mkdir(parents=True)
+        utils_folder = Path(__file__).parent / 'utils'
+        server_call = "addpath('{}'); spikesorters_session_server('{}')".format(utils_folder, self.folder)
+        self._log_file = open(str(self.folder / 'session.log'), 'w')
+        self._process = subprocess.Popen(self.matlab_command + [server_call], stdout=self._log_file,
+                                         stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                         **_new_process_group_kwargs())
+        t0 = time.time()
+        while not (self.folder / 'ready').is_file():
+            if not self.is_alive():
+                raise RuntimeError('The MATLAB session exited at startup, see {}'.format(self.folder / 'session.log'))
+            if time.time() - t0 > self.startup_timeout:
+                self.stop()
+                raise RuntimeError('The MATLAB session did not start in {} s'.format(self.startup_timeout))
+            time.sleep(self.poll_interval)
+        self.last_used = time.time()
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _send(self, job):
+        self._job_id += 1
+        job['id'] = self._job_id
+        tmp_file = self.folder / 'job.json.tmp'
+        with open(str(tmp_file), 'w', encoding='utf8') as f:
+            json.dump(job, f)
+        os.replace(str(tmp_file), str(self.folder / 'job.json'))
+        return self._job_id
+
+    def _wait(self, job_id, timeout=None, on_poll=None):
+        # returns the exit code of the job, or None if the session died
+        done_file = self.folder / '{}.done'.format(job_id)
+        t0 = time.time()
+        while not done_file.is_file():
+            if on_poll is not None:
+                on_poll()
+            if not self.is_alive():
+                return None
+            if timeout is not None and time.time() - t0 > timeout:
+                raise TimeoutError('The MATLAB session did not finish the job in {} s'.format(timeout))
+            time.sleep(self.poll_interval)
+        with open(str(done_file), 'r') as f:
+            status = int(f.read().strip() or 1)
+        done_file.unlink()
+        return status
+
+    def ping(self, timeout):
+        if not self.is_alive():
+            return False
+        try:
+            return self._wait(self._send({'type': 'ping'}), timeout=timeout) is not None
+        except TimeoutError:
+            return False
+
+    def run(self, script_path, folder, log_path, timeout=None, on_poll=None):
+        job = {'type': 'run', 'script': str(Path(script_path).absolute()), 'folder': str(Path(folder).absolute()),
+               'log': str(Path(log_path).absolute())}
+        job_id = self._send(job)
+        self.num_jobs += 1
+        try:
+            return self._wait(job_id, timeout=timeout, on_poll=on_poll)
+        finally:
+            self.last_used = time.time()
+
+    def stop(self, timeout=5.):
+        # timeout=0: the process is killed (e.g. a session busy with a timed out job)
+        if self.is_alive():
+            try:
+                if timeout == 0:
+                    raise subprocess.TimeoutExpired(self.matlab_command, timeout)
+                self._send({'type': 'quit'})
+                self._process.wait(timeout=timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+                self._process.wait()
+        if self._process is not None and not ON_WINDOWS:
+            # the helpers forked by MATLAB (e.g. parpool workers) run in the process group of the session
+            stop_process_group(self._process.pid, grace_periods=(None, 1., 5.))
+        if self._process is not None:
+            self._log_file.close()
+        self._process = None
+        shutil.rmtree(str(self.folder), ignore_errors=True)
+
+
+class MatlabSessionPool:
+    """
+    Pool of warm MATLAB sessions running the scripts of the MATLAB-based sorters (see the module docstring).
+
+    Parameters
+    ----------
+    num_sessions: int
+        Maximum number of sessions (started on demand)
+    matlab_command: list or None
+        The command starting MATLAB, the server call is appended (default
+        ['matlab', '-nosplash', '-nodisplay', '-r'])
+    max_jobs_per_session: int or None
+        The sessions are recycled after this number of jobs (None: never)
+    startup_timeout: float
+        Timeout in s of the startup of a session
+    health_check_interval: float
+        A session idle for more than this time (in s) must answer a ping before a job
+    health_check_timeout: float
+        Timeout in s of the ping
+    folder: str or Path or None
+        The folder of the session folders (temporary if None)
+    """
+    def __init__(self, num_sessions=1, matlab_command=None, max_jobs_per_session=20, startup_timeout=300.,
+                 health_check_interval=60., health_check_timeout=30., folder=None):
+        if matlab_command is None:
+            matlab_command = ['matlab', '-nosplash', '-nodisplay', '-r']
+        self.num_sessions = num_sessions
+        self.matlab_command = list(matlab_command)
+        self.max_jobs_per_session = max_jobs_per_session
+        self.startup_timeout = startup_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._remove_folder = folder is None
+        self.folder = Path(tempfile.mkdtemp(prefix='spikesorters_matlab_sessions_')) if folder is None \
+            else Path(folder)
+        self.pid = os.getpid()
+        self._idle = queue.Queue()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._num_created = 0
+        self._closed = False
+
+    def _new_session(self):
+        with self._lock:
+            self._num_created += 1
+            folder = self.folder / 'session_{}'.format(self._num_created)
+        session = _MatlabSession(self.matlab_command, folder, startup_timeout=self.startup_timeout)
+        session.start()
+        return session
+
+    def _is_healthy(self, session):
+        if not session.is_alive():
+            return False
+        if self.max_jobs_per_session is not None and session.num_jobs >= self.max_jobs_per_session:
+            return False
+        if time.time() - session.last_used > self.health_check_interval:
+            return session.ping(self.health_check_timeout)
+        return True
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError('The MATLAB session pool is closed')
+                slot = None
+                if self._idle.empty() and len(self._sessions) < self.num_sessions:
+                    # reserve a slot for a new session
+                    slot = object()
+                    self._sessions.append(slot)
+            if slot is not None:
+                try:
+                    session = self._new_session()
+                except BaseException:
+                    self._remove(slot)
+                    raise
+                self._replace(slot, session)
+                return session
+            try:
+                # polled: a slot can also be freed by a recycled session
+                session = self._idle.get(timeout=0.1)
+            except queue.Empty:
+                # a sorter run cancelled while waiting for a session (see cancellation.py)
+                check_cancelled()
+                continue
+            if not self._is_healthy(session):
+                # recycling
+                session.stop()
+                try:
+                    new_session = self._new_session()
+                except BaseException:
+                    self._remove(session)
+                    raise
+                self._replace(session, new_session)
+                session = new_session
+            return session
+
+    def _replace(self, old, new):
+        with self._lock:
+            self._sessions[self._sessions.index(old)] = new
+
+    def _remove(self, session):
+        with self._lock:
+            self._sessions.remove(session)
+
+    def _release(self, session, recycle=False, kill=False):
+        if recycle or self._closed:
+            session.stop(timeout=0 if kill else 5.)
+            self._remove(session)
+        else:
+            self._idle.put(session)
+
+    def run_script(self, script_path, folder=None, log_path=None, timeout=None, verbose=False):
+        """
+        Runs a MATLAB script (e.g. kilosort2_master.m) in a warm session and returns its exit code.
+
+        Parameters
+        ----------
+        script_path: str or Path
+            The script, its quit(n) are replaced (see make_session_script())
+        folder: str or Path or None
+            The current folder of the script (the folder of the script if None)
+        log_path: str or Path or None
+            The file of the output of the script (folder/spikesorters_log.txt if None)
+        timeout: float or None
+            Timeout in s, the session is then stopped and a TimeoutError is raised
+        verbose: bool
+            If True, the output of the script is printed while it runs
+
+        Returns
+        -------
+        exit_code: int
+            The exit code of the script (-1 if the session died)
+        """
+        script_path = Path(script_path)
+        folder = Path(folder) if folder is not None else script_path.parent
+        log_path = Path(log_path) if log_path is not None else folder / 'spikesorters_log.txt'
+        session_script_path = make_session_script(script_path)
+        log_path.write_text('')
+
+        position = [0]
+
+        def print_output():
+            with open(str(log_path), 'r') as f:
+                f.seek(position[0])
+                txt = f.read()
+                position[0] = f.tell()
+            if len(txt) > 0:
+                print(txt, end='')
+
+        def on_poll():
+            if verbose:
+                print_output()
+            # in a cancelled sorter run, the session is killed (see cancellation.py)
+            check_cancelled()
+
+        session = self._acquire()
+        status = None
+        try:
+            status = session.run(session_script_path, folder, log_path, timeout=timeout, on_poll=on_poll)
+        finally:
+            # a session that failed a job (or timed out) is not reused: its state is unknown
+            self._release(session, recycle=status != 0, kill=status is None)
+        if verbose:
+            print_output()
+        if status is None:
+            print('The MATLAB session died, see {}'.format(session.folder / 'session.log'))
+            return -1
+        return status
+
+    def get_status(self):
+        """
+        Returns the list of the sessions as dicts with 'folder', 'alive', 'num_jobs' and 'idle'.
+        """
+        with self._lock:
+            sessions = [s for s in self._sessions if isinstance(s, _MatlabSession)]
+            idle = list(self._idle.queue)
+        return [{'folder': str(s.folder), 'alive': s.is_alive(), 'num_jobs': s.num_jobs, 'idle': s in idle}
+                for s in sessions]
+
+    def close(self):
+        """
+        Stops the idle sessions (the busy ones are stopped at the end of their job).
+        """
+        self._closed = True
+        while not self._idle.empty():
+            session = self._idle.get()
+            session.stop()
+            self._remove(session)
+        if self._remove_folder and len(self._sessions) == 0:
+            shutil.rmtree(str(self.folder), ignore_errors=True)
+
+
+def set_matlab_session_pool(num_sessions=1, matlab_command=None, **kwargs):
+    """
+    Enables (or disables with num_sessions=None) the pool of warm MATLAB sessions used by the MATLAB-based
+    sorters. The previous pool is closed.
+
+    Parameters
+    ----------
+    num_sessions: int or None
+        Maximum number of sessions. If None the pool is disabled
+    matlab_command: list or None
+        The command starting MATLAB (default ['matlab', '-nosplash', '-nodisplay', '-r'])
+    **kwargs: keyword args
+        The other arguments of MatlabSessionPool (max_jobs_per_session, startup_timeout, health_check_interval,
+        health_check_timeout, folder)
+    """
+    global _matlab_session_pool
+    if _matlab_session_pool is not None:
+        _matlab_session_pool.close()
+    if num_sessions is None:
+        _matlab_session_pool = None
+    else:
+        _matlab_session_pool = MatlabSessionPool(num_sessions=num_sessions, matlab_command=matlab_command,
+                                                 **kwargs)
+
+
+def get_matlab_session_pool():
+    """
+    Returns the pool of MATLAB sessions, or None if it is disabled (or was created by another process).
+    """
+    if _matlab_session_pool is None or _matlab_session_pool.pid != os.getpid():
+        return None
+    return _matlab_session_pool
+
+
+def _close_matlab_session_pool():
+    if get_matlab_session_pool() is not None:
+        _matlab_session_pool.close()
+
+
+atexit.register(_close_matlab_session_pool)
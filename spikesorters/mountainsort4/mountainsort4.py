@@ -2,17 +2,9 @@ import copy
 from pathlib import Path
 
 import spikeextractors as se
-from spiketoolkit.preprocessing import bandpass_filter, whiten
 
 from ..basesorter import BaseSorter
-from ..sorter_tools import recover_recording
-
-try:
-    import ml_ms4alg
-
-    HAVE_MS4 = True
-except ImportError:
-    HAVE_MS4 = False
+from ..sorter_tools import recover_recording, get_recording_size_mb
 
 
 class Mountainsort4Sorter(BaseSorter):
@@ -22,6 +14,7 @@ class Mountainsort4Sorter(BaseSorter):
 
     sorter_name = 'mountainsort4'
     requires_locations = False
+    resource_footprint = {'cores': 'num_workers', 'licenses': {}}
     compatible_with_parallel = {'loky': True, 'multiprocessing': False, 'threading': False}
 
     _default_params = {
@@ -71,18 +64,32 @@ class Mountainsort4Sorter(BaseSorter):
     
     @classmethod
     def is_installed(cls):
+        try:
+            import ml_ms4alg
+            HAVE_MS4 = True
+        except ImportError:
+            HAVE_MS4 = False
         return HAVE_MS4
     
     @staticmethod
     def get_sorter_version():
+        import ml_ms4alg
         if hasattr(ml_ms4alg, '__version__'):
             return ml_ms4alg.__version__
         return 'unknown'
 
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        # the filtered and whitened float32 traces are held in memory
+        return {'scratch_mb': 0.,
+                'ram_mb': 500. + 2 * get_recording_size_mb(recording, 'float32')}
+
     def _setup_recording(self, recording, output_folder):
         pass
 
     def _run(self, recording, output_folder):
+        import ml_ms4alg
+        from spiketoolkit.preprocessing import bandpass_filter, whiten
         recording = recover_recording(recording)
         # Sort
         # alias to params
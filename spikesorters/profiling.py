@@ -0,0 +1,135 @@
+"""
+Profiling of the stages of a sorter run (setup, run, result loading), written in spikeinterface_log.json:
+
+    "profile": {
+        "setup": {"wall_time": ..., "cpu_time": ..., "peak_rss_mb": ..., "peak_children_rss_mb": ...,
+                  "bytes_read": ..., "bytes_written": ...},
+        "run": {..., "backend_stages": {"preprocessDataSub": ..., "learnAndSolve8b": ...}},
+        "get_result": {...}
+    }
+
+The counters are the ones of the whole process: the CPU time and I/O of the external processes are included
+once they are finished, the stages that overlap (pipelined or parallel runs) are not separated. The I/O
+counters are only available on Linux, the sampled peak RSS on Linux (elsewhere the peak RSS of the process
+since its start is given).
+
+The backend stages are parsed from the runtime trace of the sorter: the lines
+'spikesorters_stage <name> <seconds>' printed by the wrapper scripts (see format_backend_stage()).
+"""
+import os
+import sys
+import time
+import threading
+
+try:
+    import resource
+    HAVE_RESOURCE = True
+except ImportError:
+    HAVE_RESOURCE = False
+
+backend_stage_marker = 'spikesorters_stage'
+
+
+def format_backend_stage(name, seconds):
+    """
+    Returns the runtime trace line of a backend stage.
+    """
+    return '{} {} {:.3f}'.format(backend_stage_marker, name, seconds)
+
+
+def parse_backend_stages(runtime_trace):
+    """
+    Returns the dict {stage name: seconds} of the backend stage lines of a runtime trace (list of lines).
+    """
+    stages = {}
+    for line in runtime_trace:
+        fields = line.strip().split()
+        if len(fields) == 3 and fields[0] == backend_stage_marker:
+            try:
+                stages[fields[1]] = stages.get(fields[1], 0.) + float(fields[2])
+            except ValueError:
+                pass
+    return stages
+
+
+def _read_proc_io():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {key: int(value) for key, value in (line.split(':') for line in f if ':' in line)}
+    except (OSError, ValueError):
+        return None
+
+
+def _read_proc_rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _get_maxrss_mb(who):
+    if not HAVE_RESOURCE:
+        return None
+    unit = 1e6 if sys.platform == 'darwin' else 1e3
+    return resource.getrusage(who).ru_maxrss / unit
+
+
+class StageProfiler:
+    """
+    Context manager measuring the wall time, CPU time, peak RSS and I/O of a stage (see the module docstring).
+    The measures are in the 'stats' dict after the exit.
+
+    Parameters
+    ----------
+    sample_interval: float
+        Interval in s of the sampling of the RSS
+    """
+    def __init__(self, sample_interval=0.1):
+        self.sample_interval = sample_interval
+        self.stats = None
+        self._stop = threading.Event()
+        self._peak_rss_mb = None
+
+    def _sample_rss(self):
+        while not self._stop.is_set():
+            rss_mb = _read_proc_rss_mb()
+            if rss_mb is not None:
+                self._peak_rss_mb = max(self._peak_rss_mb or 0., rss_mb)
+            self._stop.wait(self.sample_interval)
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self._times0 = os.times()
+        self._io0 = _read_proc_io()
+        self._children_rss0 = _get_maxrss_mb(resource.RUSAGE_CHILDREN) if HAVE_RESOURCE else None
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        wall_time = time.perf_counter() - self._t0
+        times1 = os.times()
+        io1 = _read_proc_io()
+        self._stop.set()
+        self._sampler.join()
+
+        cpu_time = sum(t1 - t0 for t0, t1 in zip(self._times0[:4], times1[:4]))
+        peak_rss_mb = self._peak_rss_mb
+        if peak_rss_mb is None and HAVE_RESOURCE:
+            peak_rss_mb = _get_maxrss_mb(resource.RUSAGE_SELF)
+        # the peak of the children is known only if a child of this stage has the largest peak so far
+        peak_children_rss_mb = None
+        if HAVE_RESOURCE:
+            children_rss1 = _get_maxrss_mb(resource.RUSAGE_CHILDREN)
+            if children_rss1 > self._children_rss0:
+                peak_children_rss_mb = children_rss1
+        bytes_read = bytes_written = None
+        if self._io0 is not None and io1 is not None:
+            # the largest of the syscall counters and of the storage counters (memmap writes, cached reads)
+            bytes_read = max(io1['rchar'] - self._io0['rchar'], io1['read_bytes'] - self._io0['read_bytes'])
+            bytes_written = max(io1['wchar'] - self._io0['wchar'], io1['write_bytes'] - self._io0['write_bytes'])
+        self.stats = {'wall_time': wall_time, 'cpu_time': cpu_time, 'peak_rss_mb': peak_rss_mb,
+                      'peak_children_rss_mb': peak_children_rss_mb, 'bytes_read': bytes_read,
+                      'bytes_written': bytes_written}
+        return False
@@ -0,0 +1,316 @@
+"""
+Estimation of the scratch disk, peak RAM and wall time needed to sort a recording.
+
+Each sorter class gives an analytic estimate of its peak RAM and scratch disk (BaseSorter._estimate_resources:
+the copies of the traces it writes, its batch buffers, ...). The estimates can be calibrated by benchmark
+runs on toy recordings of several channel counts and durations:
+
+    >>> import spikesorters as ss
+    >>> ss.set_resource_calibration_file('~/.spikesorters_calibration.json')
+    >>> ss.calibrate_resources('kilosort2', num_channels=(16, 32), durations=(60, 120))
+    >>> ss.estimate_resources('kilosort2', recording)
+    {'scratch_mb': ..., 'ram_mb': ..., 'run_time_s': ..., 'calibrated': True}
+
+The calibration fits, for each sorter, the measured peak RAM and scratch disk as a linear function of the
+analytic estimates and the run time as a linear function of the channel-hours of the recording. The wall time
+is only known for calibrated sorters. The calibration file can also be set with the
+SPIKESORTERS_RESOURCE_CALIBRATION environment variable.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+
+from .sorter_tools import get_bindat_passthrough_path, get_recording_size_mb
+
+try:
+    import resource
+    HAVE_RESOURCE = True
+except ImportError:
+    HAVE_RESOURCE = False
+
+_calibrations = {}
+_calibration_file = None
+
+
+def set_resource_calibration_file(file_path):
+    """
+    Sets (or unsets with file_path=None) the json file where the resource calibrations are saved.
+
+    Parameters
+    ----------
+    file_path: str or Path or None
+        The json file
+    """
+    global _calibration_file
+    if file_path is None:
+        _calibration_file = None
+    else:
+        _calibration_file = Path(file_path).expanduser().absolute()
+
+
+def get_resource_calibration_file():
+    """
+    Returns the json file of the resource calibrations or None (SPIKESORTERS_RESOURCE_CALIBRATION environment
+    variable if set_resource_calibration_file() has not been called).
+    """
+    if _calibration_file is not None:
+        return _calibration_file
+    file_path = os.getenv('SPIKESORTERS_RESOURCE_CALIBRATION', None)
+    if file_path:
+        return Path(file_path).expanduser().absolute()
+    return None
+
+
+def _get_sorter_class(sorter_name_or_class):
+    if isinstance(sorter_name_or_class, str):
+        from .sorterlist import get_sorter_class
+        return get_sorter_class(sorter_name_or_class)
+    return sorter_name_or_class
+
+
+def _read_calibration_file(cache_file):
+    if cache_file is None or not cache_file.is_file():
+        return {}
+    try:
+        with open(str(cache_file), 'r', encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def get_resource_calibration(sorter_name_or_class):
+    """
+    Returns the calibration of a sorter (None if it has not been calibrated).
+    """
+    SorterClass = _get_sorter_class(sorter_name_or_class)
+    calibration = _calibrations.get(SorterClass.sorter_name, None)
+    if calibration is None:
+        calibration = _read_calibration_file(get_resource_calibration_file()).get(SorterClass.sorter_name, None)
+    return calibration
+
+
+def _get_channel_hours(recording):
+    return recording.get_num_channels() * recording.get_num_frames() / 30000. / 3600.
+
+
+def estimate_kilosort_resources(recording, NT, ntbuff):
+    """
+    Analytic estimate of the Kilosort sorters (KilosortSorter, Kilosort2Sorter...): the int16 copy of the traces
+    (none with the passthrough) and the whitened int16 temp_wh.dat on the scratch disk, the RAM is dominated by
+    the MATLAB runtime and the batch buffers of NT samples.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to sort
+    NT: int or None
+        The batch size in samples (None: the default of the sorter)
+    ntbuff: int
+        The buffer of the batches in samples
+
+    Returns
+    -------
+    estimate: dict
+        Dictionary with 'scratch_mb' and 'ram_mb'
+    """
+    copy_mb = 0. if get_bindat_passthrough_path(recording, dtype='int16') is not None \
+        else get_recording_size_mb(recording, 'int16')
+    if NT is None:
+        NT = 64 * 1024 + ntbuff
+    return {'scratch_mb': copy_mb + get_recording_size_mb(recording, 'int16'),
+            'ram_mb': 2000. + 16 * NT * recording.get_num_channels() * 4 / 1e6}
+
+
+def estimate_resources(sorter_name_or_class, recording, **params):
+    """
+    Estimates the scratch disk, peak RAM and wall time needed to sort a recording.
+
+    Parameters
+    ----------
+    sorter_name_or_class: str or SorterClass
+        The sorter
+    recording: RecordingExtractor
+        The recording to sort
+    **params: keyword args
+        The sorter params (the default ones are used for the missing keys)
+
+    Returns
+    -------
+    estimate: dict
+        Dictionary with 'scratch_mb', 'ram_mb', 'run_time_s' (None if the sorter is not calibrated)
+        and 'calibrated' (bool)
+    """
+    SorterClass = _get_sorter_class(sorter_name_or_class)
+    p = SorterClass.default_params()
+    p.update(params)
+    estimate = SorterClass._estimate_resources(recording, p)
+    estimate = {'scratch_mb': float(estimate['scratch_mb']), 'ram_mb': float(estimate['ram_mb']),
+                'run_time_s': None, 'calibrated': False}
+    calibration = get_resource_calibration(SorterClass)
+    if calibration is not None:
+        for key in ('scratch_mb', 'ram_mb'):
+            if calibration.get(key, None) is not None:
+                a, b = calibration[key]
+                estimate[key] = max(a + b * estimate[key], 0.)
+        if calibration.get('run_time_s', None) is not None:
+            a, b = calibration['run_time_s']
+            estimate['run_time_s'] = max(a + b * _get_channel_hours(recording), 0.)
+        estimate['calibrated'] = True
+    return estimate
+
+
+def _get_folder_size_mb(folder):
+    size = 0
+    for root, dirs, files in os.walk(str(folder)):
+        for file_name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size / 1e6
+
+
+def _get_peak_rss_mb():
+    # peak RSS of this process plus the one of its largest child (e.g. the MATLAB process of the sorter)
+    if not HAVE_RESOURCE:
+        return None
+    unit = 1e6 if sys.platform == 'darwin' else 1e3
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (peak_self + peak_children) / unit
+
+
+def _calibration_run(conn, SorterClass, num_channels, duration, params, output_folder):
+    # runs in a child process, so that the peak RSS is the one of this run only
+    import spikeextractors as se
+    from .sorterlist import run_sorter
+
+    exitcode = 0
+    try:
+        recording, _ = se.example_datasets.toy_example(num_channels=num_channels, duration=duration, seed=0)
+        t0 = time.perf_counter()
+        run_sorter(SorterClass, recording, output_folder=output_folder, **params)
+        run_time = time.perf_counter() - t0
+        conn.send({'channel_hours': _get_channel_hours(recording),
+                   'estimate': SorterClass._estimate_resources(recording, dict(SorterClass.default_params(),
+                                                                               **params)),
+                   'run_time_s': run_time, 'ram_mb': _get_peak_rss_mb()})
+    except BaseException as e:
+        conn.send({'error': '{}: {}'.format(type(e).__name__, e)})
+        exitcode = 1
+    finally:
+        conn.close()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # do not wait for the idle workers of reusable pools (e.g. joblib/loky)
+        os._exit(exitcode)
+
+
+def _fit_linear(x, y):
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    if len(x) < 2 or np.ptp(x) == 0:
+        # a single size: the estimates are scaled to the measures (or replaced by their mean)
+        if np.sum(x) > 0:
+            return [0., float(np.sum(y) / np.sum(x))]
+        return [float(np.mean(y)), 0.]
+    b, a = np.polyfit(x, y, 1)
+    if b < 0:
+        # the measures are dominated by a constant overhead
+        return [float(np.mean(y)), 0.]
+    return [float(a), float(b)]
+
+
+def calibrate_resources(sorter_name_or_class, num_channels=(4, 8, 16), durations=(10, 30), folder=None,
+                        verbose=False, **params):
+    """
+    Calibrates the resource estimates of a sorter with runs on toy_example recordings, and saves the
+    calibration (in the calibration file if one is set).
+
+    Each run is done in a child process: the peak RAM is its peak RSS (including the largest of its child
+    processes), the scratch disk is the peak size of the output folder, polled during the run.
+
+    Parameters
+    ----------
+    sorter_name_or_class: str or SorterClass
+        The sorter
+    num_channels: list
+        The channel counts of the toy recordings
+    durations: list
+        The durations in s of the toy recordings
+    folder: str or Path or None
+        The folder of the runs (a temporary folder if None), removed at the end
+    verbose: bool
+        If True, the measures are printed
+    **params: keyword args
+        The sorter params of the runs
+
+    Returns
+    -------
+    calibration: dict
+        Dictionary with the linear fits [a, b] of 'scratch_mb', 'ram_mb' and 'run_time_s', and the 'measures'
+    """
+    SorterClass = _get_sorter_class(sorter_name_or_class)
+    if folder is None:
+        folder = Path(tempfile.mkdtemp(prefix='spikesorters_calibration_'))
+    else:
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+
+    ctx = multiprocessing.get_context('spawn')
+    measures = []
+    try:
+        for n in num_channels:
+            for duration in durations:
+                output_folder = folder / '{}_{}ch_{}s'.format(SorterClass.sorter_name, n, duration)
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                process = ctx.Process(target=_calibration_run,
+                                      args=(child_conn, SorterClass, n, duration, params, output_folder))
+                process.start()
+                child_conn.close()
+                scratch_mb = 0.
+                while process.is_alive():
+                    scratch_mb = max(scratch_mb, _get_folder_size_mb(output_folder))
+                    process.join(0.2)
+                scratch_mb = max(scratch_mb, _get_folder_size_mb(output_folder))
+                result = parent_conn.recv() if parent_conn.poll() else {'error': 'no result from the calibration run'}
+                if 'error' in result:
+                    raise RuntimeError('Calibration run of {} failed: {}'.format(SorterClass.sorter_name,
+                                                                                 result['error']))
+                result['scratch_mb'] = scratch_mb
+                measures.append(result)
+                if verbose:
+                    print('{} {} channels {} s: {:.1f} MB scratch, {} MB RAM, {:.1f} s'.format(
+                        SorterClass.sorter_name, n, duration, scratch_mb, result['ram_mb'], result['run_time_s']))
+                shutil.rmtree(str(output_folder), ignore_errors=True)
+    finally:
+        shutil.rmtree(str(folder), ignore_errors=True)
+
+    calibration = {
+        'scratch_mb': _fit_linear([m['estimate']['scratch_mb'] for m in measures],
+                                  [m['scratch_mb'] for m in measures]),
+        'ram_mb': None,
+        'run_time_s': _fit_linear([m['channel_hours'] for m in measures], [m['run_time_s'] for m in measures]),
+        'params': params,
+        'measures': measures,
+    }
+    if all(m['ram_mb'] is not None for m in measures):
+        calibration['ram_mb'] = _fit_linear([m['estimate']['ram_mb'] for m in measures],
+                                            [m['ram_mb'] for m in measures])
+
+    _calibrations[SorterClass.sorter_name] = calibration
+    cache_file = get_resource_calibration_file()
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        file_calibrations = _read_calibration_file(cache_file)
+        file_calibrations[SorterClass.sorter_name] = calibration
+        with open(str(cache_file), 'w', encoding='utf8') as f:
+            json.dump(file_calibrations, f, indent=4)
+    return calibration
@@ -0,0 +1,170 @@
+"""
+Shared-memory transport of the recordings to the joblib workers of the parallel group sorting.
+
+With BaseSorter.run(parallel=True), the sub-recordings of the groups used to be shipped to the workers with
+dump_to_dict(): each worker rebuilt the extractor and read (and e.g. filtered or whitened) the traces again, and the
+recordings had to be dumpable. With the 'shared' transport, the traces of each group are written once to a scratch
+file which the workers memory-map: they get zero-copy views of the traces, and any recording (in memory,
+preprocessed...) can be sorted in parallel.
+
+The scratch files are written in /dev/shm when it has enough free space (the tmpfs behind multiprocessing's
+shared memory on linux), otherwise in the temporary folder. The folder can be set with the
+SPIKESORTERS_SHARED_RECORDING_FOLDER environment variable or set_shared_recording_folder().
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import spikeextractors as se
+from spikeextractors.extraction_tools import check_get_traces_args
+
+shared_recording_folder = os.getenv('SPIKESORTERS_SHARED_RECORDING_FOLDER', None)
+
+
+def set_shared_recording_folder(folder):
+    """
+    Sets the folder of the scratch files of the shared recordings.
+
+    Parameters
+    ----------
+    folder: str or Path or None
+        The folder, ideally on a RAM-backed filesystem. If None, /dev/shm or the temporary folder is used
+    """
+    global shared_recording_folder
+    shared_recording_folder = None if folder is None else str(Path(folder).absolute())
+
+
+def get_shared_recording_folder(size_bytes=0):
+    """
+    Returns the folder where a shared recording of 'size_bytes' is written.
+    """
+    if shared_recording_folder is not None:
+        Path(shared_recording_folder).mkdir(parents=True, exist_ok=True)
+        return Path(shared_recording_folder)
+    shm = Path('/dev/shm')
+    if shm.is_dir() and os.access(str(shm), os.W_OK):
+        # keep a margin for the other users of the shared memory
+        if shutil.disk_usage(str(shm)).free > 1.5 * size_bytes:
+            return shm
+    return Path(tempfile.gettempdir())
+
+
+class SharedRecordingExtractor(se.RecordingExtractor):
+    """
+    Recording whose traces are memory-mapped from a scratch file (see share_recording()).
+
+    Pickling it (e.g. to a joblib worker) only pickles the path and the channel properties: the traces are mapped
+    again, not copied. The traces are read only.
+    """
+    extractor_name = 'SharedRecording'
+    has_default_locations = False
+    is_writable = False
+
+    def __init__(self, file_path, sampling_frequency, num_frames, channel_ids, dtype, has_unscaled=False,
+                 is_filtered=False):
+        se.RecordingExtractor.__init__(self)
+        self._file_path = str(file_path)
+        self._sampling_frequency = float(sampling_frequency)
+        self._num_frames = int(num_frames)
+        self._channel_ids = list(channel_ids)
+        self._dtype = np.dtype(dtype).str
+        self.has_unscaled = has_unscaled
+        self.is_filtered = is_filtered
+        self._traces = self._map_traces()
+
+    def _map_traces(self):
+        return np.memmap(self._file_path, dtype=self._dtype, mode='r',
+                         shape=(self._num_frames, len(self._channel_ids)))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_traces')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._traces = self._map_traces()
+
+    def get_channel_ids(self):
+        return list(self._channel_ids)
+
+    def get_num_frames(self):
+        return self._num_frames
+
+    def get_sampling_frequency(self):
+        return self._sampling_frequency
+
+    @check_get_traces_args
+    def get_traces(self, channel_ids=None, start_frame=None, end_frame=None, return_scaled=True):
+        if list(channel_ids) == self._channel_ids:
+            # a view of the mapped file
+            return self._traces[start_frame:end_frame].T
+        channel_idxs = [self._channel_ids.index(ch) for ch in channel_ids]
+        return self._traces[start_frame:end_frame, channel_idxs].T
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    def remove(self):
+        """
+        Removes the scratch file (the recording can not be used afterwards).
+        """
+        self._traces = None
+        try:
+            os.remove(self._file_path)
+        except OSError:
+            # e.g. still mapped by a worker on windows
+            pass
+
+
+def share_recording(recording, folder=None, chunk_mb=500):
+    """
+    Writes the traces of a recording to a scratch file and returns a SharedRecordingExtractor mapping it.
+
+    The unscaled traces are written when the recording has them, with the gains and offsets in the channel
+    properties. The channel properties and the times are copied.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to share
+    folder: str or Path or None
+        The folder of the scratch file (default: see get_shared_recording_folder())
+    chunk_mb: float
+        Size in MB of the chunks of traces read from the recording
+
+    Returns
+    -------
+    shared_recording: SharedRecordingExtractor
+        The recording mapping the scratch file, to be removed with its remove() method
+    """
+    return_scaled = not recording.has_unscaled
+    dtype = np.dtype(recording.get_dtype(return_scaled=return_scaled))
+    num_frames = recording.get_num_frames()
+    num_channels = recording.get_num_channels()
+    if folder is None:
+        folder = get_shared_recording_folder(num_frames * num_channels * dtype.itemsize)
+    fd, file_path = tempfile.mkstemp(prefix='spikesorters_shared_', suffix='.raw', dir=str(folder))
+    os.close(fd)
+    try:
+        traces = np.memmap(file_path, dtype=dtype, mode='w+', shape=(num_frames, num_channels))
+        chunk_size = max(int(chunk_mb * 1e6 / (num_channels * dtype.itemsize)), 1)
+        for start_frame in range(0, num_frames, chunk_size):
+            end_frame = min(start_frame + chunk_size, num_frames)
+            traces[start_frame:end_frame] = recording.get_traces(start_frame=start_frame, end_frame=end_frame,
+                                                                 return_scaled=return_scaled).T
+        traces.flush()
+        del traces
+    except BaseException:
+        os.remove(file_path)
+        raise
+    shared_recording = SharedRecordingExtractor(file_path, recording.get_sampling_frequency(), num_frames,
+                                                recording.get_channel_ids(), dtype,
+                                                has_unscaled=recording.has_unscaled,
+                                                is_filtered=recording.is_filtered)
+    shared_recording.copy_channel_properties(recording)
+    shared_recording.copy_times(recording)
+    return shared_recording
@@ -0,0 +1,198 @@
+"""
+Cache of the installation status and version of the sorters.
+
+is_installed() and get_sorter_version() can be slow: they import the sorter packages or probe the
+installation folders, and git based sorters run a 'git rev-parse' subprocess. The results are cached
+at the process level and, optionally, in a json file shared by several processes:
+
+    >>> import spikesorters as ss
+    >>> ss.set_sorter_info_cache_file('~/.spikesorters_info.json')
+
+or with the SPIKESORTERS_INFO_CACHE environment variable.
+
+A cache entry is keyed by the path attributes of the sorter class (e.g. 'kilosort2_path'), the matching
+environment variables (e.g. 'KILOSORT2_PATH'), the modification times of these folders (and of their
+'.git' and 'version.txt'), and the modification times of the site-packages folders (for the sorters
+installed with pip). Any change of these invalidates the entry. clear_sorter_info_cache() removes all entries.
+"""
+import os
+import sys
+import json
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+_info_cache = {}
+_info_cache_lock = threading.Lock()
+_info_cache_file = None
+
+
+def set_sorter_info_cache_file(file_path):
+    """
+    Sets (or unsets with file_path=None) the json file where the sorter info are cached across processes.
+
+    Parameters
+    ----------
+    file_path: str or Path or None
+        The json file
+    """
+    global _info_cache_file
+    if file_path is None:
+        _info_cache_file = None
+    else:
+        _info_cache_file = Path(file_path).expanduser().absolute()
+
+
+def get_sorter_info_cache_file():
+    """
+    Returns the json file where the sorter info are cached or None (SPIKESORTERS_INFO_CACHE environment variable
+    if set_sorter_info_cache_file() has not been called).
+    """
+    if _info_cache_file is not None:
+        return _info_cache_file
+    file_path = os.getenv('SPIKESORTERS_INFO_CACHE', None)
+    if file_path:
+        return Path(file_path).expanduser().absolute()
+    return None
+
+
+def clear_sorter_info_cache():
+    """
+    Removes all the cached sorter info, in the process and in the cache file.
+    """
+    with _info_cache_lock:
+        _info_cache.clear()
+        cache_file = get_sorter_info_cache_file()
+        if cache_file is not None and cache_file.is_file():
+            cache_file.unlink()
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(str(path)).st_mtime
+    except OSError:
+        return None
+
+
+def get_sorter_install_key(SorterClass):
+    """
+    Returns the hash identifying the installation of a sorter (see module docstring).
+    """
+    d = {'sorter': f'{SorterClass.__module__}.{SorterClass.__qualname__}'}
+    folders = []
+    for attr in sorted(dir(SorterClass)):
+        if attr.startswith('_') or not attr.endswith('_path'):
+            continue
+        value = getattr(SorterClass, attr)
+        if value is not None and not isinstance(value, str):
+            continue
+        env_value = os.getenv(attr.upper(), None)
+        d[attr] = value
+        d[attr.upper()] = env_value
+        folders += [v.strip('"') for v in (value, env_value) if v]
+    mtimes = {}
+    for folder in folders:
+        for path in (folder, os.path.join(folder, '.git'), os.path.join(folder, '.git', 'HEAD'),
+                     os.path.join(folder, 'version.txt')):
+            mtimes[path] = _get_mtime(path)
+    for folder in sys.path:
+        if folder.endswith('site-packages') or folder.endswith('dist-packages'):
+            mtimes[folder] = _get_mtime(folder)
+    d['mtimes'] = mtimes
+    return hashlib.sha1(json.dumps(d, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def _read_cache_file(cache_file):
+    if cache_file is None or not cache_file.is_file():
+        return {}
+    try:
+        with open(str(cache_file), 'r', encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _write_cache_file(cache_file, name, entry):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    file_cache = _read_cache_file(cache_file)
+    file_cache[name] = entry
+    tmp_file = cache_file.parent / (cache_file.name + f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(str(tmp_file), 'w', encoding='utf8') as f:
+        json.dump(file_cache, f, indent=4)
+    os.replace(str(tmp_file), str(cache_file))
+
+
+def get_sorter_info(sorter_name_or_class, use_cache=True):
+    """
+    Returns the installation status and the version of a sorter, using the cache when possible.
+
+    Parameters
+    ----------
+    sorter_name_or_class: str or SorterClass
+        The sorter
+    use_cache: bool
+        If False, the sorter is probed again (and the cache is updated)
+
+    Returns
+    -------
+    info: dict
+        Dictionary with 'installed' (bool) and 'version' (str or None if not installed)
+    """
+    if isinstance(sorter_name_or_class, str):
+        from .sorterlist import get_sorter_class
+        SorterClass = get_sorter_class(sorter_name_or_class)
+    else:
+        SorterClass = sorter_name_or_class
+    name = f'{SorterClass.__module__}.{SorterClass.__qualname__}'
+    key = get_sorter_install_key(SorterClass)
+    cache_file = get_sorter_info_cache_file()
+
+    if use_cache:
+        with _info_cache_lock:
+            entry = _info_cache.get(name, None)
+            if entry is None or entry['key'] != key:
+                entry = _read_cache_file(cache_file).get(name, None)
+                if entry is not None and entry['key'] == key:
+                    _info_cache[name] = entry
+        if entry is not None and entry['key'] == key:
+            return {'installed': entry['installed'], 'version': entry['version']}
+
+    installed = bool(SorterClass.is_installed())
+    version = None
+    if installed:
+        try:
+            version = str(SorterClass.get_sorter_version())
+        except Exception:
+            version = 'unknown'
+    entry = {'key': key, 'installed': installed, 'version': version}
+    with _info_cache_lock:
+        _info_cache[name] = entry
+        if cache_file is not None:
+            _write_cache_file(cache_file, name, entry)
+    return {'installed': installed, 'version': version}
+
+
+def get_sorters_info(sorter_names, use_cache=True):
+    """
+    Returns the installation status and the version of several sorters. The sorters that are not
+    in the cache are probed concurrently.
+
+    Parameters
+    ----------
+    sorter_names: list
+        The sorter names
+    use_cache: bool
+        If False, the sorters are probed again (and the cache is updated)
+
+    Returns
+    -------
+    infos: dict
+        Dictionary with sorter names as keys and the dict of 'get_sorter_info()' as values
+    """
+    sorter_names = list(sorter_names)
+    if len(sorter_names) == 0:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(sorter_names)) as executor:
+        infos = executor.map(lambda name: get_sorter_info(name, use_cache=use_cache), sorter_names)
+        return dict(zip(sorter_names, infos))
@@ -4,7 +4,14 @@ Some utils function to run command.
 from subprocess import Popen, PIPE, CalledProcessError, call, check_output
 import shlex
 import sys
+import os
+import json
+import copy
+import hashlib
+from pathlib import Path
+import numpy as np
 import spikeextractors as se
+from spikeextractors.baseextractor import _check_json
 
 def _run_command_and_print_output(command):
     command_list = shlex.split(command, posix="win" not in sys.platform)
@@ -72,5 +79,227 @@ def recover_recording(rec_arg):
     return recording
 
 
+def get_recording_fingerprint(recording, **kwargs):
+    """
+    Returns a hash identifying the content of a recording.
+
+    The hash is computed from the serialized dict of the recording, its channel order, its
+    number of frames and sampling frequency, plus any extra keyword argument (e.g. dtype, time_axis).
+    The size and modification time of the source files (the files and the files of the folders in the
+    kwargs of the serialized dict) are included, so that a file rewritten at the same path changes the hash.
+    Non dumpable recordings (e.g. in memory) can not be identified and None is returned.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to fingerprint
+    **kwargs: keyword args
+        Extra json-serializable items to include in the hash
+
+    Returns
+    -------
+    fingerprint: str or None
+        The hexadecimal hash
+    """
+    if not recording.check_if_dumpable():
+        return None
+    d = dict()
+    d['recording'] = copy.deepcopy(recording.make_serialized_dict())
+    d['channel_ids'] = list(recording.get_channel_ids())
+    d['num_frames'] = recording.get_num_frames()
+    d['sampling_frequency'] = recording.get_sampling_frequency()
+    d['source_files'] = _get_source_file_stats(d['recording'])
+    d.update(kwargs)
+    txt = json.dumps(_check_json(d), sort_keys=True, default=str)
+    return hashlib.sha1(txt.encode('utf8')).hexdigest()
+
+
+def _get_source_file_stats(serialized_dict):
+    # (size, mtime) of the files pointed by the kwargs of a serialized extractor and of its parents
+    stats = {}
+
+    def add_path(path):
+        try:
+            path = Path(path)
+            if path.is_file():
+                files = [path]
+            elif path.is_dir():
+                files = [f for f in path.iterdir() if f.is_file()]
+            else:
+                return
+            for f in files:
+                st = f.stat()
+                stats[str(f.absolute())] = [st.st_size, st.st_mtime_ns]
+        except (OSError, ValueError):
+            # not a path
+            pass
+
+    def walk(obj):
+        if isinstance(obj, dict):
+            if 'class' in obj and 'kwargs' in obj:
+                # a serialized extractor: the module and class names are not paths
+                obj = obj['kwargs']
+            for value in obj.values():
+                walk(value)
+        elif isinstance(obj, (list, tuple)):
+            for value in obj:
+                walk(value)
+        elif isinstance(obj, (str, Path)) and str(obj) != '':
+            add_path(obj)
+
+    walk(serialized_dict)
+    return stats
+
+
+def get_bindat_passthrough_path(recording, dtype, file_offset=0):
+    """
+    Returns the path of the raw file of a BinDatRecordingExtractor when it can be given directly to a sorter,
+    i.e. when it has the expected dtype, time_axis=0 (C order, frames x channels), the expected offset,
+    and all the channels of the file, and no channel gains or offsets (the copy has the scaled traces).
+    Otherwise None is returned and the recording has to be copied.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording
+    dtype: str
+        The dtype expected by the sorter
+    file_offset: int
+        The header offset in bytes expected by the sorter
+
+    Returns
+    -------
+    raw_filename: Path or None
+        The absolute path of the raw file
+    """
+    if not isinstance(recording, se.BinDatRecordingExtractor):
+        return None
+    if recording._time_axis != 0:
+        return None
+    if recording._timeseries.dtype != np.dtype(dtype):
+        return None
+    if recording._timeseries.offset != file_offset:
+        return None
+    if recording.get_num_channels() != recording._numchan:
+        return None
+    if recording.has_unscaled and (np.any(np.asarray(recording.get_channel_gains()) != 1) or
+                                   np.any(np.asarray(recording.get_channel_offsets()) != 0)):
+        return None
+    return Path(recording._datfile).absolute()
+
+
+def get_recording_size_mb(recording, dtype):
+    """
+    Returns the size in MB of the traces of a recording written with a dtype.
+    """
+    return recording.get_num_channels() * recording.get_num_frames() * np.dtype(dtype).itemsize / 1e6
+
+
+def get_file_checksum(file_path, sample_mb=1):
+    """
+    Returns a fast checksum of a file, computed from its size and from samples of 'sample_mb' Mb taken at the
+    beginning, the middle and the end of the file (large binary files are not read entirely).
+
+    Parameters
+    ----------
+    file_path: str or Path
+        The file
+    sample_mb: float
+        The size in Mb of each sample
+
+    Returns
+    -------
+    checksum: str
+        The hexadecimal hash
+    """
+    file_path = Path(file_path)
+    size = file_path.stat().st_size
+    sample_size = int(sample_mb * 1e6)
+    h = hashlib.sha1(str(size).encode('utf8'))
+    with open(str(file_path), 'rb') as f:
+        if size <= 3 * sample_size:
+            h.update(f.read())
+        else:
+            for offset in (0, size // 2, size - sample_size):
+                f.seek(offset)
+                h.update(f.read(sample_size))
+    return h.hexdigest()
+
+
+def get_folder_manifest(folder, exclude=()):
+    """
+    Returns the size and checksum of all the files of a folder (recursively).
+
+    Parameters
+    ----------
+    folder: str or Path
+        The folder
+    exclude: list
+        File names to exclude
+
+    Returns
+    -------
+    manifest: dict
+        Dictionary with relative paths as keys and dict(size=..., checksum=...) as values
+    """
+    folder = Path(folder)
+    manifest = dict()
+    for file_path in sorted(folder.rglob('*')):
+        if not file_path.is_file() or file_path.name in exclude:
+            continue
+        manifest[file_path.relative_to(folder).as_posix()] = {'size': file_path.stat().st_size,
+                                                             'checksum': get_file_checksum(file_path)}
+    return manifest
+
+
+def check_folder_manifest(folder, manifest):
+    """
+    Checks that the files of a manifest (see get_folder_manifest()) are intact. The other files of the folder are
+    ignored.
+
+    Parameters
+    ----------
+    folder: str or Path
+        The folder
+    manifest: dict
+        The manifest
+
+    Returns
+    -------
+    intact: bool
+        True if all the files of the manifest have the same size and checksum
+    """
+    folder = Path(folder)
+    for relative_path, info in manifest.items():
+        file_path = folder / relative_path
+        if not file_path.is_file() or file_path.stat().st_size != info['size']:
+            return False
+        if get_file_checksum(file_path) != info['checksum']:
+            return False
+    return True
+
+
 class SpikeSortingError(RuntimeError):
     """Raised whenever spike sorting fails"""
+
+
+class SpikeSortingCancelled(SpikeSortingError):
+    """Raised when a spike sorting run is cancelled (see cancellation.py)"""
+    outcome = 'cancelled'
+
+
+class SpikeSortingTimeout(SpikeSortingCancelled):
+    """Raised when a spike sorting run exceeds its timeout"""
+    outcome = 'timeout'
+
+
+def get_num_workers(n_jobs, num_tasks):
+    """
+    Returns the number of workers for 'num_tasks' tasks with the joblib convention for n_jobs
+    (-1: all the cores, -2: all the cores but one, ...).
+    """
+    if n_jobs is None or n_jobs == 0:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(min(n_jobs, num_tasks), 1)
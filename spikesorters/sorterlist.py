@@ -1,42 +1,98 @@
-from .hdsort import HDSortSorter
-from .klusta import KlustaSorter
-from .tridesclous import TridesclousSorter
-from .mountainsort4 import Mountainsort4Sorter
-from .ironclust import IronClustSorter
-from .kilosort import KilosortSorter
-from .kilosort2 import Kilosort2Sorter
-from .kilosort2_5 import Kilosort2_5Sorter
-from .kilosort3 import Kilosort3Sorter
-from .spyking_circus import SpykingcircusSorter
-from .herdingspikes import HerdingspikesSorter
-from .waveclus import WaveClusSorter
-from .yass import YassSorter
-from .combinato import CombinatoSorter
-
-sorter_full_list = [
-    HDSortSorter,
-    KlustaSorter,
-    TridesclousSorter,
-    Mountainsort4Sorter,
-    IronClustSorter,
-    KilosortSorter,
-    Kilosort2Sorter,
-    Kilosort2_5Sorter,
-    Kilosort3Sorter,
-    SpykingcircusSorter,
-    HerdingspikesSorter,
-    WaveClusSorter,
-    YassSorter,
-    CombinatoSorter
-]
-
-sorter_dict = {s.sorter_name: s for s in sorter_full_list}
+import importlib
+import inspect
+from collections.abc import Mapping
+
+from .basesorter import BaseSorter
+from .sorter_info import get_sorters_info
+
+# the wrapper modules (and the sorter packages they import) are imported only when a sorter class is needed
+_sorter_registry = {
+    'hdsort': ('.hdsort', 'HDSortSorter'),
+    'klusta': ('.klusta', 'KlustaSorter'),
+    'tridesclous': ('.tridesclous', 'TridesclousSorter'),
+    'mountainsort4': ('.mountainsort4', 'Mountainsort4Sorter'),
+    'ironclust': ('.ironclust', 'IronClustSorter'),
+    'kilosort': ('.kilosort', 'KilosortSorter'),
+    'kilosort2': ('.kilosort2', 'Kilosort2Sorter'),
+    'kilosort2_5': ('.kilosort2_5', 'Kilosort2_5Sorter'),
+    'kilosort3': ('.kilosort3', 'Kilosort3Sorter'),
+    'spykingcircus': ('.spyking_circus', 'SpykingcircusSorter'),
+    'herdingspikes': ('.herdingspikes', 'HerdingspikesSorter'),
+    'waveclus': ('.waveclus', 'WaveClusSorter'),
+    'yass': ('.yass', 'YassSorter'),
+    'combinato': ('.combinato', 'CombinatoSorter'),
+}
+
+_sorter_class_names = {class_name: sorter_name for sorter_name, (_, class_name) in _sorter_registry.items()}
+
+
+def get_sorter_class(sorter_name):
+    """
+    Returns the sorter class of a sorter name, importing its wrapper module on first access.
+
+    Parameters
+    ----------
+    sorter_name: str
+        The sorter name (see 'available_sorters()')
+
+    Returns
+    -------
+    SorterClass: class
+        The sorter class
+    """
+    if sorter_name not in _sorter_registry:
+        raise KeyError(f"{sorter_name} is not in sorter list: {available_sorters()}")
+    module_name, class_name = _sorter_registry[sorter_name]
+    module = importlib.import_module(module_name, package=__package__)
+    return getattr(module, class_name)
+
+
+class _LazySorterDict(Mapping):
+    """
+    Read-only dict {sorter_name: SorterClass} resolving the sorter classes on access.
+    """
+    def __getitem__(self, sorter_name):
+        return get_sorter_class(sorter_name)
+
+    def __iter__(self):
+        return iter(_sorter_registry)
+
+    def __len__(self):
+        return len(_sorter_registry)
+
+    def __contains__(self, sorter_name):
+        return sorter_name in _sorter_registry
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(_sorter_registry.keys())})"
+
+
+sorter_dict = _LazySorterDict()
+
+
+def __getattr__(name):
+    # lazy module attributes (python >= 3.7): sorter_full_list and the sorter classes
+    if name == 'sorter_full_list':
+        return [get_sorter_class(sorter_name) for sorter_name in _sorter_registry]
+    if name in _sorter_class_names:
+        return get_sorter_class(_sorter_class_names[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _get_sorter_class(sorter_name_or_class):
+    if isinstance(sorter_name_or_class, str):
+        return sorter_dict[sorter_name_or_class]
+    elif inspect.isclass(sorter_name_or_class) and issubclass(sorter_name_or_class, BaseSorter):
+        return sorter_name_or_class
+    else:
+        raise (ValueError('Unknown sorter'))
 
 
 # generic launcher via function approach
 def run_sorter(sorter_name_or_class, recording, output_folder=None, delete_output_folder=False,
                grouping_property=None, parallel=False, verbose=False, raise_error=True, n_jobs=-1, joblib_backend='loky',
-               **params):
+               resume=False, pipeline_depth=None, compact_output=False, timeout=None, cancel_token=None,
+               recording_transport=None, **params):
     """
     Generic function to run a sorter via function approach.
 
@@ -71,6 +127,26 @@ def run_sorter(sorter_name_or_class, recording, output_folder=None, delete_outpu
         Number of jobs when parallel=True (default=-1)
     joblib_backend: str
         joblib backend when parallel=True (default='loky')
+    resume: bool
+        If True, the output folder is not deleted and the stages (setup, run) already done with the same
+        params and recording are skipped, e.g. to avoid copying again the traces after a crash (default False)
+    pipeline_depth: int or None
+        If not None and spike sorting is by 'grouping_property' with parallel=False, the setup (e.g. the binary
+        copy) of the next groups is done in the background while a group is sorted, at most 'pipeline_depth'
+        groups ahead (default None: all the groups are set up before sorting)
+    compact_output: bool
+        If True, the output is converted after the run to a compact store of the spike trains, memory-mapped
+        when the output is loaded again (see compact_store.py) (default False)
+    timeout: float or None
+        Wall-clock timeout in s of the setup and the run: the external processes of the sorter are then stopped,
+        and the 'timeout' outcome is recorded in spikeinterface_log.json (default None)
+    cancel_token: CancelToken or None
+        Token cancelling the run, e.g. from another thread (see cancellation.py) (default None)
+    recording_transport: 'dump', 'shared' or None
+        How the recordings of the groups reach the workers when parallel=True: 'dump' rebuilds them from
+        dump_to_dict() (the recordings must be dumpable), 'shared' writes their traces once to a scratch file
+        memory-mapped by the workers (see shared_recording.py). If None, 'dump' for dumpable recordings and
+        'shared' otherwise (default None)
     **params: keyword args
         Spike sorter specific arguments (they can be retrieved with 'get_default_params(sorter_name_or_class)'
 
@@ -80,17 +156,14 @@ def run_sorter(sorter_name_or_class, recording, output_folder=None, delete_outpu
         The spike sorted data
 
     """
-    if isinstance(sorter_name_or_class, str):
-        SorterClass = sorter_dict[sorter_name_or_class]
-    elif sorter_name_or_class in sorter_full_list:
-        SorterClass = sorter_name_or_class
-    else:
-        raise (ValueError('Unknown sorter'))
+    SorterClass = _get_sorter_class(sorter_name_or_class)
 
     sorter = SorterClass(recording=recording, output_folder=output_folder, grouping_property=grouping_property,
-                         verbose=verbose, delete_output_folder=delete_output_folder)
+                         verbose=verbose, delete_output_folder=delete_output_folder, resume=resume)
     sorter.set_params(**params)
-    sorter.run(raise_error=raise_error, parallel=parallel, n_jobs=n_jobs, joblib_backend=joblib_backend)
+    sorter.run(raise_error=raise_error, parallel=parallel, n_jobs=n_jobs, joblib_backend=joblib_backend,
+               pipeline_depth=pipeline_depth, compact_output=compact_output, timeout=timeout,
+               cancel_token=cancel_token, recording_transport=recording_transport)
     sortingextractor = sorter.get_result(raise_error=raise_error)
 
     return sortingextractor
@@ -103,21 +176,33 @@ def available_sorters():
     return sorted(list(sorter_dict.keys()))
 
 
-def installed_sorters():
+def installed_sorters(use_cache=True):
     """
     Lists installed sorters.
+
+    Parameters
+    ----------
+    use_cache: bool
+        If False, the installations are probed again instead of using the cache (see 'get_sorter_info()')
     """
-    l = sorted([s.sorter_name for s in sorter_full_list if s.is_installed()])
+    infos = get_sorters_info(sorter_dict.keys(), use_cache=use_cache)
+    l = sorted([name for name, info in infos.items() if info['installed']])
     return l
 
-def print_sorter_versions():
+def print_sorter_versions(use_cache=True):
     """
     Prints versions of all installed sorters.
+
+    Parameters
+    ----------
+    use_cache: bool
+        If False, the installations are probed again instead of using the cache (see 'get_sorter_info()')
     """
+    infos = get_sorters_info(sorter_dict.keys(), use_cache=use_cache)
     txt = ''
-    for name in installed_sorters():
-        version = sorter_dict[name].get_sorter_version()
-        txt += '{}: {}\n'.format(name, version)
+    for name in sorted(infos.keys()):
+        if infos[name]['installed']:
+            txt += '{}: {}\n'.format(name, infos[name]['version'])
     txt = txt[:-1]
     print(txt)
 
@@ -136,12 +221,7 @@ def get_default_params(sorter_name_or_class):
     default_params: dict
         Dictionary with default params for the specified sorter
     """
-    if isinstance(sorter_name_or_class, str):
-        SorterClass = sorter_dict[sorter_name_or_class]
-    elif sorter_name_or_class in sorter_full_list:
-        SorterClass = sorter_name_or_class
-    else:
-        raise (ValueError('Unknown sorter'))
+    SorterClass = _get_sorter_class(sorter_name_or_class)
 
     return SorterClass.default_params()
 
@@ -160,12 +240,7 @@ def get_params_description(sorter_name_or_class):
     params_description: dict
         Dictionary with parameter description
     """
-    if isinstance(sorter_name_or_class, str):
-        SorterClass = sorter_dict[sorter_name_or_class]
-    elif sorter_name_or_class in sorter_full_list:
-        SorterClass = sorter_name_or_class
-    else:
-        raise (ValueError('Unknown sorter'))
+    SorterClass = _get_sorter_class(sorter_name_or_class)
 
     return SorterClass.params_description()
 
@@ -185,12 +260,7 @@ def get_sorter_description(sorter_name_or_class):
         Dictionary with parameter description
     """
 
-    if isinstance(sorter_name_or_class, str):
-        SorterClass = sorter_dict[sorter_name_or_class]
-    elif sorter_name_or_class in sorter_full_list:
-        SorterClass = sorter_name_or_class
-    else:
-        raise (ValueError('Unknown sorter'))
+    SorterClass = _get_sorter_class(sorter_name_or_class)
 
     return SorterClass.sorter_description
 
@@ -4,17 +4,12 @@ import os
 import numpy as np
 from numpy.lib.format import open_memmap
 import sys
+from joblib import Parallel, delayed
 
 import spikeextractors as se
 from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
-from ..sorter_tools import recover_recording
-
-try:
-    import circus
-    HAVE_SC = True
-except ImportError:
-    HAVE_SC = False
+from ..sorter_tools import recover_recording, get_recording_size_mb, get_num_workers
 
 
 class SpykingcircusSorter(BaseSorter):
@@ -23,6 +18,8 @@ class SpykingcircusSorter(BaseSorter):
 
     sorter_name = 'spykingcircus'
     requires_locations = False
+    resource_footprint = {'cores': 'num_workers', 'licenses': {}}
+    runs_external_process = True
 
     _default_params = {
         'detect_sign': -1,  # -1 - 1 - 0
@@ -35,6 +32,9 @@ class SpykingcircusSorter(BaseSorter):
         'num_workers': None,
         'whitening_max_elts': 1000,  # I believe it relates to subsampling and affects compute time
         'clustering_max_elts': 10000,  # I believe it relates to subsampling and affects compute time
+        'dtype': 'float32',
+        'chunk_mb': 500,
+        'n_jobs_bin': 1
         }
 
     _params_description = {
@@ -49,6 +49,9 @@ class SpykingcircusSorter(BaseSorter):
         'num_workers': "Number of workers (if None, half of the cpu number is used)",
         'whitening_max_elts': "Max number of events per electrode for whitening",
         'clustering_max_elts': "Max number of events per electrode for clustering",
+        'dtype': "Data type of the .npy input file: 'float32' (default) or 'int16' (half the size)",
+        'chunk_mb': "Chunk size in Mb for saving to .npy format (default 500Mb)",
+        'n_jobs_bin': "Number of jobs for saving to .npy format (Default 1)"
     }
 
     sorter_description = """Spyking Circus uses a smart clustering and a greedy template matching approach for 
@@ -69,12 +72,25 @@ class SpykingcircusSorter(BaseSorter):
     
     @classmethod
     def is_installed(cls):
+        try:
+            import circus
+            HAVE_SC = True
+        except ImportError:
+            HAVE_SC = False
         return HAVE_SC
     
     @staticmethod
     def get_sorter_version():
+        import circus
         return circus.__version__
 
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        # .npy copy of the traces (filtered in place by spyking circus) and the results (~10%)
+        copy_mb = get_recording_size_mb(recording, params['dtype'])
+        return {'scratch_mb': 1.1 * copy_mb,
+                'ram_mb': 1000. + 0.2 * get_recording_size_mb(recording, 'float32')}
+
     def _setup_recording(self, recording, output_folder):
         p = self.params
         source_dir = Path(__file__).parent
@@ -87,19 +103,9 @@ class SpykingcircusSorter(BaseSorter):
 
         # save binary file
         file_name = 'recording'
-        # We should make this copy more efficient with chunks
-
-        n_chan = recording.get_num_channels()
-        n_frames = recording.get_num_frames()
-        chunk_size = 2 ** 24 // n_chan
         npy_file = str(output_folder / file_name) + '.npy'
-        data_file = open_memmap(npy_file, shape=(n_frames, n_chan), dtype=np.float32, mode='w+')
-        nb_chunks = n_frames // chunk_size
-        for i in range(nb_chunks + 1):
-            start_frame = i*chunk_size
-            end_frame = min((i+1)*chunk_size, n_frames)
-            data = recording.get_traces(start_frame=start_frame, end_frame=end_frame).astype('float32')
-            data_file[start_frame:end_frame, :] = data.T
+        write_npy_recording(recording, npy_file, dtype=p['dtype'], chunk_mb=p['chunk_mb'], n_jobs=p['n_jobs_bin'],
+                            verbose=self.verbose)
 
         if p['detect_sign'] < 0:
             detect_sign = 'negative'
@@ -156,3 +162,78 @@ class SpykingcircusSorter(BaseSorter):
     def get_result_from_folder(output_folder):
         sorting = se.SpykingCircusSortingExtractor(file_or_folder_path=Path(output_folder) / 'recording')
         return sorting
+
+
+def write_npy_recording(recording, npy_file, dtype='float32', chunk_mb=500, n_jobs=1, verbose=False):
+    """
+    Writes a recording in a .npy file with shape (num_frames, num_channels).
+
+    The traces are read by chunks and written to disjoint slices of the memmap, in parallel when n_jobs > 1,
+    so that the memory used is bounded by chunk_mb.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to write
+    npy_file: str or Path
+        The .npy file
+    dtype: str
+        The dtype of the .npy file
+    chunk_mb: int
+        Chunk size in Mb (shared between the jobs)
+    n_jobs: int
+        Number of jobs (joblib convention: -1 uses all the cores)
+    verbose: bool
+        If True, output is verbose
+    """
+    npy_file = str(npy_file)
+    n_chan = recording.get_num_channels()
+    n_frames = recording.get_num_frames()
+    # resolve the joblib convention (-1: all the cores...) before sizing the chunks
+    n_jobs = get_num_workers(n_jobs, n_frames)
+
+    n_bytes = max(np.dtype(dtype).itemsize, np.dtype(recording.get_dtype()).itemsize)
+    chunk_size = max(1, int(chunk_mb * 1e6) // (n_chan * n_bytes * n_jobs))
+    chunks = [(start_frame, min(start_frame + chunk_size, n_frames))
+              for start_frame in range(0, n_frames, chunk_size)]
+
+    # create the file with the header, workers then open it in r+ mode
+    data_file = open_memmap(npy_file, shape=(n_frames, n_chan), dtype=dtype, mode='w+')
+    del data_file
+
+    if n_jobs == 1:
+        data_file = np.load(npy_file, mmap_mode='r+')
+        for i, (start_frame, end_frame) in enumerate(chunks):
+            if verbose:
+                print(f"Writing chunk {i + 1} / {len(chunks)}")
+            _write_npy_chunk(recording, data_file, start_frame, end_frame)
+        data_file.flush()
+        del data_file
+    else:
+        if recording.check_if_dumpable():
+            rec_arg = recording.dump_to_dict()
+            backend = 'loky'
+        else:
+            rec_arg = recording
+            backend = 'threading'
+        Parallel(n_jobs=n_jobs, backend=backend, verbose=int(verbose))(
+            delayed(_write_npy_chunk)(rec_arg, npy_file, start_frame, end_frame)
+            for (start_frame, end_frame) in chunks)
+
+
+def _write_npy_chunk(rec_arg, data_file, start_frame, end_frame):
+    recording = recover_recording(rec_arg)
+    close = False
+    if isinstance(data_file, str):
+        data_file = np.load(data_file, mmap_mode='r+')
+        close = True
+    traces = recording.get_traces(start_frame=start_frame, end_frame=end_frame)
+    if np.issubdtype(data_file.dtype, np.integer) and not np.can_cast(traces.dtype, data_file.dtype):
+        # the out of range values saturate instead of wrapping around
+        info = np.iinfo(data_file.dtype)
+        traces = np.clip(traces, info.min, info.max)
+    # transpose and cast in one pass into the slice of the memmap
+    np.copyto(data_file[start_frame:end_frame, :], traces.T, casting='unsafe')
+    if close:
+        data_file.flush()
+        del data_file
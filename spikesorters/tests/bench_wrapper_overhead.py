@@ -0,0 +1,274 @@
+"""
+Benchmark of the overhead of the spikesorters wrappers, separately from the compute of the sorters.
+
+A no-op sorter goes through the same code paths as the wrappers (BaseSorter.run, the recording export of the
+setup, params dumping, log collection, get_result and the MultiSortingExtractor assembly) but its run only writes
+fake spike trains. The recording is synthetic (a tiled block of noise generated on the fly), so that large
+channel counts and durations do not need the disk space of a source file.
+
+The results are saved in a json file with the git commit, so that two commits can be compared:
+
+    python bench_wrapper_overhead.py --output before.json
+    git checkout my_branch
+    python bench_wrapper_overhead.py --output after.json --compare before.json
+
+A full sweep (this needs the disk space of the largest export, ~30 GB for 1024 channels and 2 h in float32):
+
+    python bench_wrapper_overhead.py --channels 4 64 384 1024 --durations 60 600 7200 --groups 1 4 16
+"""
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import spikeextractors as se
+from spikeextractors.extraction_tools import check_get_traces_args
+
+from spikesorters.basesorter import BaseSorter
+from spikesorters.profiling import StageProfiler
+from spikesorters.spyking_circus.spyking_circus import write_npy_recording
+from spikesorters.combinato.combinato import write_h5_recording
+from spikesorters.waveclus.waveclus import write_mat_files
+
+try:
+    import h5py
+    HAVE_H5PY = True
+except ImportError:
+    HAVE_H5PY = False
+
+export_formats = ['dat_int16', 'npy_float32', 'mda', 'h5', 'mat']
+
+
+class SyntheticRecording(se.RecordingExtractor):
+    """
+    Recording tiling a one second block of noise, with contiguous channel groups.
+    """
+    extractor_name = 'SyntheticRecording'
+    has_unscaled = False
+
+    def __init__(self, num_channels, duration, num_groups=1, sampling_frequency=30000., seed=0):
+        se.RecordingExtractor.__init__(self)
+        self._sampling_frequency = float(sampling_frequency)
+        self._num_frames = int(duration * sampling_frequency)
+        rng = np.random.RandomState(seed)
+        self._block = (rng.randn(num_channels, int(sampling_frequency)) * 20).astype('int16')
+        self.set_channel_locations(np.array([[0, 20 * i] for i in range(num_channels)]))
+        self.set_channel_groups(list(np.arange(num_channels) * num_groups // num_channels))
+
+    def get_channel_ids(self):
+        return list(range(self._block.shape[0]))
+
+    def get_num_frames(self):
+        return self._num_frames
+
+    def get_sampling_frequency(self):
+        return self._sampling_frequency
+
+    @check_get_traces_args
+    def get_traces(self, channel_ids=None, start_frame=None, end_frame=None, return_scaled=True):
+        frames = np.arange(start_frame, end_frame) % self._block.shape[1]
+        return self._block[np.array(channel_ids)][:, frames]
+
+
+class NoopSorter(BaseSorter):
+    """
+    Sorter exporting the recording in the setup (as the wrappers do) and writing one fake spike train
+    per channel in the run.
+    """
+    sorter_name = 'noop'
+    _default_params = {'export_format': 'dat_int16', 'chunk_mb': 500}
+    _params_description = {'export_format': "Recording export of the setup: " + ", ".join(export_formats),
+                           'chunk_mb': "Chunk size in Mb of the export"}
+
+    @classmethod
+    def is_installed(cls):
+        return True
+
+    @staticmethod
+    def get_sorter_version():
+        return '0.0'
+
+    def _setup_recording(self, recording, output_folder):
+        p = self.params
+        if p['export_format'] == 'dat_int16':
+            self._write_binary_recording(recording, output_folder / 'recording.dat', dtype='int16',
+                                         chunk_mb=p['chunk_mb'])
+        elif p['export_format'] == 'npy_float32':
+            write_npy_recording(recording, output_folder / 'recording.npy', dtype='float32', chunk_mb=p['chunk_mb'])
+        elif p['export_format'] == 'mda':
+            se.MdaRecordingExtractor.write_recording(recording, output_folder, chunk_mb=p['chunk_mb'])
+        elif p['export_format'] == 'h5':
+            # one file per channel, as combinato
+            for channel_id in recording.get_channel_ids():
+                write_h5_recording(recording, output_folder / 'channel_{}.h5'.format(channel_id),
+                                   channel_id=channel_id, chunk_mb=p['chunk_mb'])
+        elif p['export_format'] == 'mat':
+            write_mat_files(recording, output_folder, chunk_mb=p['chunk_mb'])
+        else:
+            raise ValueError("Unknown export_format: {}".format(p['export_format']))
+
+    def _run(self, recording, output_folder):
+        # one unit per channel firing at 10 Hz
+        num_frames = recording.get_num_frames()
+        num_units = recording.get_num_channels()
+        times = np.arange(0, num_frames, int(recording.get_sampling_frequency() / 10))
+        np.save(str(output_folder / 'spike_times.npy'), np.tile(times, num_units))
+        np.save(str(output_folder / 'spike_labels.npy'), np.repeat(np.arange(num_units), len(times)))
+
+    @staticmethod
+    def get_result_from_folder(output_folder):
+        sorting = se.NumpySortingExtractor()
+        sorting.set_times_labels(np.load(str(Path(output_folder) / 'spike_times.npy')),
+                                 np.load(str(Path(output_folder) / 'spike_labels.npy')))
+        return sorting
+
+
+def get_available_formats():
+    if HAVE_H5PY:
+        return list(export_formats)
+    return [f for f in export_formats if f not in ('h5', 'mat')]
+
+
+def bench_one(recording, export_format, folder):
+    """
+    Runs the no-op sorter once and returns the wall times of the phases of the wrapper.
+    """
+    output_folder = Path(folder) / 'output'
+    if output_folder.is_dir():
+        shutil.rmtree(str(output_folder))
+
+    with StageProfiler() as init_profiler:
+        sorter = NoopSorter(recording=recording, output_folder=output_folder, grouping_property='group')
+    with StageProfiler() as params_profiler:
+        sorter.set_params(export_format=export_format)
+    with StageProfiler() as run_profiler:
+        sorter.run()
+    with StageProfiler() as result_profiler:
+        sorter.get_result()
+
+    profiles = [sorter._stage_profiles[str(folder)] for folder in sorter.output_folders]
+    export_s = sum(profile['setup']['wall_time'] for profile in profiles)
+    noop_run_s = sum(profile['run']['wall_time'] for profile in profiles)
+    export_bytes = sum(profile['setup']['bytes_written'] or 0 for profile in profiles)
+    shutil.rmtree(str(output_folder), ignore_errors=True)
+    return {
+        'init_s': init_profiler.stats['wall_time'],
+        'dump_params_s': params_profiler.stats['wall_time'],
+        'export_s': export_s,
+        'export_mb': export_bytes / 1e6,
+        # what run() does besides the setup and the run of the backend: params, logs, stage markers
+        'run_overhead_s': run_profiler.stats['wall_time'] - export_s - noop_run_s,
+        'get_result_s': result_profiler.stats['wall_time'],
+        'total_s': (init_profiler.stats['wall_time'] + params_profiler.stats['wall_time'] +
+                    run_profiler.stats['wall_time'] + result_profiler.stats['wall_time']),
+    }
+
+
+def _get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=str(Path(__file__).parent),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(channels=(4, 32, 128), durations=(60,), groups=(1, 4), formats=None, repeats=3, folder=None,
+                  verbose=True):
+    """
+    Runs the benchmark on all the combinations and returns the results (the minimum over the repeats).
+    """
+    if formats is None:
+        formats = get_available_formats()
+    remove_folder = folder is None
+    folder = Path(tempfile.mkdtemp(prefix='bench_wrapper_overhead_')) if folder is None else Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    try:
+        for num_channels in channels:
+            for duration in durations:
+                for num_groups in groups:
+                    if num_groups > num_channels:
+                        continue
+                    recording = SyntheticRecording(num_channels, duration, num_groups=num_groups)
+                    for export_format in formats:
+                        measures = [bench_one(recording, export_format, folder) for _ in range(repeats)]
+                        result = {'format': export_format, 'num_channels': num_channels, 'duration': duration,
+                                  'num_groups': num_groups}
+                        for key in measures[0]:
+                            result[key] = min(m[key] for m in measures)
+                        results.append(result)
+                        if verbose:
+                            print('{format:>12} {num_channels:>5} ch {duration:>6} s {num_groups:>3} groups: '
+                                  'export {export_s:.3f} s, params {dump_params_s:.3f} s, '
+                                  'run overhead {run_overhead_s:.3f} s, get_result {get_result_s:.3f} s'.format(
+                                      **result))
+    finally:
+        if remove_folder:
+            shutil.rmtree(str(folder), ignore_errors=True)
+
+    return {'commit': _get_git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+            'spikeextractors': se.__version__, 'results': results}
+
+
+def _result_key(result):
+    return result['format'], result['num_channels'], result['duration'], result['num_groups']
+
+
+def compare_benchmarks(baseline, current, tolerance=0.2, min_time=0.01):
+    """
+    Compares two benchmark outputs and returns the list of regressions: the phases slower by more than
+    'tolerance' (relative) and 'min_time' (absolute, in s).
+    """
+    baseline_results = {_result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        ref = baseline_results.get(_result_key(result), None)
+        if ref is None:
+            continue
+        for key in result:
+            if not key.endswith('_s'):
+                continue
+            if result[key] > ref[key] * (1 + tolerance) and result[key] - ref[key] > min_time:
+                regressions.append({'key': _result_key(result), 'phase': key, 'baseline': ref[key],
+                                    'current': result[key]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--channels', type=int, nargs='+', default=[4, 32, 128])
+    parser.add_argument('--durations', type=float, nargs='+', default=[60])
+    parser.add_argument('--groups', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--formats', nargs='+', default=None, choices=export_formats)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--folder', default=None, help='scratch folder of the exports (temporary if not given)')
+    parser.add_argument('--output', default=None, help='json file of the results')
+    parser.add_argument('--compare', default=None, help='json file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    benchmark = run_benchmark(channels=args.channels, durations=args.durations, groups=args.groups,
+                              formats=args.formats, repeats=args.repeats, folder=args.folder)
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(benchmark, f, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf8') as f:
+            baseline = json.load(f)
+        regressions = compare_benchmarks(baseline, benchmark, tolerance=args.tolerance)
+        print('Compared with commit {}: {} regression(s)'.format(baseline.get('commit'), len(regressions)))
+        for r in regressions:
+            print('  {} {}: {:.3f} s -> {:.3f} s'.format(r['key'], r['phase'], r['baseline'], r['current']))
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
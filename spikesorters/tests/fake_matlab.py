@@ -0,0 +1,66 @@
+"""
+Stand-in for the 'matlab' executable in the tests of the MATLAB session pool: it implements the protocol of
+utils/spikesorters_session_server.m and interprets a few statements of the job scripts:
+
+    fprintf('text\n'); or disp('text');   written to the log of the job
+    pause(seconds);
+    spikesorters_exit(code);              end of the job with this exit code
+    crash_session;                        the session process exits (simulates a MATLAB crash)
+
+Usage: python fake_matlab.py -r "addpath('...'); spikesorters_session_server('<session folder>')"
+"""
+import os
+import re
+import sys
+import json
+import time
+from pathlib import Path
+
+
+def write_file_atomic(file_path, txt):
+    with open(str(file_path) + '.tmp', 'w') as f:
+        f.write(txt)
+    os.replace(str(file_path) + '.tmp', str(file_path))
+
+
+def run_job(job):
+    with open(job['script'], 'r') as f:
+        lines = f.read().splitlines()
+    with open(job['log'], 'a') as log:
+        for line in lines:
+            line = line.strip()
+            m = re.match(r"(?:fprintf|disp)\('(.*)'\);?$", line)
+            if m:
+                log.write(m.group(1).replace('\\n', '\n') + ('\n' if line.startswith('disp') else ''))
+                log.flush()
+            m = re.match(r"pause\(([\d.]+)\);?$", line)
+            if m:
+                time.sleep(float(m.group(1)))
+            m = re.match(r"spikesorters_exit\((\d+)\);?$", line)
+            if m:
+                return int(m.group(1))
+            if line.startswith('crash_session'):
+                os._exit(3)
+    return 0
+
+
+def main():
+    server_call = sys.argv[sys.argv.index('-r') + 1]
+    session_folder = Path(re.search(r"spikesorters_session_server\('(.*)'\)", server_call).group(1))
+    write_file_atomic(session_folder / 'ready', str(os.getpid()))
+    job_file = session_folder / 'job.json'
+    while True:
+        if not job_file.is_file():
+            time.sleep(0.01)
+            continue
+        with open(str(job_file), 'r') as f:
+            job = json.load(f)
+        job_file.unlink()
+        if job['type'] == 'quit':
+            break
+        status = run_job(job) if job['type'] == 'run' else 0
+        write_file_atomic(session_folder / '{}.done'.format(job['id']), str(status))
+
+
+if __name__ == '__main__':
+    main()
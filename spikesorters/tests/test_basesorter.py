@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import shutil
+from pathlib import Path
+import pytest
+import numpy as np
+import spikeextractors as se
+
+import spikesorters.basesorter as basesorter
+from spikesorters.basesorter import BaseSorter
+from spikesorters.sorter_tools import SpikeSortingError
+from spikesorters.profiling import format_backend_stage
+
+
+class DummySorter(BaseSorter):
+    """
+    Sorter writing a binary copy in the setup and one spike train per channel in the run.
+    """
+    sorter_name = 'dummy'
+    _default_params = {'threshold': 5}
+    calls = []
+    fail = False  # to simulate a crash of the run
+
+    @classmethod
+    def is_installed(cls):
+        return True
+
+    @staticmethod
+    def get_sorter_version():
+        return '0.0'
+
+    def _setup_recording(self, recording, output_folder):
+        DummySorter.calls.append(('setup', output_folder.name))
+        recording.write_to_binary_dat_format(output_folder / 'recording.dat', dtype='int16')
+
+    def _run(self, recording, output_folder):
+        DummySorter.calls.append(('run', output_folder.name))
+        # a file written by the run before it can crash (e.g. a script)
+        (output_folder / 'run_dummy.sh').write_text('dummy')
+        if DummySorter.fail:
+            raise Exception('dummy failure')
+        np.save(str(output_folder / 'spike_times.npy'), np.arange(10))
+
+    @staticmethod
+    def get_result_from_folder(output_folder):
+        sorting = se.NumpySortingExtractor()
+        sorting.set_times_labels(np.load(str(Path(output_folder) / 'spike_times.npy')), np.zeros(10, dtype=int))
+        return sorting
+
+
+def _get_recording(folder):
+    if Path(folder).is_dir():
+        shutil.rmtree(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0, dumpable=True,
+                                                   dump_folder=folder + '/toy')
+    recording.set_channel_groups([0, 0, 1, 1])
+    return recording
+
+
+def _run_dummy(recording, output_folder, fail=False, **params):
+    DummySorter.calls = []
+    DummySorter.fail = fail
+    sorter = DummySorter(recording=recording, output_folder=output_folder, grouping_property='group', resume=True)
+    sorter.set_params(**params)
+    try:
+        sorter.run()
+    except SpikeSortingError:
+        pass
+    return sorter
+
+
+def test_resume():
+    folder = 'test_basesorter_resume'
+    recording = _get_recording(folder)
+    output_folder = folder + '/output'
+
+    # the run crashes after the setup
+    _run_dummy(recording, output_folder, fail=True)
+    assert DummySorter.calls == [('setup', '0'), ('setup', '1'), ('run', '0')]
+    assert (Path(output_folder) / '0' / 'run_dummy.sh').is_file()
+
+    # setup is skipped (the files written by the crashed run are ignored), run is done
+    _run_dummy(recording, output_folder)
+    assert DummySorter.calls == [('run', '0'), ('run', '1')]
+
+    # everything is skipped
+    sorter = _run_dummy(recording, output_folder)
+    assert DummySorter.calls == []
+    assert len(sorter.get_result_list()) == 2
+
+    # different params: everything is done again
+    _run_dummy(recording, output_folder, fail=True, threshold=6)
+    assert DummySorter.calls == [('setup', '0'), ('setup', '1'), ('run', '0')]
+
+    # the binary copy of one group is corrupted and the run did not finish
+    with open(Path(output_folder) / '1' / 'recording.dat', 'r+b') as f:
+        f.write(b'\x01' * 10)
+    _run_dummy(recording, output_folder, threshold=6)
+    assert DummySorter.calls == [('setup', '1'), ('run', '0'), ('run', '1')]
+
+    # without resume the folder is deleted
+    DummySorter.calls = []
+    DummySorter.fail = False
+    sorter = DummySorter(recording=recording, output_folder=output_folder, grouping_property='group')
+    sorter.run()
+    assert DummySorter.calls == [('setup', '0'), ('setup', '1'), ('run', '0'), ('run', '1')]
+    assert not (Path(output_folder) / '0' / DummySorter.stages_filename).is_file()
+
+
+def test_pipeline():
+    folder = 'test_basesorter_pipeline'
+    recording = _get_recording(folder)
+    recording.set_channel_groups([0, 1, 2, 3])
+    output_folder = Path(folder) / 'output'
+
+    for pipeline_depth in [0, 1, 2]:
+        DummySorter.calls = []
+        sorter = DummySorter(recording=recording, output_folder=output_folder, grouping_property='group')
+        run_time = sorter.run(pipeline_depth=pipeline_depth)
+        assert run_time is not None
+        calls = DummySorter.calls
+        assert len(calls) == 8
+        for i in range(4):
+            # the setup of a group is done before its run, at most pipeline_depth groups ahead
+            assert calls.index(('setup', str(i))) < calls.index(('run', str(i)))
+            if i + pipeline_depth + 1 < 4:
+                assert calls.index(('run', str(i))) < calls.index(('setup', str(i + pipeline_depth + 1)))
+            assert (output_folder / str(i) / 'spikeinterface_params.json').is_file()
+        assert len(sorter.get_result_list()) == 4
+
+    with pytest.raises(ValueError):
+        sorter.run(parallel=True, pipeline_depth=1)
+
+
+def test_resource_footprint():
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    channel_hours = 4 * recording.get_num_frames() / 30000. / 3600.
+
+    footprint = DummySorter.get_resource_footprint(recording)
+    assert footprint['cores'] == 1
+    assert np.isclose(footprint['ram_mb'], 500. * channel_hours)
+    assert footprint['licenses'] == {}
+
+    class WorkersSorter(DummySorter):
+        _default_params = {'num_workers': None}
+        resource_footprint = {'cores': 'num_workers', 'licenses': {'matlab': 1}}
+
+    num_cpus = os.cpu_count()
+    assert WorkersSorter.get_resource_footprint(recording)['cores'] == max(num_cpus // 2, 1)
+    assert WorkersSorter.get_resource_footprint(recording, {'num_workers': -1})['cores'] == num_cpus
+    assert WorkersSorter.get_resource_footprint(recording, {'num_workers': 1000})['cores'] == num_cpus
+    assert WorkersSorter.get_resource_footprint(recording)['licenses'] == {'matlab': 1}
+
+
+def test_profile():
+    class ProfiledSorter(DummySorter):
+        def _run(self, recording, output_folder):
+            DummySorter._run(self, recording, output_folder)
+            self._add_backend_stage(output_folder, 'python_stage', 0.5)
+            with open(str(output_folder / 'dummy.log'), 'w') as f:
+                f.write('some output\n' + format_backend_stage('external_stage', 1.5) + '\n')
+
+    folder = 'test_basesorter_profile'
+    recording = _get_recording(folder)
+    output_folder = Path(folder) / 'output'
+    DummySorter.fail = False
+    sorter = ProfiledSorter(recording=recording, output_folder=output_folder, grouping_property='group')
+    sorter.run()
+    sorter.get_result()
+    for group in ['0', '1']:
+        with open(str(output_folder / group / 'spikeinterface_log.json'), 'r') as f:
+            profile = json.load(f)['profile']
+        assert set(profile.keys()) == {'setup', 'run', 'get_result'}
+        for stats in profile.values():
+            assert stats['wall_time'] >= 0
+            assert stats['cpu_time'] >= 0
+        assert profile['run']['backend_stages'] == {'python_stage': 0.5, 'external_stage': 1.5}
+        if sys.platform.startswith('linux'):
+            # the binary copy of the setup
+            assert profile['setup']['bytes_written'] >= recording.get_num_frames() * 2 * 2
+
+
+def test_get_result_read_only(monkeypatch):
+    folder = 'test_basesorter_read_only'
+    recording = _get_recording(folder)
+    output_folder = Path(folder) / 'output'
+    DummySorter.fail = False
+    sorter = DummySorter(recording=recording, output_folder=output_folder)
+    sorter.run()
+
+    # the output folder is read only (e.g. archived results): the log can not be updated
+    def read_only_open(file, mode='r', *args, **kwargs):
+        if 'w' in mode:
+            raise PermissionError(f'Read-only file system: {file}')
+        return open(file, mode, *args, **kwargs)
+
+    monkeypatch.setattr(basesorter, 'open', read_only_open, raising=False)
+    sorting = sorter.get_result()
+    assert len(sorting.get_unit_ids()) == 1
+    assert 'get_result' in sorter._stage_profiles[str(sorter.output_folders[0])]
+
+
+def test_get_result_list_parallel():
+    folder = 'test_basesorter_result_list'
+    recording = _get_recording(folder)
+    recording.set_channel_groups([0, 1, 2, 3])
+    output_folder = Path(folder) / 'output'
+    DummySorter.fail = False
+    sorter = DummySorter(recording=recording, output_folder=output_folder, grouping_property='group')
+    sorter.run()
+    # one unit by group, with the group in its spike train
+    for i, group_folder in enumerate(sorter.output_folders):
+        np.save(str(group_folder / 'spike_times.npy'), np.arange(10) + 100 * i)
+    sorting_list = sorter.get_result_list(n_jobs=4)
+    assert [sorting.get_unit_spike_train(0)[0] for sorting in sorting_list] == [0, 100, 200, 300]
+
+    os.remove(str(sorter.output_folders[2] / 'spike_times.npy'))
+    with pytest.raises(SpikeSortingError, match='output 2'):
+        sorter.get_result_list(n_jobs=4)
+    with pytest.warns(UserWarning, match='output 2'):
+        sorting_list = sorter.get_result_list(raise_error=False, n_jobs=4)
+    assert [sorting.get_unit_spike_train(0)[0] for sorting in sorting_list] == [0, 100, 300]
+
+
+if __name__ == '__main__':
+    test_resume()
+    test_pipeline()
+    test_resource_footprint()
+    test_profile()
+    test_get_result_list_parallel()
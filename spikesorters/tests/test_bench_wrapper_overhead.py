@@ -0,0 +1,26 @@
+import shutil
+from pathlib import Path
+
+from spikesorters.tests.bench_wrapper_overhead import run_benchmark, compare_benchmarks, get_available_formats
+
+
+def test_bench_wrapper_overhead():
+    folder = Path('test_bench_wrapper_overhead')
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    benchmark = run_benchmark(channels=[4], durations=[1], groups=[1, 2], repeats=1, folder=folder,
+                              verbose=False)
+    assert len(benchmark['results']) == 2 * len(get_available_formats())
+    for result in benchmark['results']:
+        assert result['export_s'] > 0
+        assert result['total_s'] >= result['export_s']
+
+    assert compare_benchmarks(benchmark, benchmark) == []
+    slower = {'results': [dict(r, export_s=r['export_s'] * 10 + 1) for r in benchmark['results']]}
+    regressions = compare_benchmarks(benchmark, slower)
+    assert len(regressions) == len(benchmark['results'])
+    assert all(r['phase'] == 'export_s' for r in regressions)
+
+
+if __name__ == '__main__':
+    test_bench_wrapper_overhead()
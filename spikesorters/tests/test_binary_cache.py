@@ -0,0 +1,160 @@
+import os
+import time
+import shutil
+import threading
+
+import numpy as np
+import spikeextractors as se
+from pathlib import Path
+
+from spikesorters import set_binary_cache, get_binary_cache
+from spikesorters.binary_cache import write_binary_recording, _CacheLock
+
+
+def test_binary_cache():
+    folder = 'test_binary_cache'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0, dumpable=True,
+                                                   dump_folder=folder + '/toy')
+    set_binary_cache(folder + '/cache', max_size_gb=1)
+    try:
+        cache = get_binary_cache()
+
+        file0 = write_binary_recording(recording, folder + '/sorter0/recording.dat', dtype='int16')
+        file1 = write_binary_recording(recording, folder + '/sorter1/recording', dtype='int16')
+        assert file1.name == 'recording.dat'
+        traces0 = np.fromfile(str(file0), dtype='int16')
+        traces1 = np.fromfile(str(file1), dtype='int16')
+        assert np.array_equal(traces0, traces1)
+        assert os.stat(str(file0)).st_ino == os.stat(str(file1)).st_ino
+        assert len(cache._read_index()) == 1
+
+        # another dtype is another entry
+        write_binary_recording(recording, folder + '/sorter2/recording.dat', dtype='float32')
+        assert len(cache._read_index()) == 2
+
+        # opt out
+        file3 = write_binary_recording(recording, folder + '/sorter3/recording.dat', dtype='int16', use_cache=False)
+        assert os.stat(str(file0)).st_ino != os.stat(str(file3)).st_ino
+
+        # LRU eviction keeps only the last entry
+        cache.max_size_gb = 1e-9
+        write_binary_recording(recording, folder + '/sorter4/recording.dat', dtype='float64')
+        assert len(cache._read_index()) == 1
+        # the already linked copies are still valid
+        assert np.array_equal(np.fromfile(str(file0), dtype='int16'), traces0)
+    finally:
+        set_binary_cache(None)
+
+
+def test_binary_cache_not_dumpable():
+    folder = 'test_binary_cache_not_dumpable'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    set_binary_cache(folder + '/cache')
+    try:
+        write_binary_recording(recording, folder + '/sorter0/recording.dat', dtype='int16')
+        assert len(get_binary_cache()._read_index()) == 0
+    finally:
+        set_binary_cache(None)
+
+
+def test_binary_cache_rewritten_source():
+    folder = Path('test_binary_cache_rewritten_source')
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir()
+    raw_file = folder / 'raw.dat'
+    set_binary_cache(folder / 'cache')
+    try:
+        traces = []
+        for seed in range(2):
+            # the source file is rewritten at the same path with the same size
+            traces.append(np.random.RandomState(seed).randint(-100, 100, size=(1000, 4)).astype('int16'))
+            traces[-1].tofile(str(raw_file))
+            os.utime(str(raw_file), ns=(seed * 10 ** 9, seed * 10 ** 9))
+            recording = se.BinDatRecordingExtractor(raw_file, sampling_frequency=30000., numchan=4, dtype='int16')
+            output_file = write_binary_recording(recording, folder / f'sorter{seed}/recording.dat', dtype='float32')
+            assert np.array_equal(np.fromfile(str(output_file), dtype='float32').reshape(-1, 4), traces[-1])
+        assert len(get_binary_cache()._read_index()) == 2
+    finally:
+        set_binary_cache(None)
+
+
+def test_binary_cache_link_fallback(monkeypatch):
+    folder = 'test_binary_cache_link_fallback'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0, dumpable=True,
+                                                   dump_folder=folder + '/toy')
+    set_binary_cache(folder + '/cache', link_modes=('symlink',))
+
+    def failing_symlink(*args):
+        raise OSError('symlinks not supported')
+
+    monkeypatch.setattr(os, 'symlink', failing_symlink)
+    try:
+        # the input of the sorter is a copy when no link mode works
+        file0 = write_binary_recording(recording, folder + '/sorter0/recording.dat', dtype='int16')
+        assert file0.is_file() and not file0.is_symlink()
+        assert np.array_equal(np.fromfile(str(file0), dtype='int16').reshape(-1, 4),
+                              recording.get_traces().T.astype('int16'))
+        # the export was written in the cache folder, no temporary file is left
+        cache_files = [p for p in Path(folder + '/cache').iterdir() if p.suffix not in ('.json', '.lock')]
+        assert [p.suffix for p in cache_files] == ['.dat']
+    finally:
+        set_binary_cache(None)
+
+
+def test_binary_cache_bounded_no_symlink():
+    folder = 'test_binary_cache_bounded'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0, dumpable=True,
+                                                   dump_folder=folder + '/toy')
+    set_binary_cache(folder + '/cache', max_size_gb=1e-9, link_modes=('symlink',))
+    try:
+        file0 = write_binary_recording(recording, folder + '/sorter0/recording.dat', dtype='int16')
+        assert not file0.is_symlink()
+        traces0 = np.fromfile(str(file0), dtype='int16')
+        # the entry of file0 is evicted before its sorter runs
+        write_binary_recording(recording, folder + '/sorter1/recording.dat', dtype='float32')
+        assert len(get_binary_cache()._read_index()) == 1
+        assert np.array_equal(np.fromfile(str(file0), dtype='int16'), traces0)
+    finally:
+        set_binary_cache(None)
+
+
+def test_cache_lock():
+    folder = Path('test_binary_cache_lock')
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir()
+    # a lock file left by a dead process does not block
+    (folder / 'cache.lock').write_text('')
+    with _CacheLock(folder, timeout=1.):
+        pass
+
+    counter_file = folder / 'counter.txt'
+    counter_file.write_text('0')
+
+    def increment():
+        for _ in range(20):
+            with _CacheLock(folder):
+                value = int(counter_file.read_text())
+                time.sleep(0.001)
+                counter_file.write_text(str(value + 1))
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter_file.read_text() == '80'
+
+
+if __name__ == '__main__':
+    test_binary_cache()
+    test_binary_cache_not_dumpable()
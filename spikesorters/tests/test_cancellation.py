@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from spikesorters import CancelToken, get_run_outcome, run_sorter
+from spikesorters.cancellation import cancel_scope, get_cancel_token, check_cancelled
+from spikesorters.sorterlist import _sorter_registry
+from spikesorters.sorter_tools import SpikeSortingCancelled, SpikeSortingTimeout
+from spikesorters.tests.test_basesorter import DummySorter, _get_recording
+from spikesorters.tests.test_launcher import SleepSorter
+
+
+def test_cancel_token():
+    token = CancelToken()
+    assert not token.is_cancelled()
+    token.check()
+    token.cancel()
+    assert token.get_reason() == 'cancelled'
+    with pytest.raises(SpikeSortingCancelled):
+        token.check()
+
+    token = CancelToken(timeout=0.2)
+    assert not token.is_cancelled()
+    time.sleep(0.3)
+    with pytest.raises(SpikeSortingTimeout):
+        token.check()
+
+    # the children are cancelled with their parent, not the reverse
+    parent = CancelToken()
+    child = CancelToken(timeout=100, parent=parent)
+    child_2 = CancelToken(parent=parent)
+    child_2.cancel('timeout')
+    assert not parent.is_cancelled() and not child.is_cancelled()
+    parent.cancel()
+    assert child.get_reason() == 'cancelled'
+
+    assert get_cancel_token() is None
+    with cancel_scope(parent):
+        assert get_cancel_token() is parent
+        with pytest.raises(SpikeSortingCancelled):
+            check_cancelled()
+    assert get_cancel_token() is None
+    check_cancelled()
+
+
+def test_cancel_file():
+    folder = Path('test_cancellation_file')
+    if folder.is_dir():
+        shutil.rmtree(folder)
+    token = CancelToken(cancel_file=folder / 'run.cancel')
+    # a pickled copy (e.g. in a worker process) sees the cancellation through the file
+    token_copy = pickle.loads(pickle.dumps(token))
+    assert not token_copy.is_cancelled()
+    token.cancel('timeout')
+    assert (folder / 'run.cancel').is_file()
+    assert token_copy.get_reason() == 'timeout'
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='uses a posix shell script')
+def test_run_timeout(monkeypatch):
+    monkeypatch.setitem(_sorter_registry, 'sleep', ('spikesorters.tests.test_launcher', 'SleepSorter'))
+    recording = _get_recording('test_cancellation_timeout')
+    output_folder = Path('test_cancellation_timeout') / 'sleep'
+
+    t0 = time.perf_counter()
+    with pytest.raises(SpikeSortingTimeout):
+        run_sorter('sleep', recording, output_folder=output_folder, timeout=1)
+    assert time.perf_counter() - t0 < 10
+    with (output_folder / 'spikeinterface_log.json').open() as f:
+        log = json.load(f)
+    assert log['error'] and log['outcome'] == 'timeout' and log['run_time'] is None
+    assert get_run_outcome(output_folder) == 'timeout'
+
+    # cancelled from another thread, without raising
+    token = CancelToken()
+    timer = threading.Timer(0.5, token.cancel)
+    timer.start()
+    t0 = time.perf_counter()
+    sorter = SleepSorter(recording=recording, output_folder=output_folder)
+    sorter.run(cancel_token=token, raise_error=False)
+    assert time.perf_counter() - t0 < 10
+    assert get_run_outcome(output_folder) == 'cancelled'
+
+    run_sorter('sleep', recording, output_folder=output_folder, duration=0, timeout=20)
+    assert get_run_outcome(output_folder) == 'finished'
+
+
+def test_cancelled_before_setup(monkeypatch):
+    monkeypatch.setitem(_sorter_registry, 'dummy', ('spikesorters.tests.test_basesorter', 'DummySorter'))
+    recording = _get_recording('test_cancellation_setup')
+    output_folder = Path('test_cancellation_setup') / 'dummy'
+    DummySorter.calls = []
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(SpikeSortingCancelled):
+        run_sorter('dummy', recording, output_folder=output_folder, cancel_token=token)
+    assert DummySorter.calls == []
+    assert get_run_outcome(output_folder) == 'cancelled'
+
+
+if __name__ == '__main__':
+    test_cancel_token()
+    test_cancel_file()
+    test_run_timeout(pytest.MonkeyPatch())
+    test_cancelled_before_setup(pytest.MonkeyPatch())
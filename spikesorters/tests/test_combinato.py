@@ -0,0 +1,40 @@
+import os
+import shutil
+import unittest
+import pytest
+import numpy as np
+import spikeextractors as se
+from spikesorters import CombinatoSorter
+from spikesorters.combinato.combinato import write_h5_recording
+from spikesorters.tests.common_tests import SorterCommonTestSuite
+
+
+# This run several tests
+@pytest.mark.skipif(not CombinatoSorter.is_installed(), reason='combinato not installed')
+class CombinatoCommonTestSuite(SorterCommonTestSuite, unittest.TestCase):
+    SorterClass = CombinatoSorter
+
+
+def test_write_h5_recording():
+    h5py = pytest.importorskip('h5py')
+    folder = 'test_combinato_h5'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=1, duration=10, seed=0)
+    traces = recording.get_traces()
+
+    for compression in [None, 'gzip']:
+        file_path = f'{folder}/recording_{compression}.h5'
+        write_h5_recording(recording, file_path, chunk_mb=0.1, compression=compression)
+        with h5py.File(file_path, 'r') as f:
+            assert f['data'].compression == compression
+            assert np.array_equal(f['data'][:], traces[0])
+            assert f['sr'][0] == recording.get_sampling_frequency()
+
+
+if __name__ == '__main__':
+    CombinatoCommonTestSuite().test_on_toy()
+    CombinatoCommonTestSuite().test_several_groups()
+    CombinatoCommonTestSuite().test_with_BinDatRecordingExtractor()
+    test_write_h5_recording()
@@ -0,0 +1,88 @@
+import shutil
+from pathlib import Path
+
+import pytest
+import numpy as np
+import spikeextractors as se
+
+from spikesorters import run_sorter, CompactSortingExtractor, compact_sorting_output
+from spikesorters.compact_store import write_compact_sorting, has_compact_sorting
+from spikesorters.tests.test_basesorter import DummySorter, _get_recording
+
+
+def test_write_read_compact_sorting():
+    folder = Path('test_compact_store')
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir()
+    _, sorting = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    sorting.set_unit_property(sorting.get_unit_ids()[0], 'quality', 'good')
+
+    write_compact_sorting(sorting, folder)
+    assert has_compact_sorting(folder)
+    compact = CompactSortingExtractor(folder)
+    assert compact.get_unit_ids() == sorting.get_unit_ids()
+    assert compact.get_sampling_frequency() == sorting.get_sampling_frequency()
+    for unit_id in sorting.get_unit_ids():
+        assert np.array_equal(compact.get_unit_spike_train(unit_id), sorting.get_unit_spike_train(unit_id))
+        assert np.array_equal(compact.get_unit_spike_train(unit_id, start_frame=1000, end_frame=50000),
+                              sorting.get_unit_spike_train(unit_id, start_frame=1000, end_frame=50000))
+    assert compact.get_unit_property(sorting.get_unit_ids()[0], 'quality') == 'good'
+
+    spike_frames = np.load(str(folder / 'spikesorters_sorting' / 'spike_frames.npy'))
+    assert spike_frames.dtype == 'int64' and np.all(np.diff(spike_frames) >= 0)
+    assert np.load(str(folder / 'spikesorters_sorting' / 'unit_indices.npy')).dtype == 'int32'
+
+    # the non integer unit ids are rejected before writing
+    str_sorting = se.NumpySortingExtractor()
+    str_sorting.add_unit(1, np.array([10]))
+    str_sorting.add_unit('a', np.array([20]))
+    shutil.rmtree(str(folder))
+    folder.mkdir()
+    with pytest.raises(ValueError, match='integer unit ids'):
+        write_compact_sorting(str_sorting, folder)
+    assert list(folder.iterdir()) == []
+
+
+def test_compact_output():
+    folder = 'test_compact_store_output'
+    recording = _get_recording(folder)
+    output_folder = Path(folder) / 'output'
+    DummySorter.fail = False
+    sorting = run_sorter(DummySorter, recording, output_folder=output_folder, grouping_property='group',
+                         compact_output=True)
+    for group in ['0', '1']:
+        assert has_compact_sorting(output_folder / group)
+        assert isinstance(DummySorter.get_result_from_folder(output_folder / group), CompactSortingExtractor)
+        assert isinstance(DummySorter.get_native_result_from_folder(output_folder / group), se.NumpySortingExtractor)
+    assert len(sorting.get_unit_ids()) == 2
+
+    # conversion of an existing output
+    output_folder = Path(folder) / 'output_native'
+    run_sorter(DummySorter, recording, output_folder=output_folder)
+    assert not has_compact_sorting(output_folder)
+    compact_sorting_output(DummySorter, output_folder)
+    assert np.array_equal(DummySorter.get_result_from_folder(output_folder).get_unit_spike_train(0), np.arange(10))
+
+
+def test_compact_output_non_integer_ids(monkeypatch):
+    folder = 'test_compact_store_output_str'
+    recording = _get_recording(folder)
+    output_folder = Path(folder) / 'output'
+    DummySorter.fail = False
+
+    def get_str_result(output_folder):
+        sorting = se.NumpySortingExtractor()
+        sorting.add_unit('a', np.arange(10))
+        return sorting
+
+    monkeypatch.setattr(DummySorter, 'get_native_result_from_folder', staticmethod(get_str_result))
+    # the native output is kept
+    with pytest.warns(UserWarning, match='No compact store'):
+        run_sorter(DummySorter, recording, output_folder=output_folder, compact_output=True)
+    assert not has_compact_sorting(output_folder)
+
+
+if __name__ == '__main__':
+    test_write_read_compact_sorting()
+    test_compact_output()
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy.io import loadmat
+
+import spikeextractors as se
+from spikesorters import Kilosort2Sorter, Kilosort2_5Sorter, Kilosort3Sorter, run_sorter
+from spikesorters.compiled_matlab import (find_compiled_executable, get_compiled_command, ops_from_matlab_config,
+                                          write_kilosort_channel_map)
+import spikesorters.compiled_matlab as compiled_matlab
+
+# stand-in of the mcc output of kilosort2_compiled.m: checks the ops and the channel map and writes a phy folder
+fake_kilosort_compiled = """#!{python}
+import sys, json
+import numpy as np
+from scipy.io import loadmat
+ops = json.load(open(sys.argv[1]))
+chan_map = loadmat(ops['chanMap'])
+assert chan_map['chanMap'].size == ops['Nchan']
+data = np.memmap(ops['fbinary'], dtype='int16', mode='r').reshape(-1, ops['NchanTOT'])
+spike_times = np.arange(100, data.shape[0], 1000)
+np.save(ops['root'] + '/spike_times.npy', spike_times)
+np.save(ops['root'] + '/spike_templates.npy', spike_times % 3)
+with open(ops['root'] + '/params.py', 'w') as f:
+    f.write('sample_rate = {{}}\\n'.format(ops['fs']))
+print('spikesorters_stage preprocessDataSub 0.100')
+"""
+
+
+class _DefaultFields(dict):
+    # renders the other fields of the templates with 1
+    def __missing__(self, key):
+        return 1
+
+
+def _make_compiled_folder(folder, entry_name):
+    folder = Path(folder)
+    if folder.is_dir():
+        shutil.rmtree(folder)
+    folder.mkdir(parents=True)
+    executable = folder / entry_name
+    executable.write_text(fake_kilosort_compiled.format(python=sys.executable))
+    executable.chmod(0o755)
+    return folder
+
+
+def test_ops_from_matlab_config():
+    config_txt = """
+ops.fs                  = 30000.0;     % sampling rate
+ops.fbinary             = fullfile('/data/recording.dat'); % will be created for 'openEphys'
+ops.fproc               = fullfile(fpath, 'temp_wh.dat'); % residual from RAM of preprocessed data
+ops.root                = fpath; % 'openEphys' only: where raw files are
+% ops.Nfilt             = 1024; % max number of clusters
+ops.datatype            = 'dat';  % binary ('dat', 'bin') or 'openEphys'
+ops.Th = [10, 4];
+ops.momentum = [20 400];
+ops.spkTh           = -6;      % spike threshold in standard deviations (-6)
+ops.minFR = 0.1;
+"""
+    ops = ops_from_matlab_config(config_txt, {'fpath': '/output'})
+    assert ops == {'fs': 30000.0, 'fbinary': '/data/recording.dat', 'fproc': os.path.join('/output', 'temp_wh.dat'),
+                   'root': '/output', 'datatype': 'dat', 'Th': [10, 4], 'momentum': [20, 400], 'spkTh': -6,
+                   'minFR': 0.1}
+
+    with pytest.raises(ValueError):
+        ops_from_matlab_config("ops.Nchan = min(12, ops.NchanTOT);")
+
+
+@pytest.mark.parametrize('SorterClass', [Kilosort2Sorter, Kilosort2_5Sorter, Kilosort3Sorter])
+def test_kilosort_configs_are_supported(SorterClass):
+    # the configuration templates must stay convertible to the ops of the compiled sorters
+    source_dir = Path(sys.modules[SorterClass.__module__].__file__).parent
+    config_txt = (source_dir / f'{SorterClass.sorter_name}_config.m').read_text()
+    fields = {'dat_file': '/data/recording.dat', 'projection_threshold': [10, 4]}
+    config_txt = config_txt.format_map(_DefaultFields(fields))
+    ops = ops_from_matlab_config(config_txt, {'fpath': '/output'})
+    assert ops['fbinary'] == '/data/recording.dat'
+    assert ops['Th'] == [10, 4]
+    assert ops['chanMap'] == 'chanMap.mat'
+    assert (source_dir / f'{SorterClass.sorter_name}_compiled.m').is_file()
+
+
+def test_write_kilosort_channel_map():
+    folder = Path('test_compiled_matlab_chanmap')
+    folder.mkdir(exist_ok=True)
+    write_kilosort_channel_map(folder / 'chanMap.mat', xcoords=[0, 0, 20], ycoords=[0, 20, 40], kcoords=[1, 1, 1],
+                               sample_rate=30000.)
+    chan_map = loadmat(str(folder / 'chanMap.mat'))
+    np.testing.assert_array_equal(chan_map['chanMap'], [[1, 2, 3]])
+    np.testing.assert_array_equal(chan_map['chanMap0ind'], [[0, 1, 2]])
+    np.testing.assert_array_equal(chan_map['ycoords'], [[0, 20, 40]])
+    assert chan_map['connected'].shape == (3, 1) and chan_map['connected'].all()
+    assert chan_map['fs'][0, 0] == 30000.
+
+
+def test_get_compiled_command(monkeypatch):
+    folder = _make_compiled_folder('test_compiled_matlab_command', 'p_ironclust')
+    assert find_compiled_executable(None, 'p_ironclust') is None
+    assert find_compiled_executable(folder, 'kilosort2_compiled') is None
+    assert find_compiled_executable(folder, 'p_ironclust') == folder / 'p_ironclust'
+
+    launcher = folder / 'run_p_ironclust.sh'
+    launcher.write_text('#!/bin/bash\n')
+    if not sys.platform.startswith('win'):
+        assert find_compiled_executable(folder, 'p_ironclust') == launcher
+        # the launchers need the MATLAB Runtime folder
+        monkeypatch.setattr(compiled_matlab, 'mcr_root', None)
+        with pytest.raises(RuntimeError):
+            get_compiled_command(launcher, ['a'])
+        monkeypatch.setattr(compiled_matlab, 'mcr_root', '/opt/mcr/v98')
+        assert get_compiled_command(launcher, ['/tmp/a b', '']) == f"{launcher} /opt/mcr/v98 '/tmp/a b' ''"
+        assert get_compiled_command(folder / 'p_ironclust', ['x']) == f"{folder / 'p_ironclust'} x"
+
+
+@pytest.mark.skipif(sys.platform.startswith('win'), reason='the fake compiled application is a script')
+def test_compiled_kilosort2(monkeypatch):
+    compiled_folder = _make_compiled_folder('test_compiled_matlab_ks2_mcr', 'kilosort2_compiled')
+    monkeypatch.setattr(Kilosort2Sorter, 'kilosort2_path', None)
+    monkeypatch.setattr(Kilosort2Sorter, 'compiled_path', None)
+    assert not Kilosort2Sorter.is_installed()
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    assert Kilosort2Sorter.get_resource_footprint(recording)['licenses'] == {'matlab': 1}
+
+    monkeypatch.setattr(Kilosort2Sorter, 'compiled_path', str(compiled_folder.absolute()))
+    assert Kilosort2Sorter.is_installed() and Kilosort2Sorter.is_compiled()
+    # the MATLAB Runtime needs no license
+    assert Kilosort2Sorter.get_resource_footprint(recording)['licenses'] == {}
+
+    output_folder = Path('test_compiled_matlab_ks2')
+    sorting = run_sorter('kilosort2', recording, output_folder=output_folder)
+    assert not (output_folder / 'kilosort2_master.m').is_file()
+    with (output_folder / 'kilosort2_ops.json').open() as f:
+        ops = json.load(f)
+    assert ops['Nchan'] == 4 and ops['spkTh'] == -6 and ops['root'] == str(output_folder.absolute())
+    assert sorted(sorting.get_unit_ids()) == [0, 1, 2]
+    assert sum(len(sorting.get_unit_spike_train(u)) for u in sorting.get_unit_ids()) == 300
+
+
+if __name__ == '__main__':
+    test_ops_from_matlab_config()
+    test_write_kilosort_channel_map()
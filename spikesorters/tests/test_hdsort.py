@@ -0,0 +1,43 @@
+import os
+import shutil
+import unittest
+import pytest
+import numpy as np
+import spikeextractors as se
+from spikesorters import HDSortSorter
+from spikesorters.hdsort.hdsort import write_mea1k_traces
+from spikesorters.tests.common_tests import SorterCommonTestSuite
+
+
+# This run several tests
+@pytest.mark.skipif(not HDSortSorter.is_installed(), reason='hdsort not installed')
+class HDSortCommonTestSuite(SorterCommonTestSuite, unittest.TestCase):
+    SorterClass = HDSortSorter
+
+
+def test_write_mea1k_traces():
+    h5py = pytest.importorskip('h5py')
+    folder = 'test_hdsort_h5'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    traces = recording.get_traces()
+    num_frames = recording.get_num_frames()
+
+    for n_jobs in [1, 3]:
+        file_path = f'{folder}/recording_{n_jobs}.h5'
+        with h5py.File(file_path, 'w') as f:
+            signal = f.create_dataset('signal', shape=traces.shape, dtype=traces.dtype)
+            frame_numbers = f.create_dataset('frame_numbers', shape=(num_frames,), dtype='int64')
+            write_mea1k_traces(recording, signal, frame_numbers=frame_numbers, chunk_mb=0.1, n_jobs=n_jobs)
+        with h5py.File(file_path, 'r') as f:
+            assert np.array_equal(f['signal'][:], traces)
+            assert np.array_equal(f['frame_numbers'][:], np.arange(num_frames))
+
+
+if __name__ == '__main__':
+    HDSortCommonTestSuite().test_on_toy()
+    HDSortCommonTestSuite().test_several_groups()
+    HDSortCommonTestSuite().test_with_BinDatRecordingExtractor()
+    test_write_mea1k_traces()
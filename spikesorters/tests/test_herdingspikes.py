@@ -1,7 +1,9 @@
 import unittest
 import pytest
+import numpy as np
 
 from spikesorters import HerdingspikesSorter
+from spikesorters.herdingspikes.herdingspikes import get_duplicate_spike_mask
 from spikesorters.tests.common_tests import SorterCommonTestSuite
 
 
@@ -12,6 +14,34 @@ class HerdingspikesSorterCommonTestSuite(SorterCommonTestSuite, unittest.TestCas
     SorterClass = HerdingspikesSorter
 
 
+def _filter_duplicates_loop(spikes, min_interval):
+    # the previous implementation, unit by unit
+    for u in spikes.cl.unique():
+        s = spikes[spikes.cl == u].t.diff() < min_interval
+        spikes = spikes.drop(s.index[s])
+    return spikes
+
+
+@pytest.mark.parametrize('time_sorted', [True, False])
+def test_duplicate_spike_mask(time_sorted):
+    pd = pytest.importorskip('pandas')
+    rng = np.random.RandomState(0)
+    num_spikes = 5000
+    t = rng.randint(0, 300000, size=num_spikes)
+    # bursts of duplicates
+    t[::10] = t[1::10][:len(t[::10])] + rng.randint(0, 4, size=len(t[::10]))
+    if time_sorted:
+        t = np.sort(t)
+    spikes = pd.DataFrame({'t': t, 'cl': rng.randint(0, 50, size=num_spikes)},
+                          index=rng.permutation(num_spikes) + 1000)
+    min_interval = 0.4 / 1000 * 30000.
+
+    expected = _filter_duplicates_loop(spikes, min_interval)
+    filtered = spikes[~get_duplicate_spike_mask(spikes.cl.values, spikes.t.values, min_interval)]
+    assert 0 < len(filtered) < num_spikes
+    pd.testing.assert_frame_equal(filtered, expected)
+
+
 if __name__ == '__main__':
     HerdingspikesSorterCommonTestSuite().test_on_toy()
     HerdingspikesSorterCommonTestSuite().test_several_groups()
@@ -1,11 +1,53 @@
 import os
+import json
 import shutil
 import time
+import threading
+from multiprocessing.pool import ThreadPool
 
 import pytest
+import numpy as np
 import spikeextractors as se
 
-from spikesorters import run_sorters, collect_sorting_outputs
+from spikesorters import run_sorters, collect_sorting_outputs, rebuild_output_index, SortingOutput
+from spikesorters.launcher import _run_bin_packed, output_index_name
+from spikesorters.basesorter import BaseSorter
+from spikesorters.sorterlist import _sorter_registry
+from spikesorters.sorter_tools import SpikeSortingError
+from spikesorters.utils.shellscript import ShellScript
+
+
+class SleepSorter(BaseSorter):
+    """
+    Sorter waiting on a 'sleep' shell script.
+    """
+    sorter_name = 'sleep'
+    runs_external_process = True
+    _default_params = {'duration': 30}
+
+    @classmethod
+    def is_installed(cls):
+        return True
+
+    @staticmethod
+    def get_sorter_version():
+        return '0.0'
+
+    def _setup_recording(self, recording, output_folder):
+        pass
+
+    def _run(self, recording, output_folder):
+        shell_script = ShellScript('#!/bin/bash\nexec sleep {}'.format(self.params['duration']), script_path=output_folder / 'run_sleep')
+        shell_script.start()
+        if shell_script.wait() != 0:
+            raise Exception('sleep failed')
+        np.save(str(output_folder / 'spike_times.npy'), np.arange(10))
+
+    @staticmethod
+    def get_result_from_folder(output_folder):
+        sorting = se.NumpySortingExtractor()
+        sorting.set_times_labels(np.load(str(output_folder / 'spike_times.npy')), np.zeros(10, dtype=int))
+        return sorting
 
 
 def test_run_sorters_with_list():
@@ -106,6 +148,176 @@ def test_run_sorters_dask():
     print(t1 - t0)
 
 
+def test_run_sorters_asyncio():
+    recording_dict = {}
+    for i in range(2):
+        rec, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0, dumpable=True,
+                                                 dump_folder='test_run_sorters_asyncio_toy_{}'.format(i))
+        recording_dict['rec_' + str(i)] = rec
+
+    working_folder = 'test_run_sorters_asyncio'
+    if os.path.exists(working_folder):
+        shutil.rmtree(working_folder)
+
+    results = run_sorters(['tridesclous'], recording_dict, working_folder, engine='asyncio',
+                          engine_kwargs={'max_concurrent': 2})
+    assert set(results.keys()) == {('rec_0', 'tridesclous'), ('rec_1', 'tridesclous')}
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='uses a posix shell script')
+def test_run_sorters_asyncio_timeout(monkeypatch):
+    monkeypatch.setitem(_sorter_registry, 'sleep', (__name__, 'SleepSorter'))
+    recording_dict = {}
+    for i in range(3):
+        rec, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+        recording_dict['rec_' + str(i)] = rec
+
+    working_folder = 'test_run_sorters_asyncio_timeout'
+    if os.path.exists(working_folder):
+        shutil.rmtree(working_folder)
+
+    # the 3 sleeps run concurrently and are stopped by the timeout
+    t0 = time.perf_counter()
+    with pytest.raises(SpikeSortingError, match='timeout'):
+        run_sorters(['sleep'], recording_dict, working_folder, engine='asyncio',
+                    engine_kwargs={'max_concurrent': 3, 'timeout': 1})
+    assert time.perf_counter() - t0 < 15
+
+    shutil.rmtree(working_folder)
+    results = run_sorters(['sleep'], recording_dict, working_folder, engine='asyncio',
+                          sorter_params={'sleep': {'duration': 1}}, engine_kwargs={'timeout': 20})
+    assert len(results) == 3
+
+
+def test_run_bin_packed():
+    resources = {'cores': 4, 'ram_mb': 1000., 'scratch_mb': None, 'licenses': {'matlab': 2}}
+    footprints = [{'cores': 4, 'ram_mb': 100., 'scratch_mb': 10., 'licenses': {}}] * 2 + \
+                 [{'cores': 1, 'ram_mb': 600., 'scratch_mb': 10., 'licenses': {}}] * 3 + \
+                 [{'cores': 1, 'ram_mb': 10., 'scratch_mb': 10., 'licenses': {'matlab': 1}}] * 5 + \
+                 [{'cores': 16, 'ram_mb': 5000., 'scratch_mb': 10., 'licenses': {'matlab': 4}}]
+    lock = threading.Lock()
+    used = {'cores': 0, 'ram_mb': 0., 'matlab': 0}
+    peaks = {'cores': 0, 'ram_mb': 0., 'matlab': 0}
+    done = []
+
+    def func(i):
+        fp = footprints[i]
+        with lock:
+            used['cores'] += min(fp['cores'], 4)
+            used['ram_mb'] += min(fp['ram_mb'], 1000.)
+            used['matlab'] += min(fp['licenses'].get('matlab', 0), 2)
+            for key in peaks:
+                peaks[key] = max(peaks[key], used[key])
+        time.sleep(0.05)
+        with lock:
+            used['cores'] -= min(fp['cores'], 4)
+            used['ram_mb'] -= min(fp['ram_mb'], 1000.)
+            used['matlab'] -= min(fp['licenses'].get('matlab', 0), 2)
+            done.append(i)
+
+    pool = ThreadPool(8)
+    _run_bin_packed(pool, func, list(range(len(footprints))), footprints, resources, poll_interval=0.01)
+    pool.close()
+    assert sorted(done) == list(range(len(footprints)))
+    assert peaks['cores'] == 4
+    assert peaks['ram_mb'] <= 1000.
+    assert peaks['matlab'] == 2
+
+    # the scratch disk of the finished tasks stays used: the last task is run alone with a warning
+    resources = {'cores': 4, 'ram_mb': None, 'scratch_mb': 25., 'licenses': {}}
+    footprints = [{'cores': 1, 'ram_mb': 10., 'scratch_mb': 10., 'licenses': {}}] * 3
+    done = []
+    pool = ThreadPool(2)
+    with pytest.warns(UserWarning, match='does not fit'):
+        _run_bin_packed(pool, lambda i: done.append(i), list(range(3)), footprints, resources, poll_interval=0.01)
+    pool.close()
+    assert sorted(done) == [0, 1, 2]
+
+    # the licenses without a configured number of tokens are not limited
+    resources = {'cores': 4, 'ram_mb': None, 'scratch_mb': None, 'licenses': {}}
+    footprints = [{'cores': 1, 'ram_mb': 10., 'scratch_mb': 10., 'licenses': {'matlab': 1}}] * 4
+    running = []
+    peak = []
+
+    def func(i):
+        with lock:
+            running.append(i)
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(i)
+
+    pool = ThreadPool(4)
+    _run_bin_packed(pool, func, list(range(4)), footprints, resources, poll_interval=0.01)
+    pool.close()
+    assert max(peak) == 4
+
+
+def test_run_bin_packed_failure():
+    # a failed task does not abandon the others, its error is raised once they are done
+    resources = {'cores': 2, 'ram_mb': None, 'scratch_mb': None, 'licenses': {}}
+    footprints = [{'cores': 1, 'ram_mb': 10., 'scratch_mb': 10., 'licenses': {}}] * 4
+    done = []
+
+    def func(i):
+        if i == 1:
+            raise ValueError('task 1 failed')
+        time.sleep(0.1)
+        done.append(i)
+
+    pool = ThreadPool(2)
+    with pytest.raises(ValueError, match='task 1 failed'):
+        _run_bin_packed(pool, func, list(range(4)), footprints, resources, poll_interval=0.01)
+    pool.close()
+    assert sorted(done) == [0, 2, 3]
+
+
+def test_output_index(monkeypatch):
+    monkeypatch.setitem(_sorter_registry, 'sleep', (__name__, 'SleepSorter'))
+    recording_dict = {}
+    for i in range(3):
+        rec, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+        recording_dict['rec_' + str(i)] = rec
+
+    working_folder = 'test_run_sorters_index'
+    if os.path.exists(working_folder):
+        shutil.rmtree(working_folder)
+    run_sorters(['sleep'], recording_dict, working_folder, sorter_params={'sleep': {'duration': 0}},
+                with_output=False)
+    with open(os.path.join(working_folder, output_index_name), 'r', encoding='utf8') as f:
+        index = json.load(f)
+    assert sorted(index.keys()) == ['rec_0/sleep', 'rec_1/sleep', 'rec_2/sleep']
+
+    # lazy collection: only the index is read
+    results = collect_sorting_outputs(working_folder, lazy=True)
+    assert len(results) == 3
+    sorting = results[('rec_0', 'sleep')]
+    assert isinstance(sorting, SortingOutput)
+    assert not sorting.is_loaded
+    assert len(sorting.get_unit_ids()) == 1
+    assert sorting.is_loaded
+    eager_results = collect_sorting_outputs(working_folder)
+    assert isinstance(eager_results[('rec_0', 'sleep')], se.SortingExtractor)
+    parallel_results = collect_sorting_outputs(working_folder, lazy=False, n_jobs=3)
+    assert list(parallel_results.keys()) == list(eager_results.keys())
+
+    # the index is rebuilt for a working folder without index, and updated by the new runs
+    os.remove(os.path.join(working_folder, output_index_name))
+    recording_dict['rec_3'] = recording_dict['rec_0']
+    results = run_sorters(['sleep'], recording_dict, working_folder, sorter_params={'sleep': {'duration': 0}},
+                          mode='keep')
+    assert len(results) == 4
+    # run_sorters returns SortingExtractors
+    assert all(isinstance(sorting, se.SortingExtractor) for sorting in results.values())
+
+    # a removed output stays in the index until it is rebuilt
+    shutil.rmtree(os.path.join(working_folder, 'rec_3'))
+    assert len(collect_sorting_outputs(working_folder, lazy=True)) == 4
+    assert len(collect_sorting_outputs(working_folder, use_index=False)) == 3
+    rebuild_output_index(working_folder)
+    assert len(collect_sorting_outputs(working_folder)) == 3
+
+
 def test_collect_sorting_outputs():
     working_folder = 'test_run_sorters_dict'
     results = collect_sorting_outputs(working_folder)
@@ -0,0 +1,108 @@
+import sys
+import time
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from spikesorters import set_matlab_session_pool, get_matlab_session_pool
+from spikesorters.matlab_sessions import MatlabSessionPool, make_session_script
+
+fake_matlab_command = [sys.executable, str(Path(__file__).parent / 'fake_matlab.py'), '-r']
+
+
+def _get_folder(name):
+    folder = Path('test_matlab_sessions') / name
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir(parents=True)
+    return folder
+
+
+def _write_script(folder, name, lines):
+    script_path = folder / (name + '.m')
+    script_path.write_text('\n'.join(lines) + '\n')
+    return script_path
+
+
+def test_make_session_script():
+    folder = _get_folder('session_script')
+    master = Path(__file__).parents[1] / 'kilosort2' / 'kilosort2_master.m'
+    shutil.copy(str(master), str(folder))
+    session_script = make_session_script(folder / 'kilosort2_master.m')
+    txt = session_script.read_text()
+    assert 'quit(' not in txt
+    assert 'spikesorters_exit(1);' in txt and 'spikesorters_exit(0);' in txt
+
+
+def test_matlab_session_pool():
+    folder = _get_folder('pool')
+    pool = MatlabSessionPool(num_sessions=1, matlab_command=fake_matlab_command, max_jobs_per_session=3,
+                             folder=folder / 'sessions')
+    try:
+        # the session is reused by the next jobs
+        ok_script = _write_script(folder, 'ok', ["fprintf('spikesorters_stage step 0.100\\n');", 'quit(0);'])
+        for i in range(2):
+            assert pool.run_script(ok_script, log_path=folder / 'ok.log') == 0
+        status = pool.get_status()
+        assert len(status) == 1 and status[0]['num_jobs'] == 2
+        assert 'spikesorters_stage step 0.100' in (folder / 'ok.log').read_text()
+        first_session = status[0]['folder']
+
+        # a failed job: the exit code is returned and the session is recycled
+        fail_script = _write_script(folder, 'fail', ["disp('failed');", 'quit(1);'])
+        assert pool.run_script(fail_script) == 1
+        assert pool.get_status() == []
+        assert pool.run_script(ok_script) == 0
+        assert pool.get_status()[0]['folder'] != first_session
+
+        # crash of the session
+        crash_script = _write_script(folder, 'crash', ['crash_session'])
+        assert pool.run_script(crash_script) == -1
+        assert pool.run_script(ok_script) == 0
+
+        # timeout
+        slow_script = _write_script(folder, 'slow', ['pause(10);', 'quit(0);'])
+        with pytest.raises(TimeoutError):
+            pool.run_script(slow_script, timeout=0.5)
+        assert pool.run_script(ok_script) == 0
+
+        # recycling after max_jobs_per_session jobs, health check of the idle sessions
+        pool.health_check_interval = 0.
+        for i in range(4):
+            assert pool.run_script(ok_script) == 0
+        assert pool.get_status()[0]['num_jobs'] < 3
+    finally:
+        pool.close()
+    assert pool.get_status() == []
+
+
+def test_matlab_session_pool_concurrent():
+    folder = _get_folder('concurrent')
+    set_matlab_session_pool(num_sessions=2, matlab_command=fake_matlab_command, folder=folder / 'sessions')
+    pool = get_matlab_session_pool()
+    try:
+        # warm up
+        ok_script = _write_script(folder, 'ok', ['quit(0);'])
+        assert pool.run_script(ok_script) == 0
+        sleep_script = _write_script(folder, 'sleep', ['pause(1);', 'quit(0);'])
+        codes = []
+        threads = [threading.Thread(target=lambda: codes.append(pool.run_script(sleep_script))) for _ in range(2)]
+        t0 = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert codes == [0, 0]
+        assert len(pool.get_status()) == 2
+        assert time.perf_counter() - t0 < 10
+    finally:
+        set_matlab_session_pool(None)
+    assert get_matlab_session_pool() is None
+
+
+if __name__ == '__main__':
+    test_make_session_script()
+    test_matlab_session_pool()
+    test_matlab_session_pool_concurrent()
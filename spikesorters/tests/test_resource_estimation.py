@@ -0,0 +1,64 @@
+import shutil
+from pathlib import Path
+import numpy as np
+import spikeextractors as se
+
+from spikesorters import TridesclousSorter, estimate_resources, calibrate_resources, set_resource_calibration_file
+from spikesorters.resource_estimation import _calibrations, get_resource_calibration
+from spikesorters.tests.test_basesorter import DummySorter
+
+
+def test_estimate_resources():
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    float32_mb = 4 * recording.get_num_frames() * 4 / 1e6
+
+    # raw and processed float32 copies
+    estimate = estimate_resources('tridesclous', recording)
+    assert np.isclose(estimate['scratch_mb'], 2 * float32_mb)
+    assert estimate['run_time_s'] is None
+    assert not estimate['calibrated']
+
+    estimate = estimate_resources('spykingcircus', recording, dtype='int16')
+    assert np.isclose(estimate['scratch_mb'], 1.1 * float32_mb / 2)
+
+    footprint = TridesclousSorter.get_resource_footprint(recording)
+    assert footprint['scratch_mb'] == estimate_resources(TridesclousSorter, recording)['scratch_mb']
+
+    # int16 copy and whitened copy for all the Kilosort versions
+    for sorter_name in ('kilosort', 'kilosort2', 'kilosort2_5', 'kilosort3'):
+        estimate = estimate_resources(sorter_name, recording, NT=1024)
+        assert np.isclose(estimate['scratch_mb'], float32_mb)
+        assert np.isclose(estimate['ram_mb'], 2000. + 16 * 1024 * 4 * 4 / 1e6)
+
+
+def test_calibrate_resources():
+    folder = Path('test_resource_estimation')
+    if folder.is_dir():
+        shutil.rmtree(folder)
+    calibration_file = folder / 'calibration.json'
+    set_resource_calibration_file(calibration_file)
+    try:
+        calibration = calibrate_resources(DummySorter, num_channels=(2, 4), durations=(5,), folder=folder / 'runs')
+        assert len(calibration['measures']) == 2
+        # the binary copy of the setup is measured
+        assert all(m['scratch_mb'] > 0 for m in calibration['measures'])
+        assert calibration_file.is_file()
+        assert not (folder / 'runs').exists()
+
+        recording, _ = se.example_datasets.toy_example(num_channels=8, duration=20, seed=0)
+        estimate = estimate_resources(DummySorter, recording)
+        assert estimate['calibrated']
+        assert estimate['run_time_s'] is not None
+        assert estimate['scratch_mb'] > 0
+
+        # the calibration is read back from the file
+        _calibrations.clear()
+        assert get_resource_calibration(DummySorter)['scratch_mb'] == calibration['scratch_mb']
+    finally:
+        set_resource_calibration_file(None)
+        _calibrations.clear()
+
+
+if __name__ == '__main__':
+    test_estimate_resources()
+    test_calibrate_resources()
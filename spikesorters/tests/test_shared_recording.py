@@ -0,0 +1,95 @@
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+import spikeextractors as se
+
+from spikesorters import run_sorter, set_shared_recording_folder, SharedRecordingExtractor
+from spikesorters.shared_recording import share_recording
+from spikesorters.tests.test_basesorter import DummySorter
+
+
+class TracesSorter(DummySorter):
+    """
+    Sorter saving the sum of the traces it gets in the run.
+    """
+    sorter_name = 'traces'
+
+    def _run(self, recording, output_folder):
+        np.save(str(output_folder / 'spike_times.npy'), np.arange(10))
+        np.save(str(output_folder / 'traces_sum.npy'), recording.get_traces().sum(axis=1))
+        with open(str(output_folder / 'recording_class.txt'), 'w') as f:
+            f.write(type(recording).__name__)
+
+
+def _get_folder(name):
+    folder = Path(name)
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir()
+    return folder
+
+
+def test_share_recording():
+    folder = _get_folder('test_shared_recording_share')
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    recording.set_channel_groups([0, 0, 1, 1])
+    recording.set_channel_property(2, 'quality', 'bad')
+    shared = share_recording(recording, folder=folder, chunk_mb=0.1)
+    assert isinstance(shared, SharedRecordingExtractor)
+    assert Path(shared.file_path).parent == folder.absolute()
+    np.testing.assert_array_equal(shared.get_traces(), recording.get_traces())
+    np.testing.assert_array_equal(shared.get_traces(channel_ids=[3, 1], start_frame=100, end_frame=200),
+                                  recording.get_traces(channel_ids=[3, 1], start_frame=100, end_frame=200))
+    np.testing.assert_array_equal(shared.get_channel_locations(), recording.get_channel_locations())
+    assert shared.get_channel_groups().tolist() == [0, 0, 1, 1]
+    assert shared.get_channel_property(2, 'quality') == 'bad'
+    assert shared.get_sampling_frequency() == recording.get_sampling_frequency()
+    # the traces of all the channels are a view of the mapped file
+    assert np.shares_memory(shared.get_traces(start_frame=10, end_frame=20), shared._traces)
+
+    # the pickle holds the path, not the traces
+    data = pickle.dumps(shared)
+    assert len(data) < shared.get_traces().nbytes / 10
+    shared_copy = pickle.loads(data)
+    np.testing.assert_array_equal(shared_copy.get_traces(), recording.get_traces())
+    assert shared_copy.get_channel_property(2, 'quality') == 'bad'
+
+    del shared_copy
+    shared.remove()
+    assert not Path(shared.file_path).is_file()
+
+
+@pytest.mark.parametrize('joblib_backend', ['loky', 'threading'])
+def test_run_parallel_not_dumpable(joblib_backend):
+    folder = _get_folder('test_shared_recording_run_' + joblib_backend)
+    set_shared_recording_folder(folder / 'shared')
+    try:
+        # in memory: not dumpable
+        recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+        recording.set_channel_groups([0, 0, 1, 1])
+        with pytest.raises(RuntimeError):
+            run_sorter(TracesSorter, recording, output_folder=folder / 'traces_dump', grouping_property='group',
+                       parallel=True, n_jobs=2, joblib_backend='loky', recording_transport='dump')
+
+        sorting = run_sorter(TracesSorter, recording, output_folder=folder / 'traces', grouping_property='group',
+                             parallel=True, n_jobs=2, joblib_backend=joblib_backend)
+        assert len(sorting.get_unit_ids()) == 2
+        expected_class = 'SubRecordingExtractor' if joblib_backend == 'threading' else 'SharedRecordingExtractor'
+        for group, channel_ids in enumerate([[0, 1], [2, 3]]):
+            group_folder = folder / 'traces' / str(group)
+            assert (group_folder / 'recording_class.txt').read_text() == expected_class
+            np.testing.assert_allclose(np.load(str(group_folder / 'traces_sum.npy')),
+                                       recording.get_traces(channel_ids=channel_ids).sum(axis=1))
+        # the scratch files are removed after the run
+        assert not (folder / 'shared').is_dir() or len(os.listdir(str(folder / 'shared'))) == 0
+    finally:
+        set_shared_recording_folder(None)
+
+
+if __name__ == '__main__':
+    test_share_recording()
+    test_run_parallel_not_dumpable('loky')
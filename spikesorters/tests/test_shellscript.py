@@ -0,0 +1,135 @@
+import sys
+import time
+import shutil
+from pathlib import Path
+import pytest
+
+import spikesorters.utils.shellscript as shellscript
+from spikesorters.utils.shellscript import ShellScript, is_process_group_alive
+
+ON_WINDOWS = 'win' in sys.platform and sys.platform != 'darwin'
+
+
+def _get_folder(name):
+    folder = Path(name)
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir()
+    return folder
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason='bash scripts')
+def test_shellscript_non_blocking():
+    folder = _get_folder('test_shellscript_start')
+    script = ShellScript('''
+        #!/bin/bash
+        echo start
+        sleep 1
+        echo end
+    ''', script_path=folder / 'run', log_path=folder / 'run.log')
+    t0 = time.perf_counter()
+    script.start()
+    assert time.perf_counter() - t0 < 0.5
+    assert script.isRunning()
+    assert script.elapsedTimeSinceStart() < 0.5
+    assert script.wait() == 0
+    with open(folder / 'run.log', 'r') as f:
+        assert f.read().split() == ['start', 'end']
+
+    # stop a running script
+    script = ShellScript('''
+        #!/bin/bash
+        sleep 100
+    ''', script_path=folder / 'run_long', log_path=folder / 'run_long.log')
+    script.start()
+    assert script.wait(timeout=0.1) is None
+    script.stop()
+    assert script.isFinished()
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason='bash scripts')
+def test_shellscript_rate_limited_echo(capsys):
+    folder = _get_folder('test_shellscript_echo')
+    script = ShellScript('''
+        #!/bin/bash
+        for i in $(seq 1 1000); do echo line$i; done
+    ''', script_path=folder / 'run', log_path=folder / 'run.log', verbose=True, max_echo_lines=10,
+                         echo_interval=10.)
+    script.start()
+    assert script.wait() == 0
+    out = capsys.readouterr().out
+    assert 'line10\n' in out and 'line11\n' not in out
+    assert '990 lines not shown' in out
+    with open(folder / 'run.log', 'r') as f:
+        assert len(f.readlines()) == 1000
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason='bash scripts')
+def test_shellscript_stop_process_tree():
+    folder = _get_folder('test_shellscript_stop')
+    # the background job ignores SIGINT (non interactive bash) and outlives the script
+    script = ShellScript('''
+        #!/bin/bash
+        sleep 100 &
+        sleep 100
+    ''', script_path=folder / 'run', log_path=folder / 'run.log', stop_grace_periods=(0.5, 3., 5.))
+    script.start()
+    time.sleep(0.3)
+    pgid = script._process.pid
+    assert is_process_group_alive(pgid)
+    assert script.stop()
+    assert not script.isTreeRunning() and not is_process_group_alive(pgid)
+
+    # the processes ignoring SIGINT and SIGTERM are killed after the grace periods
+    script = ShellScript('''
+        #!/bin/bash
+        trap '' INT TERM
+        bash -c "trap '' INT TERM; sleep 100" &
+        wait
+    ''', script_path=folder / 'run_stubborn', log_path=folder / 'run_stubborn.log')
+    script.start()
+    time.sleep(0.3)
+    t0 = time.perf_counter()
+    assert script.stop(grace_periods=(0.2, 0.2, 5.))
+    assert 0.4 <= time.perf_counter() - t0 < 5
+    assert not script.isTreeRunning()
+
+    # the leader has exited, its background job is still stopped
+    script = ShellScript('''
+        #!/bin/bash
+        sleep 100 &
+    ''', script_path=folder / 'run_orphan', log_path=folder / 'run_orphan.log')
+    script.start()
+    time.sleep(0.3)
+    assert not script.isRunning() and script.isTreeRunning()
+    assert script.stop()
+    assert not script.isTreeRunning()
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason='bash scripts')
+def test_shellscript_stop_scans(monkeypatch):
+    folder = _get_folder('test_shellscript_scans')
+    num_scans = [0]
+    has_running_member = shellscript._has_running_member
+
+    def counted_has_running_member(pgid):
+        num_scans[0] += 1
+        return has_running_member(pgid)
+
+    monkeypatch.setattr(shellscript, '_has_running_member', counted_has_running_member)
+    script = ShellScript('''
+        #!/bin/bash
+        trap '' INT TERM
+        sleep 100 &
+        wait
+    ''', script_path=folder / 'run', log_path=folder / 'run.log')
+    script.start()
+    time.sleep(0.3)
+    # /proc is scanned about once per second while the group is polled, not at every poll
+    assert script.stop(grace_periods=(1.5, 1.5, 5.))
+    assert num_scans[0] <= 8
+
+
+if __name__ == '__main__':
+    test_shellscript_non_blocking()
+    test_shellscript_stop_process_tree()
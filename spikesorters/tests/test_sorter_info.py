@@ -0,0 +1,87 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+from spikesorters import installed_sorters
+from spikesorters.sorter_info import (get_sorter_info, get_sorters_info, set_sorter_info_cache_file,
+                                      clear_sorter_info_cache, _info_cache)
+
+
+class DummyPathSorter:
+    sorter_name = 'dummy_path'
+    dummy_path = None
+    n_probes = 0
+
+    @classmethod
+    def is_installed(cls):
+        cls.n_probes += 1
+        return cls.dummy_path is not None and (Path(cls.dummy_path) / 'version.txt').is_file()
+
+    @classmethod
+    def get_sorter_version(cls):
+        with open(str(Path(cls.dummy_path) / 'version.txt'), mode='r', encoding='utf8') as f:
+            return f.readline()
+
+
+def test_sorter_info_cache():
+    folder = Path('test_sorter_info')
+    if folder.is_dir():
+        shutil.rmtree(str(folder))
+    folder.mkdir()
+    set_sorter_info_cache_file(folder / 'sorter_info.json')
+    clear_sorter_info_cache()
+
+    DummyPathSorter.dummy_path = str((folder / 'dummy').absolute())
+    info = get_sorter_info(DummyPathSorter)
+    assert info == {'installed': False, 'version': None}
+    assert DummyPathSorter.n_probes == 1
+
+    # installation: the folder mtime changes
+    (folder / 'dummy').mkdir()
+    with open(str(folder / 'dummy' / 'version.txt'), 'w') as f:
+        f.write('1.0')
+    info = get_sorter_info(DummyPathSorter)
+    assert info == {'installed': True, 'version': '1.0'}
+    assert DummyPathSorter.n_probes == 2
+    get_sorter_info(DummyPathSorter)
+    assert DummyPathSorter.n_probes == 2
+
+    # new version
+    time.sleep(0.01)
+    with open(str(folder / 'dummy' / 'version.txt'), 'w') as f:
+        f.write('2.0')
+    os.utime(str(folder / 'dummy' / 'version.txt'), (time.time() + 10, time.time() + 10))
+    assert get_sorter_info(DummyPathSorter)['version'] == '2.0'
+    assert DummyPathSorter.n_probes == 3
+
+    # the file cache is used by other processes
+    _info_cache.clear()
+    assert get_sorter_info(DummyPathSorter)['version'] == '2.0'
+    assert DummyPathSorter.n_probes == 3
+
+    # env variable
+    os.environ['DUMMY_PATH'] = str(folder.absolute())
+    get_sorter_info(DummyPathSorter)
+    assert DummyPathSorter.n_probes == 4
+    del os.environ['DUMMY_PATH']
+
+    # invalidation
+    clear_sorter_info_cache()
+    get_sorter_info(DummyPathSorter)
+    assert DummyPathSorter.n_probes == 5
+    get_sorter_info(DummyPathSorter, use_cache=False)
+    assert DummyPathSorter.n_probes == 6
+
+    set_sorter_info_cache_file(None)
+
+
+def test_get_sorters_info():
+    infos = get_sorters_info(['tridesclous', 'kilosort2'])
+    assert list(infos.keys()) == ['tridesclous', 'kilosort2']
+    assert installed_sorters() == installed_sorters(use_cache=False)
+
+
+if __name__ == '__main__':
+    test_sorter_info_cache()
+    test_get_sorters_info()
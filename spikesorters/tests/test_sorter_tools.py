@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import numpy as np
+import spikeextractors as se
+
+from spikesorters.sorter_tools import get_bindat_passthrough_path
+
+
+def test_get_bindat_passthrough_path():
+    folder = 'test_sorter_tools'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    raw_filename = folder + '/raw_file.dat'
+    recording.write_to_binary_dat_format(raw_filename, dtype='int16')
+    fs = recording.get_sampling_frequency()
+
+    rec_int16 = se.BinDatRecordingExtractor(raw_filename, fs, 4, 'int16', time_axis=0)
+    assert str(get_bindat_passthrough_path(rec_int16, dtype='int16')) == os.path.abspath(raw_filename)
+    assert get_bindat_passthrough_path(rec_int16, dtype='float32') is None
+
+    rec_offset = se.BinDatRecordingExtractor(raw_filename, fs, 4, 'int16', time_axis=0, file_offset=8)
+    assert get_bindat_passthrough_path(rec_offset, dtype='int16') is None
+
+    sub_rec = se.SubRecordingExtractor(rec_int16, channel_ids=[0, 1])
+    assert get_bindat_passthrough_path(sub_rec, dtype='int16') is None
+    assert get_bindat_passthrough_path(recording, dtype='int16') is None
+
+    # the sorters get the scaled traces
+    rec_gain = se.BinDatRecordingExtractor(raw_filename, fs, 4, 'int16', time_axis=0, gain=0.195)
+    assert get_bindat_passthrough_path(rec_gain, dtype='int16') is None
+    rec_channel_offset = se.BinDatRecordingExtractor(raw_filename, fs, 4, 'int16', time_axis=0, gain=1.,
+                                                     channel_offset=-100.)
+    assert get_bindat_passthrough_path(rec_channel_offset, dtype='int16') is None
+    rec_unit_gain = se.BinDatRecordingExtractor(raw_filename, fs, 4, 'int16', time_axis=0, gain=1.)
+    assert get_bindat_passthrough_path(rec_unit_gain, dtype='int16') is not None
+
+
+if __name__ == '__main__':
+    test_get_bindat_passthrough_path()
@@ -16,8 +16,13 @@ if getpass.getuser() == 'samuel':
     
 
 
+import sys
+import json
+import subprocess
+from pathlib import Path
 import pytest
 
+import spikesorters as ss
 from spikesorters import print_sorter_versions
 
 
@@ -25,7 +30,40 @@ def test_print_sorter_versions():
     print_sorter_versions()
 
 
+def test_lazy_sorter_registry():
+    assert 'tridesclous' in ss.sorter_dict
+    assert ss.available_sorters() == sorted(ss.sorter_dict.keys())
+    assert ss.sorter_dict['tridesclous'] is ss.TridesclousSorter
+    assert ss.get_sorter_class('kilosort2').sorter_name == 'kilosort2'
+    assert len(ss.sorter_full_list) == len(ss.sorter_dict)
+    assert ss.get_default_params(ss.Kilosort2Sorter) == ss.get_default_params('kilosort2')
+    with pytest.raises(KeyError):
+        ss.get_sorter_class('not_a_sorter')
+
+
+def test_import_time():
+    # import spikesorters in a fresh interpreter: the wrapper modules must not be imported
+    code = '''
+import sys, time, json
+import spikeextractors
+t0 = time.perf_counter()
+import spikesorters
+t1 = time.perf_counter()
+spikesorters.available_sorters()
+spikesorters.get_default_params('kilosort2')
+wrappers = [m for m in sys.modules if m.startswith('spikesorters.') and m.count('.') == 2
+            and m.split('.')[1] == m.split('.')[2]]
+print(json.dumps({'import_time': t1 - t0, 'wrappers': wrappers}))
+'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([str(Path(ss.__file__).parents[1]), env.get('PYTHONPATH', '')])
+    out = subprocess.check_output([sys.executable, '-c', code], env=env).decode('utf8')
+    res = json.loads(out.strip().splitlines()[-1])
+    print('import spikesorters: {:0.3f}s'.format(res['import_time']))
+    assert res['wrappers'] == ['spikesorters.kilosort2.kilosort2']
 
 
 if __name__ == '__main__':
-    test_print_sorter_versions()
\ No newline at end of file
+    test_print_sorter_versions()
+    test_lazy_sorter_registry()
+    test_import_time()
\ No newline at end of file
@@ -1,7 +1,13 @@
+import os
+import shutil
 import unittest
 import pytest
+import numpy as np
+import spikeextractors as se
 
 from spikesorters import SpykingcircusSorter
+from spikesorters.spyking_circus import spyking_circus
+from spikesorters.spyking_circus.spyking_circus import write_npy_recording
 from spikesorters.tests.common_tests import SorterCommonTestSuite
 
 
@@ -11,7 +17,63 @@ class SpykingcircusCommonTestSuite(SorterCommonTestSuite, unittest.TestCase):
     SorterClass = SpykingcircusSorter
 
 
+def test_write_npy_recording():
+    folder = 'test_spykingcircus_npy'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0, dumpable=True,
+                                                   dump_folder=folder + '/toy')
+    traces = recording.get_traces()
+
+    for n_jobs in [1, 2, -1]:
+        npy_file = f'{folder}/recording_{n_jobs}.npy'
+        write_npy_recording(recording, npy_file, dtype='float32', chunk_mb=0.1, n_jobs=n_jobs)
+        data = np.load(npy_file)
+        assert data.shape == (recording.get_num_frames(), recording.get_num_channels())
+        assert np.array_equal(data, traces.T.astype('float32'))
+
+    npy_file = f'{folder}/recording_int16.npy'
+    write_npy_recording(recording, npy_file, dtype='int16', chunk_mb=0.1)
+    data = np.load(npy_file)
+    assert data.dtype == np.int16
+    assert np.array_equal(data, traces.T.astype('int16'))
+
+    # the values out of the int16 range saturate
+    large_traces = np.array([[1e6, -1e6, 100.5]] * 2, dtype='float32')
+    large_recording = se.NumpyRecordingExtractor(large_traces, sampling_frequency=30000.)
+    npy_file = f'{folder}/recording_saturated.npy'
+    write_npy_recording(large_recording, npy_file, dtype='int16', chunk_mb=0.1)
+    assert np.load(npy_file)[:, 0].tolist() == [32767, -32768, 100]
+
+
+def test_write_npy_recording_all_cores(monkeypatch):
+    folder = 'test_spykingcircus_npy_all_cores'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=2, seed=0, dumpable=True,
+                                                   dump_folder=folder + '/toy')
+    num_tasks = []
+
+    class CountingParallel(spyking_circus.Parallel):
+        def __call__(self, iterable):
+            tasks = list(iterable)
+            num_tasks.append(len(tasks))
+            return super().__call__(tasks)
+
+    monkeypatch.setattr(spyking_circus, 'Parallel', CountingParallel)
+    monkeypatch.setattr(spyking_circus.os, 'cpu_count', lambda: 4)
+    npy_file = f'{folder}/recording.npy'
+    # n_jobs=-1 is resolved to the number of cores before sizing the chunks
+    write_npy_recording(recording, npy_file, dtype='float32', chunk_mb=0.1, n_jobs=-1)
+    chunk_size = int(0.1 * 1e6) // (4 * 4 * 4)
+    assert num_tasks == [int(np.ceil(recording.get_num_frames() / chunk_size))]
+    assert np.array_equal(np.load(npy_file), recording.get_traces().T.astype('float32'))
+
+
 if __name__ == '__main__':
     SpykingcircusCommonTestSuite().test_on_toy()
     SpykingcircusCommonTestSuite().test_several_groups()
     SpykingcircusCommonTestSuite().test_with_BinDatRecordingExtractor()
+    test_write_npy_recording()
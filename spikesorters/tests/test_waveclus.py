@@ -3,10 +3,13 @@ if getpass.getuser() == 'samuel':
     kilosort_path = '/home/samuel/Documents/Spikeinterface/wave_clus/'
     os.environ["WAVECLUS_PATH"] = kilosort_path
 
+import shutil
 import unittest
 import pytest
+import numpy as np
 import spikeextractors as se
 from spikesorters import WaveClusSorter
+from spikesorters.waveclus.waveclus import write_mat_files
 from spikesorters.tests.common_tests import SorterCommonTestSuite
 
 # This run several tests
@@ -15,7 +18,30 @@ class WaveClusCommonTestSuite(SorterCommonTestSuite, unittest.TestCase):
     SorterClass = WaveClusSorter
 
 
+@pytest.mark.parametrize('max_open_files', [256, 3])
+def test_write_mat_files(max_open_files):
+    h5py = pytest.importorskip('h5py')
+    folder = 'test_waveclus_mat'
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    recording, _ = se.example_datasets.toy_example(num_channels=4, duration=10, seed=0)
+    traces = recording.get_traces()
+
+    # with max_open_files=3, the channels are written in 2 batches
+    file_paths = write_mat_files(recording, folder, chunk_mb=0.1, max_open_files=max_open_files)
+    assert len(file_paths) == recording.get_num_channels()
+    for nch, file_path in enumerate(file_paths):
+        with open(file_path, 'rb') as f:
+            assert f.read(10) == b'MATLAB 7.3'
+        with h5py.File(file_path, 'r') as f:
+            assert f['data'].shape == (recording.get_num_frames(), 1)
+            assert np.array_equal(f['data'][:, 0], traces[nch])
+            assert f['sr'][0, 0] == recording.get_sampling_frequency()
+
+
 if __name__ == '__main__':
     WaveClusCommonTestSuite().test_on_toy()
     WaveClusCommonTestSuite().test_several_groups()
     WaveClusCommonTestSuite().test_with_BinDatRecordingExtractor()
+    test_write_mat_files(3)
@@ -10,14 +10,7 @@ import distutils.version
 
 from ..basesorter import BaseSorter
 import spikeextractors as se
-from ..sorter_tools import recover_recording
-
-try:
-    import tridesclous as tdc
-
-    HAVE_TDC = True
-except ImportError:
-    HAVE_TDC = False
+from ..sorter_tools import recover_recording, get_recording_size_mb
 
 
 class TridesclousSorter(BaseSorter):
@@ -29,6 +22,7 @@ class TridesclousSorter(BaseSorter):
 
     sorter_name = 'tridesclous'
     requires_locations = False
+    resource_footprint = {'cores': 1, 'licenses': {}}
     compatible_with_parallel = {'loky': True, 'multiprocessing': False, 'threading': False}
 
     _default_params = {
@@ -78,13 +72,28 @@ class TridesclousSorter(BaseSorter):
     
     @classmethod
     def is_installed(cls):
+        try:
+            import tridesclous as tdc
+            HAVE_TDC = True
+        except ImportError:
+            HAVE_TDC = False
         return HAVE_TDC
         
     @staticmethod
     def get_sorter_version():
+        import tridesclous as tdc
         return tdc.__version__
 
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        # float32 copy of the traces (none for a BinDatRecordingExtractor) and the float32 processed signals
+        copy_mb = 0. if isinstance(recording, se.BinDatRecordingExtractor) and recording._time_axis == 0 \
+            else get_recording_size_mb(recording, 'float32')
+        return {'scratch_mb': copy_mb + get_recording_size_mb(recording, 'float32'),
+                'ram_mb': 500. + 0.1 * get_recording_size_mb(recording, 'float32')}
+
     def _setup_recording(self, recording, output_folder):
+        import tridesclous as tdc
         # reset the output folder
         output_folder.mkdir(parents=True, exist_ok=True)
         p = self.params
@@ -123,6 +132,7 @@ class TridesclousSorter(BaseSorter):
             print(tdc_dataio)
 
     def _run(self, recording, output_folder):
+        import tridesclous as tdc
         recording = recover_recording(recording)
         tdc_dataio = tdc.DataIO(dirname=str(output_folder))
 
@@ -146,8 +156,10 @@ class TridesclousSorter(BaseSorter):
                 print('peeler_params')
                 pprint(peeler_params)
 
+            t0 = time.perf_counter()
             cc = tdc.CatalogueConstructor(dataio=tdc_dataio, chan_grp=chan_grp)
             tdc.apply_all_catalogue_steps(cc, catalogue_nested_params, verbose=self.verbose)
+            self._add_backend_stage(output_folder, 'catalogue', time.perf_counter() - t0)
 
             if clean_catalogue_gui:
                 import pyqtgraph as pg
@@ -173,8 +185,9 @@ class TridesclousSorter(BaseSorter):
             peeler.change_params(catalogue=initial_catalogue, **peeler_params)
             t0 = time.perf_counter()
             peeler.run(duration=None, progressbar=False)
+            t1 = time.perf_counter()
+            self._add_backend_stage(output_folder, 'peeler', t1 - t0)
             if self.verbose:
-                t1 = time.perf_counter()
                 print('peeler.tun', t1-t0)
 
 
@@ -194,6 +207,7 @@ def make_nested_tdc_params(tdc_dataio, chan_grp,
                            wf_right_ms=3.0,
                            feature_method='auto',
                            cluster_method='auto'):
+    import tridesclous as tdc
     params = tdc.get_auto_params_for_catalogue(tdc_dataio, chan_grp=chan_grp)
 
     params['preprocessor']['highpass_freq'] = freq_min
@@ -6,14 +6,160 @@ import os
 from pathlib import Path
 import time
 import sys
-from typing import Optional, List, Any, Union
+import atexit
+import threading
+from typing import Optional, List, Any, Union, Callable, Sequence
+
+from ..cancellation import get_cancel_token
 
 PathType = Union[str, Path]
 
+ON_WINDOWS = 'win' in sys.platform and sys.platform != 'darwin'
+
+# running scripts by the id of the thread that started them (used by the launcher to stop timed out tasks)
+_running_scripts = {}
+_running_scripts_lock = threading.Lock()
+
+
+def get_running_shellscripts(thread_id: Optional[int] = None) -> List['ShellScript']:
+    """
+    Returns the scripts started (and still running) by the thread 'thread_id' (all threads if None).
+    """
+    with _running_scripts_lock:
+        if thread_id is None:
+            scripts = [script for scripts in _running_scripts.values() for script in scripts]
+        else:
+            scripts = list(_running_scripts.get(thread_id, []))
+    # the group of a finished script may only hold zombies: stop() then returns immediately
+    return [script for script in scripts if script.isRunning() or script._group_exists()]
+
+
+def _new_process_group_kwargs() -> dict:
+    # Popen arguments starting the process in its own process group (session on posix), so that its whole tree
+    # can be signaled (e.g. the mpiexec workers of Spyking Circus, the helpers forked by MATLAB)
+    if ON_WINDOWS:
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def _process_group_exists(pgid: int) -> bool:
+    # cheap check, the zombies of the group included
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _has_running_member(pgid: int) -> bool:
+    # scans /proc (linux) for a process of the group that is not a zombie
+    if not Path('/proc/self/stat').is_file():
+        return True
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/' + pid + '/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the fields after the command name: state, ppid, pgrp, ...
+        fields = stat[stat.rfind(')') + 2:].split()
+        if int(fields[2]) == pgid and fields[0] != 'Z':
+            return True
+    return False
+
+
+def is_process_group_alive(pgid: int) -> bool:
+    """
+    Returns True if a process of the group 'pgid' is still running (posix only). The zombies, which hold no
+    resources, are ignored on linux.
+    """
+    return _process_group_exists(pgid) and _has_running_member(pgid)
+
+
+def stop_process_group(pgid: int, grace_periods: Sequence[Optional[float]] = (1., 3., 5.),
+                       poll_leader: Optional[Callable] = None, poll_interval: float = 0.1,
+                       zombie_check_interval: float = 1.) -> bool:
+    """
+    Stops a process group (posix only): SIGINT, SIGTERM then SIGKILL are sent to the whole group, each followed by
+    its grace period, until all the processes of the group have exited.
+
+    Parameters
+    ----------
+    pgid: int
+        The process group id (the pid of the leader started in a new session or group)
+    grace_periods: list
+        The time in s given to the group to exit after SIGINT, SIGTERM and SIGKILL (None skips the signal)
+    poll_leader: callable or None
+        Reaps the leader if it is a child of this process (e.g. Popen.poll), otherwise it stays a zombie
+    poll_interval: float
+        The time in s between two checks of the group
+    zombie_check_interval: float
+        The time in s between two scans of /proc, which tell whether the remaining processes of the group are
+        zombies (not reaped by their parent)
+
+    Returns
+    -------
+    stopped: bool
+        True if the whole group has exited
+    """
+    last_scan = None
+
+    def group_alive(force_scan=False):
+        nonlocal last_scan
+        if poll_leader is not None:
+            poll_leader()
+        if not _process_group_exists(pgid):
+            return False
+        now = time.time()
+        if force_scan or last_scan is None or now - last_scan >= zombie_check_interval:
+            last_scan = now
+            return _has_running_member(pgid)
+        return True
+
+    for sig, grace_period in zip([signal.SIGINT, signal.SIGTERM, signal.SIGKILL], grace_periods):
+        if grace_period is None:
+            continue
+        if not group_alive(force_scan=True):
+            return True
+        try:
+            os.killpg(pgid, sig)
+        except ProcessLookupError:
+            return True
+        t0 = time.time()
+        while group_alive():
+            if time.time() - t0 > grace_period:
+                break
+            time.sleep(poll_interval)
+        else:
+            return True
+    return not group_alive(force_scan=True)
+
 
 class ShellScript():
+    """
+    Runs a shell script in a subprocess.
+
+    start() returns immediately: the output of the script is drained by a background thread, written to the
+    log file (flushed every 'flush_interval' seconds) and, if verbose, echoed to the console by batches (at most
+    'max_echo_lines' lines every 'echo_interval' seconds, the other lines are only in the log file).
+    The script can then be monitored, timed out or stopped while it runs. wait() returns when the script is
+    finished and the log is complete. In a sorter run, wait() stops the script and raises SpikeSortingTimeout or
+    SpikeSortingCancelled when the run times out or is cancelled (see cancellation.py).
+
+    The script runs in its own process group (session on posix): stop() signals the whole process tree, escalating
+    from SIGINT to SIGTERM and SIGKILL after the 'stop_grace_periods' (in s), and returns once all the processes of
+    the group have exited. On windows, the tree is stopped with CTRL_BREAK_EVENT then taskkill /T.
+    """
+    _cancel_poll_interval = 0.1
+
     def __init__(self, script: str, script_path: Optional[PathType] = None, log_path: Optional[PathType] = None,
-                 keep_temp_files: bool = False, verbose: bool = False):
+                 keep_temp_files: bool = False, verbose: bool = False, flush_interval: float = 1.,
+                 echo_interval: float = 0.5, max_echo_lines: int = 100,
+                 stop_grace_periods: Sequence[Optional[float]] = (1., 3., 5.)):
         lines = script.splitlines()
         lines = self._remove_initial_blank_lines(lines)
         if len(lines) > 0:
@@ -34,6 +180,12 @@ class ShellScript():
         self._dirs_to_remove: List[str] = []
         self._start_time: Optional[float] = None
         self._verbose = verbose
+        self._flush_interval = flush_interval
+        self._echo_interval = echo_interval
+        self._max_echo_lines = max_echo_lines
+        self._stop_grace_periods = tuple(stop_grace_periods)
+        self._reader_thread: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
 
     def __del__(self):
         self.cleanup()
@@ -78,22 +230,91 @@ class ShellScript():
         print('RUNNING SHELL SCRIPT: ' + cmd)
         self._start_time = time.time()
         self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1,
-                                         universal_newlines=True)
-        with open(script_log_path, 'w+') as script_log_file:
-            for line in self._process.stdout:
+                                         universal_newlines=True, **_new_process_group_kwargs())
+        self._reader_thread = threading.Thread(target=self._drain_output, args=(self._process, script_log_path),
+                                               daemon=True)
+        self._reader_thread.start()
+        self._thread_id = threading.get_ident()
+        with _running_scripts_lock:
+            _running_scripts.setdefault(self._thread_id, []).append(self)
+
+    def _unregister(self) -> None:
+        with _running_scripts_lock:
+            scripts = _running_scripts.get(self._thread_id, [])
+            if self in scripts:
+                scripts.remove(self)
+            if len(scripts) == 0:
+                _running_scripts.pop(self._thread_id, None)
+
+    def _drain_output(self, process, script_log_path) -> None:
+        # runs in the reader thread: buffered writes to the log and rate-limited echo on the console
+        last_flush = last_echo = time.time()
+        echo_lines: List[str] = []
+        num_skipped = 0
+        with open(script_log_path, 'w+', buffering=2 ** 16) as script_log_file:
+            for line in process.stdout:
                 script_log_file.write(line)
+                now = time.time()
+                if now - last_flush > self._flush_interval:
+                    script_log_file.flush()
+                    last_flush = now
                 if self._verbose:  # Print onto console depending on the verbose property passed on from the sorter class
-                    print(line)
+                    if len(echo_lines) < self._max_echo_lines:
+                        echo_lines.append(line.rstrip('\n'))
+                    else:
+                        num_skipped += 1
+                    if now - last_echo > self._echo_interval:
+                        self._echo(echo_lines, num_skipped)
+                        echo_lines, num_skipped = [], 0
+                        last_echo = now
+        if self._verbose:
+            self._echo(echo_lines, num_skipped)
+
+    @staticmethod
+    def _echo(lines: List[str], num_skipped: int) -> None:
+        if len(lines) > 0:
+            print('\n'.join(lines))
+        if num_skipped > 0:
+            print('[... {} lines not shown, see the log file]'.format(num_skipped))
+
+    def _join_reader(self, timeout=None) -> None:
+        if self._reader_thread is not None and self._reader_thread is not threading.current_thread():
+            self._reader_thread.join(timeout=timeout)
 
     def wait(self, timeout=None) -> Optional[int]:
         if not self.isRunning():
+            if self._process is not None:
+                self._join_reader()
+                self._unregister()
             return self.returnCode()
         assert self._process is not None, "Unexpected self._process is None even though it is running."
-        try:
-            retcode = self._process.wait(timeout=timeout)
-            return retcode
-        except:
-            return None
+        # in a sorter run, the script is stopped when the run is cancelled or times out (see cancellation.py)
+        cancel_token = get_cancel_token()
+        t0 = time.time()
+        while True:
+            poll_timeout = timeout
+            if cancel_token is not None:
+                poll_timeout = self._cancel_poll_interval if timeout is None else \
+                    min(self._cancel_poll_interval, max(timeout - (time.time() - t0), 0))
+            try:
+                retcode = self._process.wait(timeout=poll_timeout)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_token is not None and cancel_token.is_cancelled():
+                    self.stop()
+                    cancel_token.check()
+                if timeout is not None and time.time() - t0 >= timeout:
+                    return None
+            except KeyboardInterrupt:
+                # Ctrl+C does not reach the process group of the script
+                self.stop()
+                raise
+            except:
+                return None
+        # the log is complete once the output is drained
+        self._join_reader()
+        self._unregister()
+        return retcode
 
     def cleanup(self) -> None:
         if self._keep_temp_files:
@@ -101,44 +322,83 @@ class ShellScript():
         for dirpath in self._dirs_to_remove:
             _rmdir_with_retries(str(dirpath), num_retries=5)
 
-    def stop(self) -> None:
-        if not self.isRunning():
-            return
-        assert self._process is not None, "Unexpected self._process is None even though it is running."
+    def stop(self, grace_periods: Optional[Sequence[Optional[float]]] = None) -> bool:
+        """
+        Stops the script and its whole process tree.
 
-        signals = [signal.SIGINT] * 10 + [signal.SIGTERM] * 10 + [signal.SIGKILL] * 10
+        Parameters
+        ----------
+        grace_periods: list or None
+            The time in s given to the tree to exit after SIGINT, SIGTERM and SIGKILL (None skips the signal),
+            'stop_grace_periods' if None
+
+        Returns
+        -------
+        stopped: bool
+            True if all the processes have exited
+        """
+        if self._process is None:
+            return True
+        if grace_periods is None:
+            grace_periods = self._stop_grace_periods
+        if ON_WINDOWS:
+            stopped = self._stop_windows(grace_periods)
+        else:
+            stopped = stop_process_group(self._process.pid, grace_periods, poll_leader=self._process.poll)
+        if not stopped:
+            print('WARNING: unable to stop the processes of shell script {}'.format(self._script_path))
+        if not self.isRunning():
+            self._join_reader(timeout=1)
+            self._unregister()
+        return stopped
 
-        for signal0 in signals:
-            self._process.send_signal(signal0)
+    def _stop_windows(self, grace_periods) -> bool:
+        # the tree of a windows process is only known to taskkill: the leader is the only one waited for
+        assert self._process is not None
+        pid = str(self._process.pid)
+        stages = [lambda: self._process.send_signal(signal.CTRL_BREAK_EVENT),
+                  lambda: subprocess.run(['taskkill', '/T', '/PID', pid], capture_output=True),
+                  lambda: subprocess.run(['taskkill', '/F', '/T', '/PID', pid], capture_output=True)]
+        for stage, grace_period in zip(stages, grace_periods):
+            if grace_period is None:
+                continue
+            if not self.isRunning():
+                return True
             try:
-                self._process.wait(timeout=0.02)
-                return
-            except:
+                stage()
+                self._process.wait(timeout=grace_period)
+                return True
+            except (OSError, subprocess.TimeoutExpired):
                 pass
+        return not self.isRunning()
 
     def kill(self) -> None:
-        if not self.isRunning():
-            return
-
-        assert self._process is not None, "Unexpected self._process is None even though it is running."
-        self._process.send_signal(signal.SIGKILL)
-        try:
-            self._process.wait(timeout=1)
-        except:
+        if not self.stop(grace_periods=(None, None, 1.)):
             print('WARNING: unable to kill shell script.')
-            pass
 
     def stopWithSignal(self, sig, timeout) -> bool:
-        if not self.isRunning():
+        if not self.isTreeRunning():
             return True
 
         assert self._process is not None, "Unexpected self._process is None even though it is running."
-        self._process.send_signal(sig)
+        if ON_WINDOWS:
+            self._process.send_signal(sig)
+            try:
+                self._process.wait(timeout=timeout)
+                return True
+            except:
+                return False
         try:
-            self._process.wait(timeout=timeout)
+            os.killpg(self._process.pid, sig)
+        except ProcessLookupError:
             return True
-        except:
-            return False
+        t0 = time.time()
+        while self.isRunning() or self._group_exists():
+            if time.time() - t0 > timeout:
+                # the remaining processes may be zombies
+                return not self.isTreeRunning()
+            time.sleep(0.1)
+        return True
 
     def elapsedTimeSinceStart(self) -> Optional[float]:
         if self._start_time is None:
@@ -154,6 +414,20 @@ class ShellScript():
             return True
         return False
 
+    def _group_exists(self) -> bool:
+        return self._process is not None and not ON_WINDOWS and _process_group_exists(self._process.pid)
+
+    def isTreeRunning(self) -> bool:
+        """
+        Returns True while the script or a process it started in its process group is running (only the script
+        on windows).
+        """
+        if self.isRunning():
+            return True
+        if not self._process or ON_WINDOWS:
+            return False
+        return is_process_group_alive(self._process.pid)
+
     def isFinished(self) -> bool:
         if not self._process:
             return False
@@ -181,6 +455,13 @@ class ShellScript():
         return ii
 
 
+@atexit.register
+def _stop_running_scripts():
+    # the scripts run in their own process group: they are not interrupted with the interpreter
+    for script in get_running_shellscripts():
+        script.stop(grace_periods=(None, 1., 1.))
+
+
 def _rmdir_with_retries(dirname, num_retries, delay_between_tries=1):
     for retry_num in range(1, num_retries + 1):
         if not Path(dirname).is_dir():
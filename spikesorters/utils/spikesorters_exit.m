@@ -0,0 +1,8 @@
+function spikesorters_exit(code)
+% Replaces quit(code) in the scripts run by a warm session of the session pool: the session keeps running
+% and reports the exit code (see spikesorters_session_server.m).
+if nargin < 1
+    code = 0;
+end
+error('spikesorters:exit', '%d', code);
+end
@@ -0,0 +1,63 @@
+function spikesorters_session_server(session_folder)
+% Warm MATLAB session of the spikesorters session pool (see spikesorters/matlab_sessions.py).
+%
+% Runs the jobs written by python in session_folder/job.json until a 'quit' job:
+%   {"id": 3, "type": "run", "script": "/path/kilosort2_master_session.m", "folder": "/path", "log": "/path/kilosort2.log"}
+%   {"id": 4, "type": "ping"}
+%   {"id": 5, "type": "quit"}
+% and writes the exit code of each job in session_folder/<id>.done. The path and the current folder are
+% restored after each job, so that the jobs do not see the functions added by the previous ones.
+
+home_path = path;
+home_folder = pwd;
+write_file_atomic(fullfile(session_folder, 'ready'), sprintf('%d', feature('getpid')));
+
+job_file = fullfile(session_folder, 'job.json');
+while true
+    if ~exist(job_file, 'file')
+        pause(0.05);
+        continue;
+    end
+    job = jsondecode(fileread(job_file));
+    delete(job_file);
+    if strcmp(job.type, 'quit')
+        break;
+    end
+    status = 0;
+    if strcmp(job.type, 'run')
+        status = run_job(job);
+        path(home_path);
+        cd(home_folder);
+        close all force;
+    end
+    write_file_atomic(fullfile(session_folder, sprintf('%d.done', job.id)), sprintf('%d', status));
+end
+quit(0);
+end
+
+
+function status = run_job(job)
+% the quit(n) of the sorter scripts are replaced by spikesorters_exit(n), which raises 'spikesorters:exit'
+diary(job.log);
+try
+    cd(job.folder);
+    run(job.script);
+    status = 0;
+catch err
+    if strcmp(err.identifier, 'spikesorters:exit')
+        status = str2double(err.message);
+    else
+        fprintf('%s\n', getReport(err));
+        status = 1;
+    end
+end
+diary off;
+end
+
+
+function write_file_atomic(file_path, txt)
+fid = fopen([file_path '.tmp'], 'w');
+fprintf(fid, '%s', txt);
+fclose(fid);
+movefile([file_path '.tmp'], file_path);
+end
@@ -3,15 +3,27 @@ import os
 from typing import Union
 import sys
 import copy
-from scipy.io import savemat
+import datetime
+import numpy as np
 
 import spikeextractors as se
 from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
+from ..matlab_sessions import get_matlab_session_pool
 from ..sorter_tools import recover_recording
 
+try:
+    import h5py
+
+    HAVE_H5PY = True
+except ImportError:
+    HAVE_H5PY = False
+
 PathType = Union[str, Path]
 
+_matlab_classes = {'float64': 'double', 'float32': 'single', 'int8': 'int8', 'uint8': 'uint8', 'int16': 'int16',
+                   'uint16': 'uint16', 'int32': 'int32', 'uint32': 'uint32', 'int64': 'int64', 'uint64': 'uint64'}
+
 
 def check_if_installed(waveclus_path: Union[str, None]):
     if waveclus_path is None:
@@ -28,6 +40,100 @@ def check_if_installed(waveclus_path: Union[str, None]):
         return False
 
 
+def _write_mat_header(file_path):
+    # MATLAB 7.3 mat files are HDF5 files with a 128 bytes MATLAB header in the (512 bytes) user block
+    now = datetime.datetime.now().strftime('%a %b %d %H:%M:%S %Y')
+    text = f'MATLAB 7.3 MAT-file, Platform: {sys.platform}, Created on: {now} HDF5 schema 1.00 .'
+    header = text.ljust(116).encode('ascii') + b'\x00' * 8 + b'\x00\x02' + b'IM'
+    with open(file_path, 'r+b') as f:
+        f.write(header)
+
+
+def write_mat_files(recording, output_folder, chunk_mb=500, max_open_files=256, verbose=False):
+    """
+    Writes one MATLAB 7.3 file per channel ('raw1.mat', 'raw2.mat', ...) with the 'data' and 'sr' variables
+    expected by wave_clus.
+
+    The channels are written by batches of at most 'max_open_files' channels (files open at the same time). For
+    each batch, the traces are read once, by chunks of frames across the channels of the batch, and each channel
+    slice is appended to its own file, so that the memory usage is bounded by the chunk size.
+
+    Parameters
+    ----------
+    recording: RecordingExtractor
+        The recording to write
+    output_folder: str or Path
+        The folder where the mat files are written
+    chunk_mb: int
+        Chunk size in Mb
+    max_open_files: int
+        Maximum number of files open at the same time (the number of passes over the traces is
+        num_channels / max_open_files)
+    verbose: bool
+        If True, output is verbose
+
+    Returns
+    -------
+    file_paths: list
+        The paths of the mat files
+    """
+    if not HAVE_H5PY:
+        raise Exception("To use WaveClus, install h5py: pip install h5py")
+    output_folder = Path(output_folder)
+    channel_ids = recording.get_channel_ids()
+    num_channels = len(channel_ids)
+    dtype = np.dtype(recording.get_dtype())
+    if dtype.name not in _matlab_classes:
+        dtype = np.dtype('float64')
+
+    file_paths = [output_folder / ('raw' + str(nch + 1) + '.mat') for nch in range(num_channels)]
+    for batch_start in range(0, num_channels, max_open_files):
+        batch = slice(batch_start, min(batch_start + max_open_files, num_channels))
+        if verbose and num_channels > max_open_files:
+            print(f'Writing channels {batch.start + 1}-{batch.stop}/{num_channels}')
+        _write_mat_batch(recording, channel_ids[batch], file_paths[batch], dtype, chunk_mb, verbose)
+
+    for file_path in file_paths:
+        _write_mat_header(str(file_path))
+
+    return file_paths
+
+
+def _write_mat_batch(recording, channel_ids, file_paths, dtype, chunk_mb, verbose):
+    # one pass over the traces of the channels of the batch, with one open file per channel
+    num_frames = recording.get_num_frames()
+    matlab_class = _matlab_classes[dtype.name].encode('ascii')
+    chunk_size = max(int(chunk_mb * 1e6 // (len(channel_ids) * dtype.itemsize)), 1)
+    files = []
+    try:
+        datasets = []
+        for file_path in file_paths:
+            f = h5py.File(str(file_path), mode='w', userblock_size=512)
+            files.append(f)
+            # a MATLAB 1 x N array is a N x 1 dataset in HDF5 (column major)
+            sr = f.create_dataset('sr', data=np.array([[recording.get_sampling_frequency()]], dtype='float64'))
+            sr.attrs['MATLAB_class'] = np.bytes_(b'double')
+            data = f.create_dataset('data', shape=(0, 1), maxshape=(None, 1), dtype=dtype,
+                                    chunks=(min(chunk_size, 2 ** 20), 1))
+            data.attrs['MATLAB_class'] = np.bytes_(matlab_class)
+            datasets.append(data)
+
+        n_chunk = num_frames // chunk_size + int(num_frames % chunk_size > 0)
+        for i in range(n_chunk):
+            start_frame = i * chunk_size
+            end_frame = min((i + 1) * chunk_size, num_frames)
+            traces = recording.get_traces(channel_ids=channel_ids, start_frame=start_frame,
+                                          end_frame=end_frame).astype(dtype, copy=False)
+            for nch, data in enumerate(datasets):
+                data.resize((end_frame, 1))
+                data[start_frame:end_frame, 0] = traces[nch]
+            if verbose:
+                print(f'Written chunk {i + 1}/{n_chunk}')
+    finally:
+        for f in files:
+            f.close()
+
+
 class WaveClusSorter(BaseSorter):
     """
     """
@@ -35,6 +141,9 @@ class WaveClusSorter(BaseSorter):
     sorter_name: str = 'waveclus'
     waveclus_path: Union[str, None] = os.getenv('WAVECLUS_PATH', None)
     requires_locations = False
+    resource_footprint = {'cores': 1, 'ram_mb_per_channel_hour': 500., 'scratch_mb_per_channel_hour': 250.,
+                          'licenses': {'matlab': 1}}
+    runs_external_process = True
 
     _default_params = {
         'detect_threshold': 5,
@@ -59,7 +168,8 @@ class WaveClusSorter(BaseSorter):
         'stdmax': 50,
         'max_spk': 40000,
         'ref_ms': 1.5,
-        'interpolation': True
+        'interpolation': True,
+        'chunk_mb': 500
     }
 
     _params_description = {
@@ -88,7 +198,8 @@ class WaveClusSorter(BaseSorter):
         'max_spk': "Maximum number of spikes used by the SPC algorithm",
         'ref_ms': "Refractory time in milliseconds, all the threshold crossing inside this period are detected as the "
                   "same spike",
-        'interpolation': "Enable or disable interpolation to improve the alignments of the spikes"
+        'interpolation': "Enable or disable interpolation to improve the alignments of the spikes",
+        'chunk_mb': "Chunk size in Mb for saving the mat files (default 500Mb)"
     }
 
     sorter_description = """Wave Clus combines a wavelet-based feature extraction and paramagnetic clustering with a 
@@ -97,6 +208,7 @@ class WaveClusSorter(BaseSorter):
 
     installation_mesg = """\nTo use WaveClus run:\n
         >>> git clone https://github.com/csn-le/wave_clus
+        >>> pip install h5py
     and provide the installation path by setting the WAVECLUS_PATH
     environment variables or using WaveClusSorter.set_waveclus_path().\n\n
 
@@ -137,16 +249,14 @@ class WaveClusSorter(BaseSorter):
 
         output_folder.mkdir(parents=True, exist_ok=True)
         # Generate mat files in the dataset directory
-        for nch, id in enumerate(recording.get_channel_ids()):
-            vcFile_mat = str(output_folder / ('raw' + str(nch + 1) + '.mat'))
-            savemat(vcFile_mat,
-                    {'data': recording.get_traces(channel_ids=[id]), 'sr': recording.get_sampling_frequency()})
+        write_mat_files(recording, output_folder, chunk_mb=self.params['chunk_mb'], verbose=self.verbose)
 
     def _run(self, recording, output_folder):
         recording = recover_recording(recording)
 
         source_dir = Path(__file__).parent
         p = self.params.copy()
+        del p['chunk_mb']
 
         if recording.is_filtered and (p['enable_detect_filter'] or p['enable_sort_filter']):
             print("Warning! The recording is already filtered, but Wave-Clus filters are enabled. You can disable "
@@ -220,23 +330,28 @@ class WaveClusSorter(BaseSorter):
         matlab_cmd = ShellScript(cmd, script_path=str(tmpdir / 'run_waveclus.m'), keep_temp_files=True)
         matlab_cmd.write()
 
-        if 'win' in sys.platform and sys.platform != 'darwin':
-            shell_cmd = '''
-                {disk_move}
-                cd {tmpdir}
-                matlab -nosplash -wait -log -r run_waveclus
-            '''.format(disk_move=str(tmpdir)[:2], tmpdir=tmpdir)
+        matlab_pool = get_matlab_session_pool()
+        if matlab_pool is not None:
+            retcode = matlab_pool.run_script(tmpdir / 'run_waveclus.m',
+                                             log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
         else:
-            shell_cmd = '''
-                #!/bin/bash
-                cd "{tmpdir}"
-                matlab -nosplash -nodisplay -log -r run_waveclus
-            '''.format(tmpdir=tmpdir)
-        shell_cmd = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
-                                log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
-        shell_cmd.start()
-
-        retcode = shell_cmd.wait()
+            if 'win' in sys.platform and sys.platform != 'darwin':
+                shell_cmd = '''
+                    {disk_move}
+                    cd {tmpdir}
+                    matlab -nosplash -wait -log -r run_waveclus
+                '''.format(disk_move=str(tmpdir)[:2], tmpdir=tmpdir)
+            else:
+                shell_cmd = '''
+                    #!/bin/bash
+                    cd "{tmpdir}"
+                    matlab -nosplash -nodisplay -log -r run_waveclus
+                '''.format(tmpdir=tmpdir)
+            shell_cmd = ShellScript(shell_cmd, script_path=output_folder / f'run_{self.sorter_name}',
+                                    log_path=output_folder / f'{self.sorter_name}.log', verbose=self.verbose)
+            shell_cmd.start()
+
+            retcode = shell_cmd.wait()
 
         if retcode != 0:
             raise Exception('waveclus returned a non-zero exit code')
@@ -8,15 +8,12 @@ import sys
 import spikeextractors as se
 from ..basesorter import BaseSorter
 from ..utils.shellscript import ShellScript
-from ..sorter_tools import recover_recording
+from ..sorter_tools import recover_recording, get_recording_size_mb
 
 try:
     import yaml
-    import yass
-
-    HAVE_YASS = True
 except ImportError:
-    HAVE_YASS = False
+    yaml = None
 
 
 class YassSorter(BaseSorter):
@@ -25,6 +22,8 @@ class YassSorter(BaseSorter):
 
     sorter_name = 'yass'
     requires_locations = False
+    resource_footprint = {'cores': 'n_processors', 'licenses': {}}
+    runs_external_process = True
 
     # #################################################
 
@@ -146,12 +145,28 @@ class YassSorter(BaseSorter):
 
     @classmethod
     def is_installed(cls):
+        try:
+            import yaml
+            import yass
+            HAVE_YASS = True
+        except ImportError:
+            HAVE_YASS = False
         return HAVE_YASS
 
     @staticmethod
     def get_sorter_version():
+        import yass
         return yass.__version__
 
+    @classmethod
+    def _estimate_resources(cls, recording, params):
+        # int16 copy of the traces and the standardized float32 copy of yass,
+        # each processor works on chunks of n_sec_chunk seconds
+        chunk_mb = params['n_sec_chunk'] * recording.get_sampling_frequency() * recording.get_num_channels() * 4 / 1e6
+        return {'scratch_mb': get_recording_size_mb(recording, params['dtype']) +
+                get_recording_size_mb(recording, 'float32'),
+                'ram_mb': 1000. + 4 * chunk_mb * max(int(params['n_processors']), 1)}
+
     def _setup_recording(self, recording, output_folder):
         p = self.params
 
@@ -181,11 +196,10 @@ class YassSorter(BaseSorter):
         #################### SAVE RAW INT16 data ########################
         #################################################################
         input_file_path = os.path.join(output_folder, 'data.bin')
-        recording.write_to_binary_dat_format(input_file_path,
-                                             dtype='int16',  # HARD CODE THIS FOR YASS
-                                             chunk_mb=p["chunk_mb"],
-                                             n_jobs=p["n_jobs_bin"],
-                                             verbose=self.verbose)
+        self._write_binary_recording(recording, input_file_path,
+                                     dtype='int16',  # HARD CODE THIS FOR YASS
+                                     chunk_mb=p["chunk_mb"],
+                                     n_jobs=p["n_jobs_bin"])
 
         retrain = False
         if self.params['neural_nets_path'] is None: